@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+线性化输出的首页显示耗时测试
+
+在本地启动一个支持HTTP范围请求（Range）的文件服务器，按设定的带宽和每次请求的延迟限速，
+模拟文档门户。客户端按支持快速Web查看的阅读器的方式加载文档:
+先请求文件开头的1KB，发现线性化参数字典时只再请求到第一页结束位置（/E）为止的字节；
+否则只能下载整个文件才能显示第一页。分别测试普通输出和线性化输出（--linearize）的
+首页耗时、请求次数和下载字节数。
+
+示例:
+    python benchmarks/first_page.py
+    python benchmarks/first_page.py --input big.pdf --bandwidth 5 --latency 80
+    python benchmarks/first_page.py --json first_page.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import statistics
+import urllib.request
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 第一次请求的字节数，线性化参数字典必须在文件开头的1KB内
+PROBE_SIZE = 1024
+
+# 服务器每次写出的块大小，按块限速
+CHUNK_SIZE = 64 * 1024
+
+_LINEARIZED = re.compile(rb"<<\s*/Linearized\s+1(.*?)>>", re.S)
+
+class ThrottledRangeHandler(SimpleHTTPRequestHandler):
+    """支持单个Range的静态文件处理器，按服务器的bandwidth和latency限速"""
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        time.sleep(self.server.latency)
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(CHUNK_SIZE, remaining))
+                self.wfile.write(data)
+                remaining -= len(data)
+                time.sleep(len(data) / self.server.bandwidth)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(directory, bandwidth_mb, latency_ms):
+    """在后台线程中启动服务器，返回 (server, 根URL)"""
+    handler = lambda *args, **kwargs: ThrottledRangeHandler(*args, directory=directory, **kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.bandwidth = bandwidth_mb * 1024 * 1024
+    server.latency = latency_ms / 1000
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+def _fetch(url, start=None, end=None):
+    request = urllib.request.Request(url)
+    if start is not None:
+        request.add_header("Range", f"bytes={start}-{'' if end is None else end}")
+    with urllib.request.urlopen(request) as response:
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        return response.read(), int(total) if total else None
+
+def load_first_page(url):
+    """
+    按快速Web查看的方式加载到可以显示第一页为止，返回 (请求次数, 下载字节数, 是否线性化)
+    """
+    head, total = _fetch(url, 0, PROBE_SIZE - 1)
+    match = _LINEARIZED.search(head)
+    params = {}
+    if match:
+        params = {name.decode(): int(value) for name, value in re.findall(rb"/([LEO])\s+(\d+)", match.group(1))}
+    # /L与文件长度不一致说明文件在线性化之后被修改过（如增量更新），阅读器不再信任这些提示
+    if not match or params.get("L") != total:
+        data, _ = _fetch(url)
+        return 2, len(head) + len(data), False
+    data = head
+    if params["E"] > len(head):
+        rest, _ = _fetch(url, len(head), params["E"] - 1)
+        data += rest
+    if f"{params['O']} 0 obj".encode() not in data:
+        raise ValueError("第一页的页面对象不在 /E 之前")
+    return 2 if params["E"] > len(head) else 1, len(data), True
+
+def load_full(url):
+    """下载整个文件，返回下载字节数"""
+    data, _ = _fetch(url)
+    return len(data)
+
+def make_input(path, pages, seed=1234):
+    """生成以图片为主的测试文档（与make_corpus.py中的扫描件相同）"""
+    from make_corpus import _scan_pdf
+    _scan_pdf(path, random.Random(seed), pages)
+
+def measure(url, repeat):
+    first, full = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        requests, fetched, linearized = load_first_page(url)
+        first.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        load_full(url)
+        full.append(time.perf_counter() - start)
+    return {
+        "linearized": linearized,
+        "requests": requests,
+        "first_page_bytes": fetched,
+        "first_page_ms": statistics.median(first) * 1000,
+        "full_download_ms": statistics.median(full) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='线性化输出的首页显示耗时测试')
+    parser.add_argument('--input', help='输入PDF文件；不指定时生成以图片为主的测试文档')
+    parser.add_argument('--pages', type=int, default=100, help='生成测试文档的页数')
+    parser.add_argument('--text', default='CONFIDENTIAL', help='水印文字')
+    parser.add_argument('--bandwidth', type=float, default=10.0, help='模拟的下载带宽 (MB/s)')
+    parser.add_argument('--latency', type=float, default=40.0, help='模拟的每次请求延迟 (ms)')
+    parser.add_argument('--repeat', type=int, default=3, help='每个文件的测试次数（取中位数）')
+    parser.add_argument('--json', help='结果输出的JSON文件')
+    args = parser.parse_args()
+
+    from pdf_watermark import add_text_watermark
+
+    with tempfile.TemporaryDirectory() as workdir:
+        input_pdf = args.input
+        if input_pdf is None:
+            input_pdf = os.path.join(workdir, "input.pdf")
+            print(f"正在生成 {args.pages} 页的测试文档...")
+            make_input(input_pdf, args.pages)
+        outputs = {"plain": False, "linearized": True}
+        for name, linearize in outputs.items():
+            start = time.perf_counter()
+            add_text_watermark(input_pdf, os.path.join(workdir, f"{name}.pdf"), args.text, linearize=linearize)
+            print(f"{name}: 添加水印 {time.perf_counter() - start:.2f} 秒")
+
+        server, base_url = start_server(workdir, args.bandwidth, args.latency)
+        results = []
+        try:
+            print(f"\n带宽 {args.bandwidth} MB/s, 每次请求延迟 {args.latency} ms")
+            print(f"{'输出':<12} {'文件字节':>12} {'请求':>5} {'首页字节':>12} {'首页ms':>10} {'全文下载ms':>12}")
+            for name in outputs:
+                result = {"output": name, "size": os.path.getsize(os.path.join(workdir, f"{name}.pdf")),
+                          **measure(base_url + f"{name}.pdf", args.repeat)}
+                results.append(result)
+                print(f"{name:<12} {result['size']:>12} {result['requests']:>5} {result['first_page_bytes']:>12} "
+                      f"{result['first_page_ms']:>10.1f} {result['full_download_ms']:>12.1f}")
+        finally:
+            server.shutdown()
+
+    if args.json:
+        report = {
+            "meta": {"input": args.input, "pages": None if args.input else args.pages,
+                     "bandwidth_mb": args.bandwidth, "latency_ms": args.latency, "repeat": args.repeat,
+                     "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+            "results": results,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+命令行入口的启动耗时测试
+
+每个场景在新的子进程中重复运行，记录墙钟时间的中位数和最小值，并用 -X importtime
+检查是否导入了PyPDF2、reportlab和Pillow等较重的依赖。结果可以保存为JSON并与之前的结果对比。
+
+示例:
+    python benchmarks/import_time.py --repeat 20
+    python benchmarks/import_time.py --json startup.json
+    python benchmarks/import_time.py --compare startup.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CLI = os.path.join(ROOT, "pdf_watermark.py")
+BATCH = os.path.join(ROOT, "pdf_watermark_batch.py")
+
+# 检查是否被导入的依赖
+HEAVY_MODULES = ("PyPDF2", "reportlab", "PIL")
+
+# 场景名 -> 命令行参数（不含Python解释器）
+SCENARIOS = {
+    "python": ["-c", "pass"],
+    "cli_help": [CLI, "--help"],
+    "cli_bad_args": [CLI, "--input", "missing.pdf"],
+    "batch_help": [BATCH, "--help"],
+    "import_cli": ["-c", "import pdf_watermark_cli"],
+    "import_batch": ["-c", "import pdf_watermark_batch"],
+    "import_library": ["-c", "import pdf_watermark"],
+}
+
+def _run(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def _loaded_modules(args):
+    """用 -X importtime 运行一次，返回导入了的较重依赖"""
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    loaded = set()
+    for line in result.stderr.splitlines():
+        name = line.rsplit("|", 1)[-1].strip()
+        top = name.split(".", 1)[0]
+        if top in HEAVY_MODULES:
+            loaded.add(top)
+    return sorted(loaded)
+
+def run_scenario(name, repeat):
+    args = SCENARIOS[name]
+    # 第一次运行预热文件系统缓存和字节码缓存，不计入结果
+    _run(args)
+    times = [_run(args) for _ in range(repeat)]
+    return {
+        "scenario": name,
+        "median_ms": statistics.median(times) * 1000,
+        "min_ms": min(times) * 1000,
+        "repeat": repeat,
+        "loaded": _loaded_modules(args),
+    }
+
+def compare(results, baseline):
+    """打印与之前结果的对比（中位数耗时的比值，<1表示本次更快）"""
+    previous = {r["scenario"]: r for r in baseline["results"]}
+    print(f"\n与 {baseline['meta'].get('revision')} 对比:")
+    for result in results:
+        old = previous.get(result["scenario"])
+        if old:
+            print(f"{result['scenario']:<16} {old['median_ms']:>8.1f} -> {result['median_ms']:>8.1f} ms"
+                  f"  x{result['median_ms'] / old['median_ms']:.2f}")
+
+def _revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='命令行入口的启动耗时测试')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), help='只运行指定的场景')
+    parser.add_argument('--repeat', type=int, default=10, help='每个场景的运行次数')
+    parser.add_argument('--json', help='结果输出的JSON文件')
+    parser.add_argument('--compare', help='用于对比的之前的JSON结果')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'场景':<14} {'中位数ms':>10} {'最小ms':>10}  导入的依赖")
+    for name in args.scenarios or SCENARIOS:
+        result = run_scenario(name, args.repeat)
+        results.append(result)
+        print(f"{name:<16} {result['median_ms']:>10.1f} {result['min_ms']:>10.1f}  "
+              f"{', '.join(result['loaded']) or '-'}")
+
+    report = {
+        "meta": {"revision": _revision(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "python": sys.version.split()[0]},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.json}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+生成用于性能测试的合成PDF语料
+
+同样的参数和随机种子总是生成同样的文件。语料目录结构:
+    small/   大量小文件（1-5页）
+    huge/    少量大文件
+    mixed/   混合页面尺寸和旋转
+    scans/   图片为主的扫描件
+    cjk/     中文文字页面（需要系统中有中文字体）
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A3, A4, A5, letter, legal, landscape
+from reportlab.lib.utils import ImageReader
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pdf_watermark_fonts import register_font
+
+PAGE_SIZES = [A4, letter, A3, A5, legal, landscape(A4), landscape(letter)]
+
+# 常见的中文字体位置，第一个存在的用于cjk语料
+CJK_FONT_CANDIDATES = [
+    os.path.join(os.environ.get('SystemRoot', 'C:\\Windows'), 'Fonts', 'simhei.ttf'),
+    os.path.join(os.environ.get('SystemRoot', 'C:\\Windows'), 'Fonts', 'msyh.ttc'),
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/arphic/uming.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+]
+
+CJK_TEXT = "本合同由甲乙双方在平等自愿的基础上协商一致签订，双方应当遵守以下条款。"
+
+def find_cjk_font():
+    """返回第一个存在的中文字体路径，找不到时返回None"""
+    for path in CJK_FONT_CANDIDATES:
+        if os.path.exists(path):
+            return path
+    return None
+
+def _text_pdf(path, rng, pages, sizes=(A4,), rotate=False, font_name="Helvetica", text=None):
+    c = canvas.Canvas(path)
+    for i in range(pages):
+        size = rng.choice(sizes)
+        c.setPageSize(size)
+        c.setFont(font_name, 11)
+        y = size[1] - 72
+        while y > 72:
+            line = text or " ".join(rng.choice(("lorem", "ipsum", "dolor", "sit", "amet", "contract"))
+                                    for _ in range(12))
+            c.drawString(72, y, line)
+            y -= 14
+        c.drawString(72, 40, f"Page {i + 1}")
+        c.showPage()
+    c.save()
+    if rotate:
+        _rotate_some_pages(path, rng)
+
+def _rotate_some_pages(path, rng):
+    from PyPDF2 import PdfReader, PdfWriter
+    reader = PdfReader(path)
+    writer = PdfWriter()
+    for page in reader.pages:
+        out = writer.add_page(page)
+        angle = rng.choice((0, 0, 90, 180, 270))
+        if angle:
+            out.rotate(angle)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+def _scan_pdf(path, rng, pages, image_size=1000):
+    c = canvas.Canvas(path)
+    for _ in range(pages):
+        # 随机灰度噪声，压缩效果接近真实扫描件
+        data = bytes(rng.getrandbits(8) for _ in range(image_size * image_size // 16))
+        image = Image.frombytes('L', (image_size // 4, image_size // 4), data).resize((image_size, image_size))
+        c.drawImage(ImageReader(image), 0, 0, A4[0], A4[1])
+        c.showPage()
+    c.save()
+
+def make_corpus(output_dir, scale=1.0, seed=1234):
+    """
+    生成语料并返回清单 {类别: [文件路径, ...]}
+
+    参数:
+    output_dir: 语料目录
+    scale: 文件数量和页数的缩放比例
+    seed: 随机种子
+    """
+    rng = random.Random(seed)
+    n = lambda count: max(1, int(count * scale))
+    manifest = {}
+
+    def target(kind, name):
+        directory = os.path.join(output_dir, kind)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name)
+        manifest.setdefault(kind, []).append(path)
+        return path
+
+    for i in range(n(200)):
+        _text_pdf(target("small", f"small_{i:05d}.pdf"), rng, rng.randint(1, 5))
+    for i in range(n(2)):
+        _text_pdf(target("huge", f"huge_{i:02d}.pdf"), rng, n(2000))
+    for i in range(n(10)):
+        _text_pdf(target("mixed", f"mixed_{i:03d}.pdf"), rng, n(50), sizes=PAGE_SIZES, rotate=True)
+    for i in range(n(4)):
+        _scan_pdf(target("scans", f"scan_{i:02d}.pdf"), rng, n(40))
+
+    font_path = find_cjk_font()
+    if font_path:
+        font_name = register_font(font_path)
+        for i in range(n(10)):
+            _text_pdf(target("cjk", f"cjk_{i:03d}.pdf"), rng, n(20), font_name=font_name, text=CJK_TEXT)
+    manifest["cjk_font"] = font_path
+
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"scale": scale, "seed": seed, "files": manifest}, f, ensure_ascii=False, indent=2)
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description='生成性能测试用的合成PDF语料')
+    parser.add_argument('--output', default='bench_corpus', help='语料目录')
+    parser.add_argument('--scale', type=float, default=1.0, help='文件数量和页数的缩放比例')
+    parser.add_argument('--seed', type=int, default=1234, help='随机种子')
+    args = parser.parse_args()
+
+    manifest = make_corpus(args.output, args.scale, args.seed)
+    for kind, files in manifest.items():
+        if isinstance(files, list):
+            print(f"{kind}: {len(files)} 个文件")
+    if not manifest.get("cjk_font"):
+        print("未找到中文字体，跳过cjk语料")
+
+if __name__ == "__main__":
+    main()
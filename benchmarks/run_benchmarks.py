@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+水印工具的性能测试
+
+每个场景在独立的子进程中运行命令行工具，记录页/秒、文件/秒、峰值内存（RSS）
+和输出文件相对输入的体积增长，结果可以保存为JSON并与之前的结果对比。
+
+示例:
+    python benchmarks/make_corpus.py --output bench_corpus --scale 0.5
+    python benchmarks/run_benchmarks.py --corpus bench_corpus --json results.json
+    python benchmarks/run_benchmarks.py --corpus bench_corpus --compare results.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CLI = os.path.join(ROOT, "pdf_watermark.py")
+BATCH = os.path.join(ROOT, "pdf_watermark_batch.py")
+TEXT = "CONFIDENTIAL"
+
+def _cli(input_pdf, output_pdf, *options, text=TEXT):
+    return [sys.executable, CLI, "--input", input_pdf, "--output", output_pdf, "--text", text, *options]
+
+def _batch(input_dir, output_dir, *options, text=TEXT):
+    return [sys.executable, BATCH, "--input", input_dir, "--output", output_dir, "--text", text, *options]
+
+def _per_file(kind, *options):
+    """对某类语料中的每个文件分别调用一次命令行工具"""
+    def commands(corpus, out):
+        return [_cli(path, os.path.join(out, os.path.basename(path)), *options) for path in corpus[kind]]
+    return kind, commands
+
+def _personalized(corpus, out, recipients=50):
+    path = os.path.join(out, "recipients.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("name\n" + "".join(f"user{i:04d}\n" for i in range(recipients)))
+    source = corpus["mixed"][0]
+    return [_cli(source, os.path.join(out, "{name}.pdf"), "--recipients", path, text="{name} {date}")]
+
+def _personalized_inputs(corpus, recipients=50):
+    return [corpus["mixed"][0]] * recipients
+
+def _cjk_batch(corpus, out):
+    return [_batch(os.path.dirname(corpus["cjk"][0]), out, "--font", corpus["cjk_font"], text="内部资料 请勿外传")]
+
+# 场景名 -> (输入语料类别或函数, 生成命令列表的函数)
+SCENARIOS = {
+    "render": (None, lambda corpus, out: [[sys.executable, __file__, "--render", "200", "--workdir", out]]),
+    "cli_xobject": _per_file("huge", "--mode", "xobject"),
+    "cli_merge": _per_file("mixed", "--mode", "merge"),
+    "cli_scans": _per_file("scans"),
+    "cli_streaming": _per_file("huge", "--streaming", "--max-memory", "64"),
+    "cli_incremental": _per_file("huge", "--incremental"),
+    "cli_parallel": _per_file("huge", "--jobs", "2", "--parallel-min-pages", "1"),
+    "cli_personalized": (_personalized_inputs, _personalized),
+    "batch_thread": ("small", lambda corpus, out: [
+        _batch(os.path.dirname(corpus["small"][0]), out, "--threads", "4")]),
+    "batch_process": ("small", lambda corpus, out: [
+        _batch(os.path.dirname(corpus["small"][0]), out, "--executor", "process", "--workers", "2")]),
+    "batch_pipeline": ("small", lambda corpus, out: [
+        _batch(os.path.dirname(corpus["small"][0]), out, "--executor", "pipeline", "--workers", "4")]),
+    "batch_cjk": ("cjk", _cjk_batch),
+}
+
+def _render(count, workdir):
+    """只测试水印渲染: 不同尺寸的页面各渲染一次（绕过模板缓存）"""
+    from pdf_watermark import create_watermark
+    for i in range(count):
+        create_watermark(TEXT, page_size=(595 + i, 842))
+
+def _page_count(path, cache):
+    if path not in cache:
+        from PyPDF2 import PdfReader
+        with open(path, "rb") as f:
+            cache[path] = len(PdfReader(f).pages)
+    return cache[path]
+
+def _run(command):
+    """
+    运行一个命令并返回其峰值RSS (MB)
+
+    os.wait4返回的资源统计包含子进程等待过的后代进程，
+    因此进程池场景记录的是最大的单个进程；不支持wait4的平台返回None
+    """
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if not hasattr(os, "wait4"):
+        _, stderr = process.communicate()
+        peak = None
+    else:
+        stderr = process.stderr.read()
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        process.stderr.close()
+        # Linux上ru_maxrss的单位是KB，macOS上是字节
+        peak = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    if process.returncode != 0:
+        raise RuntimeError(f"命令失败 ({process.returncode}): {' '.join(command)}\n{stderr.decode(errors='replace')}")
+    return peak
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files if name.endswith(".pdf"))
+    return total
+
+def run_scenario(name, corpus, repeat=1, page_cache=None):
+    """
+    运行一个场景，返回结果字典；缺少所需语料时返回None
+
+    重复多次时取最短耗时和最大峰值内存
+
+    参数:
+    name: 场景名（见SCENARIOS）
+    corpus: make_corpus生成的清单
+    repeat: 重复次数
+    page_cache: 文件路径 -> 页数的缓存
+    """
+    inputs, make_commands = SCENARIOS[name]
+    if callable(inputs):
+        if not corpus.get("mixed"):
+            return None
+        input_files = inputs(corpus)
+    elif inputs is not None:
+        if not corpus.get(inputs):
+            return None
+        input_files = corpus[inputs]
+    else:
+        input_files = []
+
+    page_cache = {} if page_cache is None else page_cache
+    pages = sum(_page_count(path, page_cache) for path in input_files) if input_files else 200
+    input_bytes = sum(os.path.getsize(path) for path in input_files)
+
+    best, peak, output_bytes = None, None, 0
+    for _ in range(repeat):
+        out = tempfile.mkdtemp(prefix=f"wm_bench_{name}_")
+        try:
+            commands = make_commands(corpus, out)
+            start = time.perf_counter()
+            peaks = [_run(command) for command in commands]
+            elapsed = time.perf_counter() - start
+            output_bytes = _dir_size(out)
+        finally:
+            shutil.rmtree(out, ignore_errors=True)
+        best = elapsed if best is None else min(best, elapsed)
+        if None not in peaks:
+            peak = max([peak or 0] + peaks)
+
+    files = len(input_files) or pages
+    return {
+        "scenario": name,
+        "files": files,
+        "pages": pages,
+        "seconds": round(best, 4),
+        "pages_per_sec": round(pages / best, 2),
+        "files_per_sec": round(files / best, 2),
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "size_growth": round(output_bytes / input_bytes, 4) if input_bytes else None,
+    }
+
+def _metadata(manifest):
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                  capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        revision = None
+    versions = {}
+    for module in ("PyPDF2", "reportlab", "PIL"):
+        try:
+            versions[module] = __import__(module).__version__
+        except (ImportError, AttributeError):
+            versions[module] = None
+    return {
+        "revision": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+        "corpus_scale": manifest.get("scale"),
+        "corpus_seed": manifest.get("seed"),
+    }
+
+def compare(results, baseline):
+    """打印与之前结果的对比（速度和内存的比值，>1表示本次更大）"""
+    previous = {r["scenario"]: r for r in baseline["results"]}
+    print(f"\n与 {baseline['meta'].get('revision')} 对比:")
+    for result in results:
+        old = previous.get(result["scenario"])
+        if not old:
+            continue
+        speed = result["pages_per_sec"] / old["pages_per_sec"]
+        line = f"{result['scenario']:<18} 速度 x{speed:.2f}"
+        if result["peak_rss_mb"] and old.get("peak_rss_mb"):
+            line += f"  内存 x{result['peak_rss_mb'] / old['peak_rss_mb']:.2f}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='水印工具性能测试')
+    parser.add_argument('--corpus', default='bench_corpus', help='make_corpus.py生成的语料目录')
+    parser.add_argument('--generate', action='store_true', help='语料目录不存在时先生成语料')
+    parser.add_argument('--scale', type=float, default=1.0, help='生成语料时的缩放比例')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), help='只运行指定的场景')
+    parser.add_argument('--repeat', type=int, default=1, help='每个场景的重复次数')
+    parser.add_argument('--json', help='结果输出的JSON文件')
+    parser.add_argument('--compare', help='用于对比的之前的JSON结果')
+    parser.add_argument('--render', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.render:
+        _render(args.render, args.workdir)
+        return
+
+    manifest_path = os.path.join(args.corpus, "manifest.json")
+    if not os.path.exists(manifest_path):
+        if not args.generate:
+            parser.error(f"未找到语料: {args.corpus}（先运行make_corpus.py或使用--generate）")
+        from make_corpus import make_corpus
+        make_corpus(args.corpus, args.scale)
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    corpus = manifest["files"]
+
+    results = []
+    page_cache = {}
+    print(f"{'场景':<16} {'页/秒':>10} {'文件/秒':>10} {'峰值MB':>8} {'体积增长':>8}")
+    for name in args.scenarios or SCENARIOS:
+        result = run_scenario(name, corpus, args.repeat, page_cache)
+        if result is None:
+            print(f"{name:<18} 跳过（缺少语料）")
+            continue
+        results.append(result)
+        peak = f"{result['peak_rss_mb']:.1f}" if result["peak_rss_mb"] is not None else "-"
+        growth = f"{result['size_growth']:.3f}" if result["size_growth"] is not None else "-"
+        print(f"{name:<18} {result['pages_per_sec']:>10.1f} {result['files_per_sec']:>10.2f} "
+              f"{peak:>8} {growth:>8}")
+
+    report = {"meta": _metadata(manifest), "results": results}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.json}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
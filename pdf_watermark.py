@@ -2,43 +2,36 @@
 # -*- coding: utf-8 -*-
 
 import os
-import argparse
-from PyPDF2 import PdfReader, PdfWriter
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+import sys
+
+# 作为脚本运行时先交给轻量的命令行入口：--help和参数错误不需要导入PyPDF2和reportlab，
+# 处理时再以普通模块的方式导入本文件
+if __name__ == "__main__":
+    from pdf_watermark_cli import main
+    sys.exit(main())
+
+import math
+import csv
+import json
+import datetime
+import shutil
 import tempfile
+import threading
+from contextlib import contextmanager
+from PyPDF2 import PdfReader, PdfWriter, PageObject, Transformation
+from PyPDF2.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject,
+                            IndirectObject, NameObject, NumberObject)
+from pdf_watermark_fonts import register_font
+from pdf_watermark_images import image_digest, image_placement, load_image, opacity_state, template_size
+import pdf_watermark_metrics as metrics
+from pdf_watermark_options import LAYOUTS, PARALLEL_MIN_PAGES, STAMP_MODES
+from pdf_watermark_writer import (IncrementalPdfWriter, PersonalizedPdfWriter, PositionTrackingStream,
+                                  RangePdfWriter, StitchedPdfWriter, StreamingPdfWriter, current_rss_mb,
+                                  load_page)
 import io
 
-def create_watermark(text, output_path=None, font_path=None, font_size=40, opacity=0.5, angle=45, color=(0, 0, 0)):
-    """
-    创建水印PDF
-    
-    参数:
-    text: 水印文本
-    output_path: 输出路径，如果为None则返回内存中的PDF
-    font_path: 字体路径，如果为None则使用默认字体
-    font_size: 字体大小
-    opacity: 透明度 (0-1)
-    angle: 旋转角度
-    color: RGB颜色元组 (0-255, 0-255, 0-255)
-    """
-    # 注册字体（如果提供了字体路径）
-    font_name = "custom_font"
-    if font_path and os.path.exists(font_path):
-        pdfmetrics.registerFont(TTFont(font_name, font_path))
-    else:
-        # 使用默认字体
-        font_name = "Helvetica"
-    
-    # 创建内存缓冲区或文件
-    if output_path:
-        c = canvas.Canvas(output_path)
-    else:
-        buffer = io.BytesIO()
-        c = canvas.Canvas(buffer)
-    
+def _draw_watermark(c, text, font_name, font_size, opacity, angle, color, baseline=0):
+    """在画布当前页的中心绘制水印文字（baseline为文字基线相对中心的偏移）"""
     # 设置颜色和透明度
     r, g, b = [x/255 for x in color]
     c.setFillColorRGB(r, g, b, alpha=opacity)
@@ -60,91 +53,877 @@ def create_watermark(text, output_path=None, font_path=None, font_size=40, opaci
     c.rotate(angle)
     
     # 绘制文本
-    c.drawCentredString(0, 0, text)
+    c.drawCentredString(0, baseline, text)
     
     # 恢复状态
     c.restoreState()
+
+def create_watermark(text, output_path=None, font_path=None, font_size=40, opacity=0.5, angle=45, color=(0, 0, 0),
+                     page_size=None, font_index=0, layout="center", tile_spacing=None, image_path=None,
+                     image_scale=0.5, image_angle=0):
+    """
+    创建水印PDF
     
-    # 保存PDF
+    参数:
+    text: 水印文本，只使用图片水印时可以为None
+    output_path: 输出路径，如果为None则返回内存中的PDF
+    font_path: 字体路径，如果为None则使用默认字体
+    font_size: 字体大小
+    opacity: 透明度 (0-1)
+    angle: 旋转角度
+    color: RGB颜色元组 (0-255, 0-255, 0-255)
+    page_size: 水印页面大小 (宽, 高)，如果为None则使用reportlab默认的A4
+    font_index: .ttc字体集合中的子字体索引
+    layout: 布局，"center"（页面中心，默认）或 "tile"（整页平铺）
+    tile_spacing: 平铺时相邻文字之间的间距（点），默认为字体大小的两倍
+    image_path: 图片水印（PNG/JPEG等，支持透明通道），绘制在页面中心、文字下方
+    image_scale: 图片宽度占页面宽度的比例
+    image_angle: 图片的旋转角度
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"未知的水印布局: {layout}")
+    if not text and not image_path:
+        raise ValueError("需要水印文字或图片")
+    # 注册字体（每个字体文件在进程内只解析一次；未提供字体路径时使用默认字体）
+    font_name = register_font(font_path, font_index) if text else None
+    # reportlab只在需要渲染时导入
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+    
+    with metrics.stage("render"):
+        buffer = None
+        if text and layout == "tile":
+            buffer = _tiled_watermark(text, font_name, font_size, opacity, angle, color,
+                                      page_size or A4, tile_spacing)
+        elif text:
+            buffer = io.BytesIO()
+            canvas_args = {"pagesize": tuple(page_size)} if page_size else {}
+            c = canvas.Canvas(buffer, **canvas_args)
+            _draw_watermark(c, text, font_name, font_size, opacity, angle, color)
+            c.save()
+            buffer.seek(0)
+        if image_path:
+            buffer = _image_watermark(buffer, image_path, page_size or A4, opacity, image_scale, image_angle)
+    
+        # 如果没有指定输出路径，返回内存缓冲区
+        if not output_path:
+            return buffer
+        with open(output_path, 'wb') as f:
+            f.write(buffer.getvalue())
+
+def _image_watermark(text_pdf, image_path, page_size, opacity, scale, angle):
+    """
+    创建图片水印页面，text_pdf不为None时把其中的文字水印叠加在图片上方，返回内存中的PDF
+
+    图片按内容摘要和目标尺寸缓存，只解码、缩放和编码一次（见load_image）；
+    像素尺寸与页面尺寸无关，不同尺寸的页面只是变换矩阵不同
+    """
+    width, height = map(float, page_size)
+    display_width = width * scale
+    size = template_size(image_path, scale)
+    image = load_image(image_path, size)
+    display_height = display_width * size[1] / size[0]
+
+    writer = PdfWriter()
+    page = PageObject.create_blank_page(writer, width, height)
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/XObject"): DictionaryObject({NameObject("/WmImg"): image.xobject(writer)}),
+        NameObject("/ExtGState"): DictionaryObject({NameObject("/WmImgGs"): opacity_state(opacity)}),
+    })
+    matrix = " ".join(f"{value:.4f}" for value in image_placement(width, height, display_width, display_height, angle))
+    page[NameObject("/Contents")] = _make_stream(writer, f"q /WmImgGs gs {matrix} cm /WmImg Do Q".encode())
+    if text_pdf is not None:
+        page.merge_page(PdfReader(text_pdf).pages[0])
+    writer.add_page(page)
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    buffer.seek(0)
+    return buffer
+
+def _tiled_watermark(text, font_name, font_size, opacity, angle, color, page_size, spacing=None):
+    """
+    创建整页平铺的水印页面，返回内存中的PDF
+
+    文字只在一个平铺单元中绘制一次，页面内容用平铺图案（Tiling Pattern）填满整页，
+    渲染耗时和输出体积与平铺的密度无关。
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.pdfbase import pdfmetrics
+    width, height = map(float, page_size)
+    spacing = font_size * 2 if spacing is None else spacing
+    # 单元大小为旋转后文字的外接矩形加上间距
+    text_width = pdfmetrics.stringWidth(text, font_name, font_size)
+    sin, cos = abs(math.sin(math.radians(angle))), abs(math.cos(math.radians(angle)))
+    cell_width = text_width * cos + font_size * sin + spacing
+    cell_height = text_width * sin + font_size * cos + spacing
+
+    # 渲染一个单元，文字的字形框（而不是基线）居中
+    cell = io.BytesIO()
+    c = canvas.Canvas(cell, pagesize=(cell_width, cell_height))
+    _draw_watermark(c, text, font_name, font_size, opacity, angle, color, baseline=-font_size * 0.35)
     c.save()
+    cell_page = PdfReader(cell).pages[0]
+
+    writer = PdfWriter()
+    page = PageObject.create_blank_page(writer, width, height)
+    stream = DecodedStreamObject()
+    stream.set_data(cell_page.get_contents().get_data())
+    pattern = stream.flate_encode()
+    pattern.update({
+        NameObject("/Type"): NameObject("/Pattern"),
+        NameObject("/PatternType"): NumberObject(1),
+        NameObject("/PaintType"): NumberObject(1),
+        NameObject("/TilingType"): NumberObject(1),
+        NameObject("/BBox"): ArrayObject([NumberObject(0), NumberObject(0),
+                                          FloatObject(cell_width), FloatObject(cell_height)]),
+        NameObject("/XStep"): FloatObject(cell_width),
+        NameObject("/YStep"): FloatObject(cell_height),
+        # 让其中一个单元位于页面中心
+        NameObject("/Matrix"): ArrayObject([NumberObject(1), NumberObject(0), NumberObject(0), NumberObject(1),
+                                            FloatObject((width - cell_width) / 2),
+                                            FloatObject((height - cell_height) / 2)]),
+        NameObject("/Resources"): cell_page["/Resources"].clone(writer),
+    })
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/Pattern"): DictionaryObject({NameObject("/Wt"): writer._add_object(pattern)}),
+    })
+    page[NameObject("/Contents")] = _make_stream(
+        writer, f"q /Pattern cs /Wt scn 0 0 {width:g} {height:g} re f Q".encode())
+    writer.add_page(page)
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    buffer.seek(0)
+    return buffer
+
+def create_watermark_pages(items, font_path=None, font_size=40, opacity=0.5, angle=45, color=(0, 0, 0),
+                           font_index=0):
+    """
+    在一个PDF中创建多页水印，各页共用同一份字体资源
+
+    参数:
+    items: (水印文本, (页面宽, 高), 额外旋转角度) 的列表，每项生成一页
+    其余参数与create_watermark相同
+
+    返回: 内存中的PDF
+    """
+    from reportlab.pdfgen import canvas
+    font_name = register_font(font_path, font_index)
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer)
+    for text, page_size, rotate in items:
+        c.setPageSize(tuple(page_size))
+        _draw_watermark(c, text, font_name, font_size, opacity, angle + rotate, color)
+        c.showPage()
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+def _preload(obj, seen=None):
+    """解析对象引用的全部间接对象，之后多线程共享读取时不再访问底层文件流"""
+    if seen is None:
+        seen = set()
+    if isinstance(obj, IndirectObject):
+        # 页面可能引用其他文档中的对象（如共用的图片），按来源文档区分对象编号
+        key = (id(obj.pdf), obj.idnum)
+        if key in seen:
+            return
+        seen.add(key)
+        obj = obj.get_object()
+    if isinstance(obj, dict):
+        for value in obj.values():
+            _preload(value, seen)
+    elif isinstance(obj, list):
+        for value in obj:
+            _preload(value, seen)
+
+class WatermarkTemplate:
+    """
+    按页面几何缓存的水印模板
+
+    同一组水印参数下，每种 (页面宽, 高, /Rotate) 只在第一次遇到时渲染一次，
+    混合尺寸、横向或旋转页面的文档也能让水印居中且方向正确。
+    缓存在进程内所有实例间共享；图片水印按图片内容摘要计入缓存键。
+    """
+
+    # 缓存的模板数量上限，超出时淘汰最早的条目
+    max_entries = 64
+
+    _cache = {}
+    _lock = threading.Lock()
+
+    def __init__(self, text=None, font_path=None, font_size=40, opacity=0.5, angle=45, color=(0, 0, 0),
+                 font_index=0, layout="center", tile_spacing=None, image_path=None, image_scale=0.5):
+        if layout not in LAYOUTS:
+            raise ValueError(f"未知的水印布局: {layout}")
+        self.text = text
+        self.font_path = font_path
+        self.font_index = font_index
+        self.font_size = font_size
+        self.opacity = opacity
+        self.angle = angle
+        self.color = tuple(color)
+        self.layout = layout
+        self.tile_spacing = tile_spacing
+        self.image_path = image_path
+        self.image_scale = image_scale
+        # 图片按内容区分，文件被替换后重新渲染
+        self.image_key = image_digest(image_path) if image_path else None
+
+    @property
+    def params(self):
+        """水印参数元组，作为缓存键的一部分"""
+        return (self.text, self.font_path, self.font_index, self.font_size, self.opacity, self.angle, self.color,
+                self.layout, self.tile_spacing, self.image_key, self.image_scale)
+
+    def get_page(self, width, height, rotate=0):
+        """
+        获取适合指定页面几何的水印页面
+
+        参数:
+        width: 页面MediaBox宽度
+        height: 页面MediaBox高度
+        rotate: 页面的/Rotate值
+        """
+        key = (round(float(width), 2), round(float(height), 2), int(rotate) % 360) + self.params
+        page = self._cache.get(key)
+        if page is not None:
+            return page
+        with self._lock:
+            page = self._cache.get(key)
+            if page is None:
+                page = self._render(*key[:3])
+                if len(self._cache) >= self.max_entries:
+                    del self._cache[next(iter(self._cache))]
+                self._cache[key] = page
+        return page
+
+    def page_for(self, page):
+        """获取适合给定PDF页面的水印页面"""
+        box = page.mediabox
+        return self.get_page(box.width, box.height, page.get("/Rotate", NumberObject(0)).get_object())
+
+    def _render(self, width, height, rotate):
+        # 页面显示时会顺时针旋转/Rotate度，绘制时补偿这部分角度
+        buffer = create_watermark(
+            text=self.text,
+            font_path=self.font_path,
+            font_index=self.font_index,
+            font_size=self.font_size,
+            opacity=self.opacity,
+            angle=self.angle + rotate,
+            color=self.color,
+            page_size=(width, height),
+            layout=self.layout,
+            tile_spacing=self.tile_spacing,
+            image_path=self.image_path,
+            image_scale=self.image_scale,
+            image_angle=rotate
+        )
+        page = PdfReader(buffer).pages[0]
+        if self.image_path:
+            # 换成所有页面几何共用的图片对象，同一份输出中图片只嵌入一次
+            image = load_image(self.image_path, template_size(self.image_path, self.image_scale))
+            page["/Resources"]["/XObject"][NameObject("/WmImg")] = image.shared_xobject()
+        _preload(page)
+        return page
+
+def _make_stream(writer, data):
+    """创建一个内容流对象并加入writer，返回其间接引用"""
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    return writer._add_object(stream)
+
+def embed_watermark_xobject(writer, watermark_page):
+    """
+    把水印页转换为Form XObject并加入writer（只嵌入一次）
+
+    参数:
+    writer: PdfWriter对象
+    watermark_page: 水印PDF的页面对象
+
+    返回: Form XObject的间接引用
+    """
+    contents = watermark_page.get_contents()
+    if contents is None:
+        data = b""
+    elif isinstance(contents, ArrayObject):
+        # 多个内容流按顺序拼接
+        data = b"\n".join(part.get_object().get_data() for part in contents)
+    else:
+        data = contents.get_data()
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    # flate_encode不会保留字典项，所以先压缩再设置XObject属性
+    form = stream.flate_encode()
+    form.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/FormType"): NumberObject(1),
+        NameObject("/BBox"): ArrayObject(watermark_page.mediabox),
+    })
+    if "/Resources" in watermark_page:
+        resources = watermark_page.raw_get("/Resources")
+        if isinstance(writer, PdfWriter):
+            resources = resources.get_object().clone(writer)
+        # 其他写入器（如StreamingPdfWriter）在写出时自行转换来源文档的引用
+        form[NameObject("/Resources")] = resources
+    return writer._add_object(form)
+
+def _page_content_refs(writer, page):
+    """返回页面原有内容流的引用列表（不解码内容）"""
+    if "/Contents" not in page:
+        return []
+    raw = page.raw_get("/Contents")
+    contents = raw.get_object()
+    if isinstance(contents, ArrayObject):
+        return list(contents)
+    if isinstance(raw, IndirectObject):
+        return [raw]
+    return [writer._add_object(contents)]
+
+def stamp_page(writer, page, xobject_ref, wrap_refs, name="/Wm"):
+    """
+    通过引用共享XObject为页面添加水印，原内容流保持不变
+
+    参数:
+    writer: PdfWriter对象
+    page: 已加入writer的页面对象
+    xobject_ref: 水印Form XObject的间接引用
+    wrap_refs: (开头"q"流, 结尾"Q q /Wm Do Q"流) 的引用，所有页面共用
+    name: 水印在页面资源中的名称
+    """
+    # 复制资源字典，避免修改多个页面共享的资源对象
+    resources = DictionaryObject(page.get("/Resources", DictionaryObject()).get_object())
+    xobjects = DictionaryObject(resources.get("/XObject", DictionaryObject()).get_object())
+    xobjects[NameObject(name)] = xobject_ref
+    resources[NameObject("/XObject")] = xobjects
+    page[NameObject("/Resources")] = resources
+
+    head_ref, tail_ref = wrap_refs
+    page[NameObject("/Contents")] = ArrayObject(
+        [head_ref] + _page_content_refs(writer, page) + [tail_ref]
+    )
+
+def _unique_xobject_name(page, base="/Wm"):
+    """选取一个页面资源中尚未使用的XObject名称"""
+    resources = page.get("/Resources")
+    used = resources.get_object().get("/XObject", {}) if resources is not None else {}
+    used = used.get_object() if hasattr(used, "get_object") else used
+    name, i = base, 0
+    while name in used:
+        i += 1
+        name = f"{base}{i}"
+    return name
+
+def load_watermark_page(watermark_pdf):
+    """
+    读取水印PDF的第一页
+
+    返回的页面已解析全部引用对象，可以在多个线程间共享。
+
+    参数:
+    watermark_pdf: 水印PDF文件路径、文件对象或已解析的页面对象（直接返回）
+    """
+    if isinstance(watermark_pdf, PageObject):
+        return watermark_pdf
+    page = PdfReader(watermark_pdf).pages[0]
+    _preload(page)
+    return page
+
+# 当前线程的逐页回调（见page_callback）
+_page_callbacks = threading.local()
+
+@contextmanager
+def page_callback(callback):
+    """
+    在当前线程中每添加完一页水印调用一次callback()，用于显示逐页进度
+
+    callback抛出异常时中止当前文件的处理（如用户取消任务）；页面区间并行处理时子进程中的页面不回调
+    """
+    previous = getattr(_page_callbacks, "callback", None)
+    _page_callbacks.callback = callback
+    try:
+        yield
+    finally:
+        _page_callbacks.callback = previous
+
+class PageStamper:
+    """
+    把水印盖到PDF写入器中的页面上
+
+    xobject方式下每个水印页面在一个writer中只嵌入一次，
+    开头的"q"流和结尾的调用流也在页面之间共用。
+    """
+
+    def __init__(self, writer, watermark, mode="xobject"):
+        """
+        参数:
+        writer: PdfWriter对象
+        watermark: 水印PDF文件路径、文件对象、已解析的水印页面或WatermarkTemplate
+        mode: 叠加方式，"xobject" 或 "merge"
+        """
+        if mode not in STAMP_MODES:
+            raise ValueError(f"未知的叠加方式: {mode}")
+        self.writer = writer
+        self.mode = mode
+        if isinstance(watermark, WatermarkTemplate):
+            self.template = watermark
+            self.watermark_page = None
+        else:
+            # watermark为None时由子类的_watermark_for提供水印
+            self.template = None
+            self.watermark_page = load_watermark_page(watermark) if watermark is not None else None
+        self._xobjects = {}
+        self._head_ref = None
+        self._tail_refs = {}
+
+    def _watermark_for(self, page):
+        if self.template is not None:
+            return self.template.page_for(page)
+        return self.watermark_page
+
+    def _xobject_for(self, watermark_page):
+        key = id(watermark_page)
+        if key not in self._xobjects:
+            self._xobjects[key] = embed_watermark_xobject(self.writer, watermark_page)
+        return self._xobjects[key]
+
+    def _tail_ref(self, name, x, y):
+        key = (name, x, y)
+        if key not in self._tail_refs:
+            if x or y:
+                data = f"\nQ q 1 0 0 1 {x:g} {y:g} cm {name} Do Q\n"
+            else:
+                data = f"\nQ q {name} Do Q\n"
+            self._tail_refs[key] = _make_stream(self.writer, data.encode())
+        return self._tail_refs[key]
+
+    def stamp(self, page):
+        """
+        把页面加入writer并添加水印，返回writer中的页面对象
+
+        参数:
+        page: 读取器中的页面对象
+        """
+        watermark_page = self._watermark_for(page)
+        # 水印按MediaBox原点对齐
+        box = page.mediabox
+        x, y = float(box.left), float(box.bottom)
+        if self.mode == "merge":
+            if x or y:
+                # PyPDF2 3.0的add_transformation会修改水印页面本身，这里直接对合并的内容做平移
+                ctm = Transformation().translate(x, y).ctm
+                page._merge_page(
+                    watermark_page,
+                    lambda content: PageObject._add_transformation_matrix(content, watermark_page.pdf, ctm),
+                    ctm
+                )
+            else:
+                page.merge_page(watermark_page)
+            out = self.writer.add_page(page)
+        else:
+            if self._head_ref is None:
+                self._head_ref = _make_stream(self.writer, b"q\n")
+            name = _unique_xobject_name(page)
+            xobject_ref = self._xobject_for(watermark_page)
+            out = self.writer.add_page(page)
+            stamp_page(self.writer, out, xobject_ref, (self._head_ref, self._tail_ref(name, x, y)), name)
+        callback = getattr(_page_callbacks, "callback", None)
+        if callback is not None:
+            callback()
+        return out
+
+@contextmanager
+def _open_input(input_pdf):
+    """打开输入PDF；文件对象（包括mmap）原样使用（不可定位的流如标准输入先读入内存）"""
+    if not hasattr(input_pdf, 'read'):
+        with open(input_pdf, 'rb') as f:
+            yield f
+    elif hasattr(input_pdf, 'seekable') and not input_pdf.seekable():
+        yield io.BytesIO(input_pdf.read())
+    else:
+        yield input_pdf
+
+@contextmanager
+def _open_output(output_pdf):
+    """打开输出PDF；文件对象原样使用（不可定位的流如标准输出包装后记录写出位置）"""
+    if not hasattr(output_pdf, 'write'):
+        with open(output_pdf, 'wb') as f:
+            yield f
+    elif not output_pdf.seekable():
+        stream = PositionTrackingStream(output_pdf)
+        yield stream
+        stream.flush()
+    else:
+        yield output_pdf
+
+def add_watermark(input_pdf, output_pdf, watermark_pdf, mode="xobject", linearize=False):
+    """
+    将水印添加到PDF文件的每一页
+    
+    参数:
+    input_pdf: 输入PDF文件路径或文件对象
+    output_pdf: 输出PDF文件路径或文件对象；为None时返回内存中的PDF
+    watermark_pdf: 水印PDF文件路径、文件对象（如create_watermark返回的内存PDF）、已解析的水印页面，
+                   或按页面尺寸和旋转生成水印的WatermarkTemplate
+    mode: 叠加方式，"xobject"（共享XObject，默认）或"merge"（逐页合并）
+    linearize: 为True时以线性化（快速Web查看）布局写出，通过范围请求读取的阅读器下载开头一小段就能显示第一页
+    """
+    buffer = io.BytesIO() if output_pdf is None else None
+    with _open_input(input_pdf) as src:
+        # 读取输入PDF
+        with metrics.stage("parse"):
+            reader = PdfReader(src)
+            pages = reader.pages
+            metrics.count_pages(len(pages))
+        writer = PdfWriter()
+        stamper = PageStamper(writer, watermark_pdf, mode)
+        
+        # 为每页添加水印
+        with metrics.stage("stamp"):
+            for page in pages:
+                stamper.stamp(page)
+        
+        # 写入输出文件
+        if linearize:
+            # 先写到内存，再按线性化布局重写
+            from pdf_watermark_linearize import linearize_pdf
+            with metrics.stage("write"):
+                data = io.BytesIO()
+                writer.write(data)
+                data.seek(0)
+            with _open_output(output_pdf if buffer is None else buffer) as dst:
+                linearize_pdf(data, dst)
+        else:
+            with metrics.stage("write"), _open_output(output_pdf if buffer is None else buffer) as dst:
+                writer.write(dst)
     
-    # 如果没有指定输出路径，返回内存缓冲区
-    if not output_path:
+    if buffer is not None:
         buffer.seek(0)
         return buffer
 
-def add_watermark(input_pdf, output_pdf, watermark_pdf):
+def add_text_watermark(input_pdf, output_pdf, text, font_path=None, font_size=40, opacity=0.5, angle=45,
+                       color=(0, 0, 0), font_index=0, mode="xobject", streaming=False, layout="center",
+                       tile_spacing=None, image_path=None, image_scale=0.5, linearize=False):
     """
-    将水印添加到PDF文件的每一页
-    
+    端到端添加文字水印，全程不经过临时文件
+
+    水印在内存中渲染并解析成页面对象，按参数和页面几何缓存在进程内，
+    之后使用相同参数的调用直接复用，不再重复渲染和解析。
+
+    参数:
+    input_pdf: 输入PDF文件路径或文件对象
+    output_pdf: 输出PDF文件路径或文件对象；为None时返回内存中的PDF
+    streaming: 为True时使用流式处理（output_pdf不能为None，不支持linearize）
+    其余参数与create_watermark和add_watermark相同
+    """
+    if streaming and linearize:
+        raise ValueError("流式处理不支持线性化输出")
+    template = WatermarkTemplate(
+        text=text,
+        font_path=font_path,
+        font_index=font_index,
+        font_size=font_size,
+        opacity=opacity,
+        angle=angle,
+        color=color,
+        layout=layout,
+        tile_spacing=tile_spacing,
+        image_path=image_path,
+        image_scale=image_scale
+    )
+    if streaming:
+        add_watermark_streaming(input_pdf, output_pdf, template, mode=mode)
+    else:
+        return add_watermark(input_pdf, output_pdf, template, mode=mode, linearize=linearize)
+
+def add_watermark_streaming(input_pdf, output_pdf, watermark_pdf, mode="xobject",
+                            chunk_pages=64, max_memory_mb=None):
+    """
+    以流式方式为大型PDF添加水印，峰值内存基本不随页数增长
+
+    输入文件按需读取而不是整体载入内存；页面按固定大小分块处理，
+    每块完成后立即把对象写入输出文件并释放缓存。
+
+    参数:
+    input_pdf: 输入PDF文件路径或文件对象
+    output_pdf: 输出PDF文件路径或文件对象（可以是标准输出等不可定位的流）
+    watermark_pdf: 同add_watermark
+    mode: 叠加方式，"xobject" 或 "merge"
+    chunk_pages: 每块的页数
+    max_memory_mb: 内存上限 (MB)，超过时提前写出当前块；为None时只按页数分块
+    """
+    with _open_input(input_pdf) as src, _open_output(output_pdf) as dst:
+        with metrics.stage("parse"):
+            reader = PdfReader(src)
+            writer = StreamingPdfWriter(dst)
+            writer.reserve_pages(reader)
+            metrics.count_pages(len(reader.pages))
+        stamper = PageStamper(writer, watermark_pdf, mode)
+
+        # 分块写出穿插在添加水印的过程中，计入stamp阶段
+        with metrics.stage("stamp"):
+            pending = 0
+            for page in reader.pages:
+                stamper.stamp(page)
+                pending += 1
+                if pending >= chunk_pages or (
+                        max_memory_mb is not None and (current_rss_mb() or 0) > max_memory_mb):
+                    writer.flush()
+                    pending = 0
+        with metrics.stage("write"):
+            writer.close()
+
+def add_watermark_incremental(input_pdf, output_pdf, watermark_pdf, mode="xobject"):
+    """
+    以增量更新方式添加水印：原文件字节原样保留，只在末尾追加新对象
+
+    只追加水印XObject、修改过的页面字典和新的交叉引用段，
+    原有的图片等大对象不会被重新序列化。
+
+    参数:
+    input_pdf: 输入PDF文件路径
+    output_pdf: 输出PDF文件路径；为None或与输入相同时直接追加到输入文件
+    watermark_pdf: 同add_watermark
+    mode: 叠加方式，"xobject" 或 "merge"
+    """
+    in_place = output_pdf is None or (
+        os.path.exists(output_pdf) and os.path.samefile(input_pdf, output_pdf))
+    target = input_pdf if in_place else output_pdf
+
+    with open(input_pdf, 'rb') as src:
+        # 先检查输入，不能处理的文件不会被复制到输出路径
+        with metrics.stage("parse"):
+            reader = PdfReader(src)
+            if reader.is_encrypted:
+                raise ValueError("增量更新不支持加密的PDF")
+            metrics.count_pages(len(reader.pages))
+        if not in_place:
+            with metrics.stage("write"):
+                shutil.copyfile(input_pdf, output_pdf)
+        original_size = os.path.getsize(target)
+
+        try:
+            with open(target, 'r+b') as dst:
+                writer = IncrementalPdfWriter(reader, dst)
+                stamper = PageStamper(writer, watermark_pdf, mode)
+                with metrics.stage("stamp"):
+                    for page in reader.pages:
+                        stamper.stamp(page)
+                with metrics.stage("write"):
+                    writer.close()
+        except Exception:
+            if in_place:
+                # 截断追加的内容，保持原文件不变
+                os.truncate(target, original_size)
+            elif os.path.exists(output_pdf):
+                # 删除输出，不留下没有水印的副本
+                os.remove(output_pdf)
+            raise
+
+# 并行处理单个文档时每个工作进程共享的新对象编号计数器
+_range_counter = None
+
+def _init_range_worker(counter):
+    global _range_counter
+    _range_counter = counter
+
+def _stamp_range(input_pdf, page_refs, start, end, watermark_pdf, mode, pages_num, fragment_path):
+    """在工作进程中为 [start, end) 区间的页面添加水印，写出对象片段"""
+    with open(input_pdf, 'rb') as src, open(fragment_path, 'wb') as dst:
+        reader = PdfReader(src)
+        writer = RangePdfWriter(dst, reader, _range_counter, pages_num, page_refs)
+        stamper = PageStamper(writer, watermark_pdf, mode)
+        for i in range(start, end):
+            stamper.stamp(load_page(reader, *page_refs[i]))
+            if (i - start + 1) % 64 == 0:
+                writer.flush()
+        offsets, kids = writer.close()
+    return fragment_path, offsets, kids
+
+def _max_object_number(reader):
+    """返回文档中最大的对象编号"""
+    known = [num for nums in reader.xref.values() for num in nums]
+    known.extend(reader.xref_objStm)
+    return max([int(reader.trailer.get("/Size", 1)) - 1] + known)
+
+def add_watermark_parallel(input_pdf, output_pdf, watermark_pdf, mode="xobject", workers=None,
+                           min_pages=PARALLEL_MIN_PAGES):
+    """
+    把单个大文档拆分成页面区间，在多个进程中并行添加水印后拼接成一个输出
+
+    原文档的对象在输出中沿用原编号，多个区间共用的字体、图片等只写出一份；
+    每个区间会各自嵌入一份水印XObject。页数少于min_pages时直接在当前进程处理。
+
     参数:
     input_pdf: 输入PDF文件路径
     output_pdf: 输出PDF文件路径
-    watermark_pdf: 水印PDF文件路径或文件对象
+    watermark_pdf: 水印PDF文件路径或WatermarkTemplate（需要能传给子进程）
+    mode: 叠加方式，"xobject" 或 "merge"
+    workers: 工作进程数，默认为CPU核数
+    min_pages: 启用并行的最小页数
     """
-    # 读取输入PDF
-    reader = PdfReader(input_pdf)
-    writer = PdfWriter()
-    
-    # 读取水印PDF
-    if isinstance(watermark_pdf, str):
-        watermark = PdfReader(watermark_pdf)
-    else:
-        watermark = PdfReader(watermark_pdf)
-    
-    watermark_page = watermark.pages[0]
-    
-    # 为每页添加水印
-    for i in range(len(reader.pages)):
-        page = reader.pages[i]
-        page.merge_page(watermark_page)
-        writer.add_page(page)
-    
-    # 写入输出文件
-    with open(output_pdf, 'wb') as f:
-        writer.write(f)
+    workers = workers or os.cpu_count() or 1
+    with open(input_pdf, 'rb') as src, metrics.stage("parse"):
+        reader = PdfReader(src)
+        page_refs = [(page.indirect_reference.idnum, page.indirect_reference.generation)
+                     for page in reader.pages]
+        page_count = len(page_refs)
+        max_num = _max_object_number(reader)
+    if workers < 2 or page_count < max(min_pages, 2):
+        add_watermark(input_pdf, output_pdf, watermark_pdf, mode=mode)
+        return
+    metrics.count_pages(page_count)
+    import multiprocessing
+    import concurrent.futures
 
-def main():
-    parser = argparse.ArgumentParser(description='为PDF文件添加水印')
-    parser.add_argument('--input', required=True, help='输入PDF文件路径')
-    parser.add_argument('--output', required=True, help='输出PDF文件路径')
-    parser.add_argument('--text', required=True, help='水印文字内容')
-    parser.add_argument('--opacity', type=float, default=0.5, help='水印透明度 (0.0-1.0)')
-    parser.add_argument('--angle', type=float, default=45, help='水印旋转角度')
-    parser.add_argument('--size', type=int, default=40, help='水印字体大小')
-    parser.add_argument('--color', default='0,0,0', help='水印颜色 (格式: "R,G,B")')
-    parser.add_argument('--font', help='字体文件路径（支持中文的字体）')
-    
-    args = parser.parse_args()
-    
-    # 解析颜色
-    color = tuple(map(int, args.color.split(',')))
-    
-    # 创建临时文件用于保存水印PDF
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-        temp_filename = temp_file.name
-    
+    # 原文档对象占用 1..max_num，之后依次是页面树根、文档目录和新对象
+    pages_num, root_num = max_num + 1, max_num + 2
+    counter = multiprocessing.Value('q', max_num + 3)
+    size = -(-page_count // workers)
+    ranges = [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+    temp_dir = tempfile.mkdtemp(prefix="pdf_watermark_")
     try:
-        # 创建水印
-        create_watermark(
-            text=args.text,
-            output_path=temp_filename,
-            font_path=args.font,
-            font_size=args.size,
-            opacity=args.opacity,
-            angle=args.angle,
-            color=color
-        )
-        
-        # 添加水印到PDF
-        add_watermark(args.input, args.output, temp_filename)
-        
-        print(f"水印已成功添加。输出文件: {args.output}")
-    
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_range_worker, initargs=(counter,)) as executor:
+            futures = [
+                executor.submit(_stamp_range, input_pdf, page_refs, start, end, watermark_pdf, mode, pages_num,
+                                os.path.join(temp_dir, f"part_{i}.bin"))
+                for i, (start, end) in enumerate(ranges)
+            ]
+            fragments = [future.result() for future in futures]
+
+        with open(output_pdf, 'wb') as dst:
+            writer = StitchedPdfWriter(dst, pages_num, root_num)
+            for fragment_path, offsets, kids in fragments:
+                writer.append_fragment(fragment_path, offsets, kids)
+            writer._next_num = max(writer._next_num, counter.value)
+            writer.close()
     finally:
-        # 删除临时文件
-        if os.path.exists(temp_filename):
-            os.unlink(temp_filename)
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
-if __name__ == "__main__":
-    main() 
\ No newline at end of file
+class _ReservedXObjectStamper(PageStamper):
+    """每种页面几何对应一个预留编号的XObject，其内容在写出每份输出时才确定"""
+
+    def __init__(self, writer, mode="xobject"):
+        super().__init__(writer, None, mode)
+        # 页面几何 (宽, 高, /Rotate) -> 预留的XObject引用
+        self.geometries = {}
+
+    def _watermark_for(self, page):
+        box = page.mediabox
+        rotate = int(page.get("/Rotate", NumberObject(0)).get_object()) % 360
+        return (float(box.width), float(box.height), rotate)
+
+    def _xobject_for(self, geometry):
+        if geometry not in self.geometries:
+            self.geometries[geometry] = self.writer.reserve()
+        return self.geometries[geometry]
+
+def _form_xobject(data, width, height, resources_ref):
+    """创建以resources_ref为资源的Form XObject"""
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    form = stream.flate_encode()
+    form.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/FormType"): NumberObject(1),
+        NameObject("/BBox"): ArrayObject([NumberObject(0), NumberObject(0),
+                                          FloatObject(width), FloatObject(height)]),
+        NameObject("/Resources"): resources_ref,
+    })
+    return form
+
+def add_watermark_personalized(input_pdf, jobs, font_path=None, font_size=40, opacity=0.5, angle=45,
+                               color=(0, 0, 0), font_index=0, group_size=100):
+    """
+    为同一文档生成多份水印文字不同的输出（如按收件人个性化的水印）
+
+    原文档只解析和序列化一次；每组收件人的水印在一个PDF中一起渲染，共用同一份字体子集，
+    每份输出只需复制共同部分，再写出各自的水印内容流。
+
+    参数:
+    input_pdf: 输入PDF文件路径
+    jobs: (输出PDF文件路径, 水印文字) 的可迭代对象
+    group_size: 每组一起渲染的收件人数量；越大渲染越快，但每份输出中的字体子集越大
+    其余参数与create_watermark相同
+
+    返回: 生成的输出文件数量
+    """
+    count = 0
+    with open(input_pdf, 'rb') as src, tempfile.TemporaryFile() as body:
+        reader = PdfReader(src)
+        writer = PersonalizedPdfWriter(body)
+        writer.reserve_pages(reader)
+        stamper = _ReservedXObjectStamper(writer)
+        for page in reader.pages:
+            stamper.stamp(page)
+        writer.finish_body()
+        geometries = list(stamper.geometries.items())
+
+        jobs = iter(jobs)
+        while True:
+            group = [job for _, job in zip(range(group_size), jobs)]
+            if not group:
+                break
+            items = [(text, (width, height), rotate)
+                     for _, text in group for (width, height, rotate), _ in geometries]
+            watermarks = PdfReader(create_watermark_pages(
+                items, font_path=font_path, font_size=font_size, opacity=opacity,
+                angle=angle, color=color, font_index=font_index))
+            fragment = writer.fragment([watermarks.pages[0].raw_get("/Resources")])
+            resources_ref = fragment[0][0]
+
+            for i, (output_pdf, _) in enumerate(group):
+                objects = {}
+                for j, ((width, height, _), ref) in enumerate(geometries):
+                    page = watermarks.pages[i * len(geometries) + j]
+                    objects[ref.idnum] = _form_xobject(
+                        page.get_contents().get_data(), width, height, resources_ref)
+                output_dir = os.path.dirname(output_pdf)
+                if output_dir and not os.path.exists(output_dir):
+                    os.makedirs(output_dir)
+                with open(output_pdf, 'wb') as dst:
+                    writer.emit(dst, fragment, objects)
+                count += 1
+    return count
+
+def load_recipients(path):
+    """
+    读取收件人列表，每个收件人是一个字段字典
+
+    参数:
+    path: CSV文件（第一行为字段名）或JSONL文件（每行一个JSON对象）
+    """
+    if path.lower().endswith(('.jsonl', '.json')):
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        return list(csv.DictReader(f))
+
+def personalized_jobs(recipients, text, output):
+    """
+    根据收件人字段生成 (输出路径, 水印文字) 对
+
+    text和output中可以使用收件人的字段（如 {name}），以及 {index}（从1开始的序号）
+    和 {date}（收件人未提供时为当天日期）
+
+    参数:
+    recipients: 收件人字段字典的列表
+    text: 水印文字模板
+    output: 输出路径模板
+    """
+    today = datetime.date.today().isoformat()
+    for index, recipient in enumerate(recipients, 1):
+        fields = {"index": index, "date": today}
+        fields.update(recipient)
+        yield output.format(**fields), text.format(**fields)
+
+def main():
+    """命令行入口，见pdf_watermark_cli"""
+    from pdf_watermark_cli import main
+    return main()
@@ -3,61 +3,375 @@
 
 import os
 import argparse
-import glob
-from pdf_watermark import create_watermark, add_watermark
-import tempfile
 import concurrent.futures
+from pdf_watermark_fontindex import resolve_font
+from pdf_watermark_journal import JOURNAL_NAME, BatchJournal, fingerprint, params_key
+from pdf_watermark_options import LAYOUTS, STAMP_MODES, optimize_options
+from pdf_watermark_watch import HotFolder
+import pdf_watermark_metrics as metrics
+
+# PyPDF2和reportlab在用到的函数中才导入：--help和参数错误可以立即返回，
+# 使用预先生成的水印文件（--watermark）时不会导入reportlab
+
+# 执行方式: thread 线程池（默认）；process 进程池，绕开GIL充分利用多核；
+# pipeline 读取、添加水印、写出分阶段并行，适合输入输出在慢速网络存储上的情况
+EXECUTORS = ("thread", "process", "pipeline")
+
+# 进程池中每个工作进程的常驻状态（水印页面在进程启动时解析一次）
+_worker_state = {}
+
+def output_path_for(input_file, output_dir):
+    """返回输入文件对应的输出文件路径"""
+    return os.path.join(output_dir, f"watermarked_{os.path.basename(input_file)}")
 
 def process_file(input_file, output_dir, watermark_file, text=None, font_path=None, 
-                font_size=40, opacity=0.5, angle=45, color=(0, 0, 0)):
-    """处理单个PDF文件"""
+                font_size=40, opacity=0.5, angle=45, color=(0, 0, 0), mode="xobject", font_index=0,
+                max_memory_mb=None, incremental=False, split_pages=None, optimize=None, layout="center",
+                tile_spacing=None, image_path=None, image_scale=0.5):
+    """
+    处理单个PDF文件
+
+    max_memory_mb不为None时使用流式处理，内存占用不随页数增长；
+    incremental为True时以增量更新方式输出；
+    split_pages不为None时，页数达到该值的文件按页面区间拆分到多个进程并行处理；
+    optimize不为None时，写出后按其中的参数优化输出体积或线性化（见optimize_pdf）；
+    layout和tile_spacing为水印布局，image_path和image_scale为图片水印，见create_watermark
+    """
     try:
         # 确定输出文件名
-        base_name = os.path.basename(input_file)
-        output_file = os.path.join(output_dir, f"watermarked_{base_name}")
+        output_file = output_path_for(input_file, output_dir)
         
-        # 如果水印文件不存在，则创建一个
+        # 如果没有指定水印文件，则按页面尺寸和旋转生成水印（模板在进程内缓存）
         if not watermark_file:
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-                temp_watermark = temp_file.name
-                
-            create_watermark(
+            from pdf_watermark import WatermarkTemplate
+            watermark = WatermarkTemplate(
                 text=text,
-                output_path=temp_watermark,
                 font_path=font_path,
+                font_index=font_index,
                 font_size=font_size,
                 opacity=opacity,
                 angle=angle,
-                color=color
+                color=color,
+                layout=layout,
+                tile_spacing=tile_spacing,
+                image_path=image_path,
+                image_scale=image_scale
             )
         else:
-            temp_watermark = watermark_file
+            watermark = watermark_file
             
         # 添加水印
-        add_watermark(input_file, output_file, temp_watermark)
-        
-        # 如果我们创建了临时水印文件，则删除它
-        if not watermark_file and os.path.exists(temp_watermark):
-            os.unlink(temp_watermark)
+        _stamp(input_file, output_file, watermark, mode, max_memory_mb, incremental, split_pages,
+               optimize=optimize)
             
         return True, input_file, None
     except Exception as e:
         return False, input_file, str(e)
 
+def _stamp(input_file, output_file, watermark, mode, max_memory_mb, incremental, split_pages,
+           split_watermark=None, optimize=None):
+    with metrics.track_file(input_file, output_file):
+        _stamp_file(input_file, output_file, watermark, mode, max_memory_mb, incremental, split_pages,
+                    split_watermark)
+        if optimize:
+            from pdf_watermark_optimize import optimize_pdf
+            optimize_pdf(output_file, output_file, **optimize)
+
+def _stamp_file(input_file, output_file, watermark, mode, max_memory_mb, incremental, split_pages,
+                split_watermark):
+    from pdf_watermark import add_watermark, add_watermark_incremental, add_watermark_parallel, add_watermark_streaming
+    if split_pages is not None and not incremental and max_memory_mb is None:
+        # 子进程无法接收已解析的水印页面，改用水印文件路径
+        add_watermark_parallel(input_file, output_file, split_watermark or watermark, mode=mode,
+                               min_pages=split_pages)
+    elif incremental:
+        add_watermark_incremental(input_file, output_file, watermark, mode=mode)
+    elif max_memory_mb is not None:
+        add_watermark_streaming(input_file, output_file, watermark, mode=mode,
+                                max_memory_mb=max_memory_mb)
+    else:
+        add_watermark(input_file, output_file, watermark, mode=mode)
+
+def _init_worker(watermark_file, text, font_path, font_size, opacity, angle, color, mode, font_index,
+                 max_memory_mb, incremental, split_pages, stats=False, optimize=None, layout="center",
+                 tile_spacing=None, image_path=None, image_scale=0.5):
+    """
+    进程池工作进程的初始化函数：注册字体、解析水印PDF，之后的文件都复用
+
+    参数与process_file相同；stats为True时收集指标，随每个文件的结果传回主进程
+    """
+    metrics.enable(stats)
+    if watermark_file:
+        from pdf_watermark import load_watermark_page
+        watermark = load_watermark_page(watermark_file)
+    else:
+        from pdf_watermark import WatermarkTemplate
+        from reportlab.lib.pagesizes import A4
+        watermark = WatermarkTemplate(
+            text=text,
+            font_path=font_path,
+            font_index=font_index,
+            font_size=font_size,
+            opacity=opacity,
+            angle=angle,
+            color=color,
+            layout=layout,
+            tile_spacing=tile_spacing,
+            image_path=image_path,
+            image_scale=image_scale
+        )
+        # 预先渲染最常见的A4尺寸，同时完成字体注册
+        watermark.get_page(*A4)
+    _worker_state["watermark"] = watermark
+    _worker_state["watermark_file"] = watermark_file
+    _worker_state["split_pages"] = split_pages
+    _worker_state["mode"] = mode
+    _worker_state["max_memory_mb"] = max_memory_mb
+    _worker_state["incremental"] = incremental
+    _worker_state["optimize"] = optimize
+
+def _process_in_worker(input_file, output_dir):
+    """在工作进程中处理单个文件，返回 (是否成功, 文件, 错误信息, 指标)"""
+    try:
+        output_file = output_path_for(input_file, output_dir)
+        _stamp(input_file, output_file, _worker_state["watermark"],
+               _worker_state["mode"], _worker_state["max_memory_mb"], _worker_state["incremental"],
+               _worker_state["split_pages"], _worker_state["watermark_file"], _worker_state["optimize"])
+        return True, input_file, None, metrics.drain()
+    except Exception as e:
+        return False, input_file, str(e), metrics.drain()
+
+def make_executor(kind, workers, watermark_file, text=None, font_path=None,
+                  font_size=40, opacity=0.5, angle=45, color=(0, 0, 0), mode="xobject", font_index=0,
+                  max_memory_mb=None, incremental=False, split_pages=None, read_workers=2, write_workers=2,
+                  queue_size=None, use_mmap=False, stats=False, optimize=None, layout="center",
+                  tile_spacing=None, image_path=None, image_scale=0.5, on_page=None):
+    """
+    创建执行器，返回 (executor, submit)
+
+    submit(input_file, output_dir) 提交一个文件并返回future，
+    其结果为 (是否成功, 文件, 错误信息) 元组；进程池方式下还附带工作进程收集的指标，
+    需要用metrics.merge合并
+
+    参数:
+    kind: 执行方式，"thread"、"process" 或 "pipeline"
+    workers: 并发数（pipeline方式下为添加水印的线程数）
+    read_workers, write_workers, queue_size, use_mmap: pipeline方式下各阶段的设置，见WatermarkPipeline
+    stats: 是否在进程池的工作进程中收集指标
+    on_page: 线程池方式下每添加完一页水印在工作线程中调用一次on_page(input_file)，
+             抛出异常时中止该文件（结果为失败）
+    其余参数与process_file相同
+    """
+    if kind not in EXECUTORS:
+        raise ValueError(f"未知的执行方式: {kind}")
+    if on_page is not None and kind != "thread":
+        raise ValueError("只有thread方式支持逐页回调")
+
+    if kind == "pipeline":
+        if max_memory_mb is not None or incremental or split_pages is not None:
+            raise ValueError("pipeline方式不支持流式、增量更新和页面区间拆分")
+        from pdf_watermark_pipeline import WatermarkPipeline
+        if watermark_file:
+            watermark = watermark_file
+        else:
+            from pdf_watermark import WatermarkTemplate
+            watermark = WatermarkTemplate(
+                text=text,
+                font_path=font_path,
+                font_index=font_index,
+                font_size=font_size,
+                opacity=opacity,
+                angle=angle,
+                color=color,
+                layout=layout,
+                tile_spacing=tile_spacing,
+                image_path=image_path,
+                image_scale=image_scale
+            )
+        executor = WatermarkPipeline(watermark, mode, read_workers, workers, write_workers,
+                                     queue_size, use_mmap, optimize)
+
+        def submit(input_file, output_dir):
+            return executor.submit(input_file, output_path_for(input_file, output_dir))
+    elif kind == "process":
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(watermark_file, text, font_path, font_size, opacity, angle, color, mode, font_index,
+                      max_memory_mb, incremental, split_pages, stats, optimize, layout, tile_spacing,
+                      image_path, image_scale)
+        )
+
+        def submit(input_file, output_dir):
+            return executor.submit(_process_in_worker, input_file, output_dir)
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+        def submit(input_file, output_dir):
+            args = (input_file, output_dir, watermark_file, text, font_path, font_size, opacity, angle, color,
+                    mode, font_index, max_memory_mb, incremental, split_pages, optimize, layout, tile_spacing,
+                    image_path, image_scale)
+            if on_page is None:
+                return executor.submit(process_file, *args)
+            return executor.submit(_process_with_callback, on_page, *args)
+    return executor, submit
+
+def _process_with_callback(on_page, input_file, *args):
+    """在工作线程中处理单个文件，每添加完一页水印调用一次on_page(input_file)"""
+    from pdf_watermark import page_callback
+    with page_callback(lambda: on_page(input_file)):
+        return process_file(input_file, *args)
+
+def iter_pdf_files(root, recursive=True, exclude=()):
+    """
+    逐个返回目录中的PDF文件路径（扩展名不区分大小写）
+
+    使用os.scandir边遍历边返回，不会先把整个目录树读入内存；
+    不跟随指向目录的符号链接，避免循环。
+
+    参数:
+    root: 输入目录
+    recursive: 是否遍历子目录
+    exclude: 不进入的目录（绝对路径），例如位于输入目录中的输出目录
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError as e:
+            print(f"无法读取目录: {directory} - {e}")
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and os.path.abspath(entry.path) not in exclude:
+                            stack.append(entry.path)
+                    elif entry.name.lower().endswith(".pdf") and entry.is_file():
+                        yield entry.path
+                except OSError:
+                    continue
+
+def submit_bounded(submit, jobs, max_pending):
+    """
+    依次提交任务，同时最多保留max_pending个未完成的任务，按完成顺序返回 (任务, future)
+
+    任务由生成器按需产生，第一个任务提交后即开始处理，内存占用不随任务总数增长。
+    jobs产生None表示暂时没有新任务（如监视目录时），此时先返回已经完成的任务。
+
+    参数:
+    submit: submit(*任务) 返回future
+    jobs: 任务参数元组的可迭代对象
+    max_pending: 未完成任务数的上限
+    """
+    pending = {}
+    for job in jobs:
+        if job is None:
+            for future in [f for f in pending if f.done()]:
+                yield pending.pop(future), future
+            continue
+        while len(pending) >= max_pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
+        pending[submit(*job)] = job
+    for future in concurrent.futures.as_completed(list(pending)):
+        yield pending.pop(future), future
+
+def move_input(input_file, input_root, target_root):
+    """把已处理的输入文件移到target_root下相同的相对位置，返回新路径"""
+    target = os.path.join(target_root, os.path.relpath(input_file, input_root or "."))
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    os.replace(input_file, target)
+    return target
+
 def main():
     parser = argparse.ArgumentParser(description='批量为PDF文件添加水印')
     parser.add_argument('--input', required=True, help='输入PDF文件或目录')
     parser.add_argument('--output', required=True, help='输出目录')
-    parser.add_argument('--text', default='机密文件', help='水印文字内容')
+    parser.add_argument('--text', help='水印文字内容（默认为"机密文件"，只使用--image时不添加文字）')
     parser.add_argument('--opacity', type=float, default=0.5, help='水印透明度 (0.0-1.0)')
     parser.add_argument('--angle', type=float, default=45, help='水印旋转角度')
     parser.add_argument('--size', type=int, default=40, help='水印字体大小')
     parser.add_argument('--color', default='0,0,0', help='水印颜色 (格式: "R,G,B")')
-    parser.add_argument('--font', help='字体文件路径（支持中文的字体）')
+    parser.add_argument('--font', help='字体文件路径（支持中文的字体）；也可以是字体族名，或auto自动选择包含全部水印文字的系统字体')
+    parser.add_argument('--font-index', type=int, default=0, help='.ttc字体集合中的子字体索引')
     parser.add_argument('--watermark', help='预先创建的水印PDF文件')
+    parser.add_argument('--layout', choices=LAYOUTS, default='center',
+                        help='水印布局: center（页面中心，默认）或tile（整页平铺重复）')
+    parser.add_argument('--tile-spacing', type=float, help='平铺时相邻文字之间的间距（点），默认为字体大小的两倍')
+    parser.add_argument('--image', help='图片水印（PNG/JPEG等，支持透明通道），绘制在页面中心')
+    parser.add_argument('--image-scale', type=float, default=0.5, help='图片宽度占页面宽度的比例')
     parser.add_argument('--threads', type=int, default=4, help='处理线程数')
+    parser.add_argument('--executor', choices=EXECUTORS, default='thread',
+                        help='执行方式: thread（线程池，默认）、process（进程池，利用多核）'
+                             '或pipeline（读取、添加水印、写出分阶段并行，掩盖I/O延迟）')
+    parser.add_argument('--workers', type=int, help='并发工作数（默认与--threads相同）')
+    parser.add_argument('--mode', choices=STAMP_MODES, default='xobject',
+                        help='叠加方式: xobject（共享水印对象，默认）或merge（逐页合并）')
+    parser.add_argument('--max-memory', type=float,
+                        help='每个文件的内存上限 (MB)；指定后使用流式处理，适合超大文件')
+    parser.add_argument('--incremental', action='store_true',
+                        help='以增量更新方式输出：复制原文件字节，只追加水印对象')
+    parser.add_argument('--split-pages', type=int,
+                        help='页数达到该值的文件按页面区间拆分到多个进程并行处理')
+    parser.add_argument('--read-workers', type=int, default=2, help='pipeline方式下的读取线程数')
+    parser.add_argument('--write-workers', type=int, default=2, help='pipeline方式下的写出线程数')
+    parser.add_argument('--queue-size', type=int, help='pipeline方式下各阶段之间队列的容量（默认为并发数的两倍）')
+    parser.add_argument('--mmap', action='store_true', help='pipeline方式下用内存映射读取输入')
+    parser.add_argument('--compress-level', type=int, choices=range(10), metavar='0-9',
+                        help='压缩未压缩的内容流（如逐页合并产生的内容）的zlib级别，0为不压缩')
+    parser.add_argument('--dedup', action='store_true', help='合并输出中内容完全相同的对象（如重复的字体和图片）')
+    parser.add_argument('--object-streams', action='store_true',
+                        help='把对象打包进对象流并使用交叉引用流（PDF 1.5），减小输出体积')
+    parser.add_argument('--linearize', action='store_true',
+                        help='以线性化（快速Web查看）布局输出：通过范围请求读取的阅读器只需下载文件开头就能显示第一页')
+    parser.add_argument('--no-recursive', action='store_true', help='只处理输入目录本身中的PDF文件，不遍历子目录')
+    parser.add_argument('--watch', action='store_true',
+                        help='持续监视输入目录，新文件写完后立即处理（Ctrl+C停止）')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='监视模式下文件大小和修改时间保持不变多少秒后才开始处理')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='监视模式下的轮询间隔（秒）')
+    parser.add_argument('--processed-dir', help='处理成功的输入文件移到此目录（保持子目录结构）')
+    parser.add_argument('--failed-dir', help='处理失败的输入文件移到此目录（保持子目录结构）')
+    parser.add_argument('--stats', action='store_true',
+                        help='处理完成后输出各阶段和每个文件耗时的p50/p95/最大值、页数、字节数和峰值内存')
+    parser.add_argument('--metrics-out', help='导出指标的文件（.json为JSON格式，否则为Prometheus文本格式）')
+    parser.add_argument('--journal',
+                        help=f'任务日志文件（默认为输出目录中的{JOURNAL_NAME}），用于跳过已完成的文件和断点续跑')
+    parser.add_argument('--no-journal', action='store_true', help='不使用任务日志，处理所有文件')
+    parser.add_argument('--force', action='store_true', help='忽略日志中已完成的记录，重新处理所有文件（仍会更新日志）')
+    parser.add_argument('--retry-failed', action='store_true', help='只处理日志中上次失败的文件')
+    parser.add_argument('--hash-inputs', action='store_true',
+                        help='按内容摘要判断输入是否变化（修改时间变了但内容相同的文件也会跳过）')
     
     args = parser.parse_args()
+    if args.text is None and not args.image:
+        args.text = '机密文件'
+    if args.image and not os.path.isfile(args.image):
+        parser.error(f'图片文件不存在: {args.image}')
+    # 字体族名或auto在系统字体索引中查找
+    if not args.watermark:
+        try:
+            args.font, args.font_index = resolve_font(args.font, args.text, args.font_index)
+        except ValueError as e:
+            parser.error(str(e))
+    
+    if args.watch and not os.path.isdir(args.input):
+        parser.error('--watch需要输入目录')
+    if args.executor == "pipeline" and (args.max_memory is not None or args.incremental or args.split_pages):
+        parser.error('pipeline方式不支持--max-memory、--incremental和--split-pages')
+    optimize = optimize_options(args.compress_level, args.dedup, args.object_streams, args.linearize)
+    if optimize and args.incremental:
+        parser.error('--compress-level、--dedup、--object-streams和--linearize不支持--incremental')
+    if args.linearize and args.object_streams:
+        parser.error('--linearize不能与--object-streams同时使用')
+    # 优化和线性化会把整个输出读入内存重写，流式处理的内存上限不再成立
+    if optimize and args.max_memory is not None:
+        parser.error('--compress-level、--dedup、--object-streams和--linearize不支持--max-memory')
+    if args.no_journal and (args.retry_failed or args.force or args.hash_inputs):
+        parser.error('--retry-failed、--force和--hash-inputs需要任务日志，不能与--no-journal同时使用')
     
     # 解析颜色
     color = tuple(map(int, args.color.split(',')))
@@ -66,77 +380,185 @@ def main():
     if not os.path.exists(args.output):
         os.makedirs(args.output)
     
-    # 获取输入文件列表
-    if os.path.isdir(args.input):
-        input_files = glob.glob(os.path.join(args.input, "*.pdf"))
+    # 逐个发现输入文件：目录递归遍历，输出中保持相同的子目录结构
+    exclude = {os.path.abspath(path) for path in (args.output, args.processed_dir, args.failed_dir) if path}
+    if args.watch:
+        input_root = args.input
+        input_files = HotFolder(args.input, recursive=not args.no_recursive, exclude=exclude,
+                                settle=args.settle, interval=args.poll_interval)
+        print(f"正在监视目录: {args.input}（按Ctrl+C停止）")
+    elif os.path.isdir(args.input):
+        input_root = args.input
+        input_files = iter_pdf_files(args.input, recursive=not args.no_recursive, exclude=exclude)
     else:
+        input_root = os.path.dirname(args.input)
         input_files = [args.input]
     
-    if not input_files:
-        print(f"未找到PDF文件: {args.input}")
-        return
-    
-    print(f"找到 {len(input_files)} 个PDF文件")
+    if args.stats or args.metrics_out:
+        metrics.enable()
     
-    # 如果指定了预先创建的水印文件，则使用它
+    # 如果指定了预先创建的水印文件，则使用它；否则各工作线程/进程共享缓存的水印模板
     watermark_file = args.watermark
     
-    # 如果没有指定水印文件，但有多个输入文件，则预先创建一个水印文件以提高效率
-    if not watermark_file and len(input_files) > 1:
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-            watermark_file = temp_file.name
-            
-        print("创建水印文件...")
-        create_watermark(
-            text=args.text,
-            output_path=watermark_file,
-            font_path=args.font,
+    # 任务日志：参数摘要只包含影响输出内容的参数
+    journal = None
+    if not args.no_journal:
+        from pdf_watermark_images import image_digest
+        journal = BatchJournal(args.journal or os.path.join(args.output, JOURNAL_NAME))
+        params = params_key(
+            text=None if watermark_file else args.text,
+            font_path=None if watermark_file else args.font,
+            font_index=args.font_index,
             font_size=args.size,
             opacity=args.opacity,
             angle=args.angle,
-            color=color
+            color=color,
+            watermark_file=watermark_file,
+            mode=args.mode,
+            incremental=args.incremental,
+            # 未启用体积优化和平铺布局时不计入，保持与之前生成的日志一致
+            **({"optimize": optimize} if optimize else {}),
+            **({"layout": args.layout, "tile_spacing": args.tile_spacing}
+               if args.layout != "center" and not watermark_file else {}),
+            # 图片按内容摘要计入，图片文件被替换后重新处理
+            **({"image": image_digest(args.image), "image_scale": args.image_scale}
+               if args.image and not watermark_file else {})
         )
     
+    # 使用线程池或进程池并行处理文件
+    success_count = 0
+    error_count = 0
+    skipped_count = 0
+    # 成功处理的文件的输入和输出总字节数
+    input_bytes = 0
+    output_bytes = 0
+    
+    workers = args.workers or args.threads
+    if args.executor == "process":
+        print(f"使用 {workers} 个进程处理文件...")
+    elif args.executor == "pipeline":
+        print(f"使用流水线处理文件: 读取 {args.read_workers} 个线程, "
+              f"添加水印 {workers} 个线程, 写出 {args.write_workers} 个线程...")
+    else:
+        print(f"使用 {workers} 个线程处理文件...")
+    executor, submit = make_executor(
+        args.executor,
+        workers,
+        watermark_file,
+        args.text,
+        args.font,
+        args.size,
+        args.opacity,
+        args.angle,
+        color,
+        args.mode,
+        args.font_index,
+        args.max_memory,
+        args.incremental,
+        args.split_pages,
+        args.read_workers,
+        args.write_workers,
+        args.queue_size,
+        args.mmap,
+        metrics.enabled(),
+        optimize,
+        args.layout,
+        args.tile_spacing,
+        args.image,
+        args.image_scale
+    )
+    found_count = 0
+    made_dirs = set()
+    
+    def jobs():
+        """
+        按需产生待处理的 (输入文件, 输出目录, 输入指纹)，跳过日志中输出已是最新的文件
+
+        指纹在处理前记录并随任务一起传递（处理期间被修改的文件下次会重新处理），
+        监视模式下同一文件在上一个任务完成前再次出现时，各任务记录各自的指纹
+        """
+        nonlocal found_count, skipped_count
+        for input_file in input_files:
+            if input_file is None:
+                # 监视模式下暂无新文件: 提交日志，并让调用方处理已完成的任务
+                if journal is not None:
+                    journal.commit()
+                yield None
+                continue
+            found_count += 1
+            relative = os.path.relpath(os.path.dirname(input_file) or ".", input_root or ".")
+            output_dir = os.path.normpath(os.path.join(args.output, relative))
+            input_print = None
+            if journal is not None:
+                if args.retry_failed and not journal.has_failed(input_file):
+                    continue
+                input_print = fingerprint(input_file, args.hash_inputs)
+                output_file = output_path_for(input_file, output_dir)
+                if not args.force and journal.is_up_to_date(input_file, output_file, params, input_print):
+                    skipped_count += 1
+                    continue
+            if output_dir not in made_dirs:
+                os.makedirs(output_dir, exist_ok=True)
+                made_dirs.add(output_dir)
+            yield input_file, output_dir, input_print
+    
+    def submit_job(input_file, output_dir, input_print):
+        return submit(input_file, output_dir)
+    
     try:
-        # 使用线程池并行处理文件
-        success_count = 0
-        error_count = 0
-        
-        print(f"使用 {args.threads} 个线程处理文件...")
-        with concurrent.futures.ThreadPoolExecutor(max_workers=args.threads) as executor:
-            # 提交所有任务
-            future_to_file = {
-                executor.submit(
-                    process_file, 
-                    input_file, 
-                    args.output, 
-                    watermark_file,
-                    args.text, 
-                    args.font, 
-                    args.size, 
-                    args.opacity, 
-                    args.angle, 
-                    color
-                ): input_file for input_file in input_files
-            }
-            
-            # 处理结果
-            for future in concurrent.futures.as_completed(future_to_file):
-                success, file_path, error = future.result()
+        with executor:
+            for (input_file, output_dir, input_print), future in submit_bounded(submit_job, jobs(), workers * 4):
+                try:
+                    result = future.result()
+                    success, file_path, error = result[:3]
+                    if len(result) > 3:
+                        metrics.merge(result[3])
+                except Exception as e:
+                    # 工作进程初始化失败或意外退出
+                    success, file_path, error = False, input_file, str(e) or repr(e)
+                if journal is not None:
+                    journal.record(input_file, output_path_for(input_file, output_dir), params,
+                                   input_print, None if success else error)
                 if success:
                     print(f"成功处理: {os.path.basename(file_path)}")
                     success_count += 1
+                    try:
+                        input_bytes += os.path.getsize(input_file)
+                        output_bytes += os.path.getsize(output_path_for(input_file, output_dir))
+                    except OSError:
+                        pass
                 else:
                     print(f"处理失败: {os.path.basename(file_path)} - {error}")
                     error_count += 1
-        
-        print(f"\n处理完成: 成功 {success_count} 个, 失败 {error_count} 个")
-        print(f"输出文件保存在: {args.output}")
-    
+                move_to = args.processed_dir if success else args.failed_dir
+                if move_to:
+                    try:
+                        move_input(input_file, input_root, move_to)
+                    except OSError as e:
+                        print(f"无法移动输入文件: {os.path.basename(input_file)} - {e}")
+    except KeyboardInterrupt:
+        print("\n已停止")
     finally:
-        # 如果我们创建了临时水印文件，则删除它
-        if not args.watermark and watermark_file and os.path.exists(watermark_file):
-            os.unlink(watermark_file)
+        if journal is not None:
+            journal.close()
+    
+    if not found_count:
+        print(f"未找到PDF文件: {args.input}")
+        return
+    
+    if args.stats:
+        print()
+        print(metrics.format_summary())
+    if args.metrics_out:
+        metrics.write_report(args.metrics_out)
+        print(f"指标已导出到: {args.metrics_out}")
+    
+    print(f"\n共找到 {found_count} 个PDF文件")
+    print(f"处理完成: 成功 {success_count} 个, 失败 {error_count} 个, 跳过 {skipped_count} 个（已是最新）")
+    if success_count:
+        print(f"输出大小: 输入 {input_bytes} 字节, 输出 {output_bytes} 字节"
+              f" ({(output_bytes - input_bytes) / input_bytes * 100 if input_bytes else 0:+.1f}%)")
+    print(f"输出文件保存在: {args.output}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+pdf_watermark的命令行入口
+
+模块顶层只导入标准库和轻量的选项模块，--help和参数错误可以立即返回；
+PyPDF2和reportlab在参数检查通过、真正开始处理时才导入。
+"""
+
+import io
+import os
+import sys
+import argparse
+import pdf_watermark_metrics as metrics
+from pdf_watermark_fontindex import resolve_font
+from pdf_watermark_options import LAYOUTS, PARALLEL_MIN_PAGES, STAMP_MODES, optimize_options
+
+def _run_cli(args, color, input_pdf, output_pdf):
+    """按命令行参数处理一次"""
+    # 参数检查通过后才导入PyPDF2和reportlab
+    from pdf_watermark import (WatermarkTemplate, add_watermark, add_watermark_incremental, add_watermark_parallel,
+                               add_watermark_personalized, add_watermark_streaming, load_recipients,
+                               personalized_jobs)
+    from pdf_watermark_optimize import format_sizes, optimize_pdf
+    
+    # 按收件人生成个性化水印
+    if args.recipients:
+        jobs = personalized_jobs(load_recipients(args.recipients), args.text, args.output)
+        count = add_watermark_personalized(
+            args.input,
+            jobs,
+            font_path=args.font,
+            font_size=args.size,
+            opacity=args.opacity,
+            angle=args.angle,
+            color=color,
+            font_index=args.font_index,
+            group_size=args.group_size
+        )
+        print(f"水印已成功添加。共生成 {count} 个文件")
+        return
+    
+    # 按页面尺寸和旋转生成水印模板
+    template = WatermarkTemplate(
+        text=args.text,
+        font_path=args.font,
+        font_index=args.font_index,
+        font_size=args.size,
+        opacity=args.opacity,
+        angle=args.angle,
+        color=color,
+        layout=args.layout,
+        tile_spacing=args.tile_spacing,
+        image_path=args.image,
+        image_scale=args.image_scale
+    )
+    
+    # 需要体积优化时，输出到管道的结果先写到内存，文件则在写出后原地优化
+    optimize = optimize_options(args.compress_level, args.dedup, args.object_streams, args.linearize)
+    final_output = output_pdf
+    if optimize and args.output == '-':
+        output_pdf = io.BytesIO()
+    
+    # 添加水印到PDF
+    if args.incremental:
+        add_watermark_incremental(args.input, args.output, template, mode=args.mode)
+    elif args.jobs > 1:
+        add_watermark_parallel(args.input, args.output, template, mode=args.mode,
+                               workers=args.jobs, min_pages=args.parallel_min_pages)
+    elif args.streaming:
+        add_watermark_streaming(input_pdf, output_pdf, template, mode=args.mode,
+                                chunk_pages=args.chunk_pages, max_memory_mb=args.max_memory)
+    else:
+        add_watermark(input_pdf, output_pdf, template, mode=args.mode)
+    
+    # 输出到管道时提示信息写到标准错误，避免混入PDF数据
+    messages = sys.stderr if args.output == '-' else sys.stdout
+    if optimize:
+        if output_pdf is not final_output:
+            output_pdf.seek(0)
+        before, after = optimize_pdf(output_pdf, final_output, **optimize)
+        input_size = f"输入 {os.path.getsize(args.input)} 字节, " if args.input != '-' else ""
+        print(f"输出大小: {input_size}{format_sizes(before, after)}", file=messages)
+    print(f"水印已成功添加。输出文件: {args.output}", file=messages)
+
+def main():
+    parser = argparse.ArgumentParser(description='为PDF文件添加水印')
+    parser.add_argument('--input', required=True, help='输入PDF文件路径，"-" 表示从标准输入读取')
+    parser.add_argument('--output', required=True, help='输出PDF文件路径，"-" 表示写到标准输出')
+    parser.add_argument('--text', help='水印文字内容（使用--image时可以省略）')
+    parser.add_argument('--opacity', type=float, default=0.5, help='水印透明度 (0.0-1.0)')
+    parser.add_argument('--angle', type=float, default=45, help='水印旋转角度')
+    parser.add_argument('--size', type=int, default=40, help='水印字体大小')
+    parser.add_argument('--color', default='0,0,0', help='水印颜色 (格式: "R,G,B")')
+    parser.add_argument('--font', help='字体文件路径（支持中文的字体）；也可以是字体族名，或auto自动选择包含全部水印文字的系统字体')
+    parser.add_argument('--font-index', type=int, default=0, help='.ttc字体集合中的子字体索引')
+    parser.add_argument('--mode', choices=STAMP_MODES, default='xobject',
+                        help='叠加方式: xobject（共享水印对象，默认）或merge（逐页合并）')
+    parser.add_argument('--layout', choices=LAYOUTS, default='center',
+                        help='水印布局: center（页面中心，默认）或tile（整页平铺重复）')
+    parser.add_argument('--tile-spacing', type=float, help='平铺时相邻文字之间的间距（点），默认为字体大小的两倍')
+    parser.add_argument('--image', help='图片水印（PNG/JPEG等，支持透明通道），绘制在页面中心')
+    parser.add_argument('--image-scale', type=float, default=0.5, help='图片宽度占页面宽度的比例')
+    parser.add_argument('--streaming', action='store_true', help='流式处理大文件，内存占用不随页数增长')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='并行处理的进程数；页数达到--parallel-min-pages时按页面区间拆分处理')
+    parser.add_argument('--parallel-min-pages', type=int, default=PARALLEL_MIN_PAGES,
+                        help='启用页面区间并行处理的最小页数')
+    parser.add_argument('--recipients',
+                        help='收件人列表（CSV或JSONL）；指定后为每个收件人生成一份输出，'
+                             '--text和--output中可使用收件人字段，如 "机密 {name} {date}"')
+    parser.add_argument('--group-size', type=int, default=100, help='个性化水印时每组一起渲染的收件人数量')
+    parser.add_argument('--incremental', action='store_true',
+                        help='以增量更新方式输出：保留原文件字节，只追加水印对象（输出与输入相同时直接追加）')
+    parser.add_argument('--chunk-pages', type=int, default=64, help='流式处理时每块的页数')
+    parser.add_argument('--max-memory', type=float, help='流式处理时的内存上限 (MB)')
+    parser.add_argument('--compress-level', type=int, choices=range(10), metavar='0-9',
+                        help='压缩未压缩的内容流（如逐页合并产生的内容）的zlib级别，0为不压缩')
+    parser.add_argument('--dedup', action='store_true', help='合并输出中内容完全相同的对象（如重复的字体和图片）')
+    parser.add_argument('--object-streams', action='store_true',
+                        help='把对象打包进对象流并使用交叉引用流（PDF 1.5），减小输出体积')
+    parser.add_argument('--linearize', action='store_true',
+                        help='以线性化（快速Web查看）布局输出：通过范围请求读取的阅读器只需下载文件开头就能显示第一页')
+    parser.add_argument('--stats', action='store_true', help='处理完成后输出各阶段耗时、页数、字节数和峰值内存')
+    parser.add_argument('--metrics-out', help='导出指标的文件（.json为JSON格式，否则为Prometheus文本格式）')
+    parser.add_argument('--profile', help='用cProfile分析本次处理，结果保存到此文件')
+    
+    args = parser.parse_args()
+    
+    # 解析颜色
+    color = tuple(map(int, args.color.split(',')))
+    
+    # 标准输入/输出：只有整体处理和流式处理支持管道
+    use_pipe = args.input == '-' or args.output == '-'
+    if use_pipe and (args.recipients or args.incremental or args.jobs > 1):
+        parser.error('--recipients、--incremental和--jobs不支持标准输入/输出')
+    # 体积优化和线性化会整体重写输出，与只追加的增量更新不能同时使用
+    optimize = optimize_options(args.compress_level, args.dedup, args.object_streams, args.linearize)
+    if not args.text and not args.image:
+        parser.error('需要--text或--image')
+    if args.image and not os.path.isfile(args.image):
+        parser.error(f'图片文件不存在: {args.image}')
+    if args.recipients and (args.layout != 'center' or args.image):
+        parser.error('--recipients只支持居中布局的文字水印')
+    if optimize and (args.recipients or args.incremental):
+        parser.error('--compress-level、--dedup、--object-streams和--linearize不支持--recipients和--incremental')
+    if args.linearize and args.object_streams:
+        parser.error('--linearize不能与--object-streams同时使用')
+    # 优化和线性化会把整个输出读入内存重写，流式处理的内存上限不再成立
+    if optimize and (args.streaming or args.max_memory is not None):
+        parser.error('--compress-level、--dedup、--object-streams和--linearize不支持--streaming和--max-memory')
+    # 字体族名或auto在系统字体索引中查找（个性化水印时需要覆盖每个收件人的文字）
+    text = args.text
+    if args.font and args.recipients and not os.path.exists(args.font):
+        from pdf_watermark import load_recipients, personalized_jobs
+        jobs = personalized_jobs(load_recipients(args.recipients), args.text, args.output)
+        text = "\n".join(job_text for _, job_text in jobs)
+    try:
+        args.font, args.font_index = resolve_font(args.font, text, args.font_index)
+    except ValueError as e:
+        parser.error(str(e))
+    input_pdf = sys.stdin.buffer if args.input == '-' else args.input
+    output_pdf = sys.stdout.buffer if args.output == '-' else args.output
+    
+    # 指标收集和性能分析
+    if args.stats or args.metrics_out:
+        metrics.enable()
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    
+    try:
+        with metrics.track_file(args.input, args.output):
+            _run_cli(args, color, input_pdf, output_pdf)
+    finally:
+        messages = sys.stderr if args.output == '-' else sys.stdout
+        if profiler is not None:
+            import pstats
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print(f"性能分析结果已保存到: {args.profile}", file=messages)
+            pstats.Stats(profiler, stream=messages).sort_stats("cumulative").print_stats(15)
+        if args.stats:
+            print(metrics.format_summary(), file=messages)
+        if args.metrics_out:
+            metrics.write_report(args.metrics_out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+系统字体索引
+
+扫描系统和用户的字体目录，只读取每个字体文件（.ttf/.otf/.ttc）的表目录、name表、cmap表和OS/2表，
+记录字体族名、样式、.ttc子字体索引和字符覆盖范围，不需要用reportlab完整加载字体。
+索引保存在磁盘上，以各字体目录的修改时间为键：目录没有变化时直接读取索引，
+有变化时只重新解析新增或修改过的文件。
+
+示例:
+    python pdf_watermark_fontindex.py --text "内部资料 请勿外传"
+    python pdf_watermark_fontindex.py --refresh
+"""
+
+import os
+import sys
+import json
+import mmap
+import bisect
+import struct
+import argparse
+import threading
+
+# 索引文件格式版本，格式变化时重新扫描
+INDEX_VERSION = 1
+
+FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+
+# 进程内缓存的索引: (字体目录元组, 索引文件路径) -> 字体列表
+_indexes = {}
+_index_lock = threading.Lock()
+
+def font_dirs():
+    """返回当前系统的标准字体目录（包括用户字体目录），只包含存在的目录"""
+    home = os.path.expanduser("~")
+    if sys.platform == "win32":
+        dirs = [os.path.join(os.environ.get("SystemRoot", "C:\\Windows"), "Fonts")]
+        if os.environ.get("LOCALAPPDATA"):
+            dirs.append(os.path.join(os.environ["LOCALAPPDATA"], "Microsoft", "Windows", "Fonts"))
+    elif sys.platform == "darwin":
+        dirs = ["/System/Library/Fonts", "/Library/Fonts", os.path.join(home, "Library", "Fonts")]
+    else:
+        data_home = os.environ.get("XDG_DATA_HOME") or os.path.join(home, ".local", "share")
+        dirs = ["/usr/share/fonts", "/usr/local/share/fonts", os.path.join(data_home, "fonts"),
+                os.path.join(home, ".fonts")]
+    return [d for d in dirs if os.path.isdir(d)]
+
+def default_index_path():
+    """返回默认的索引文件路径（用户缓存目录下）"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pdf_watermark", "font_index.json")
+
+def load_index(dirs=None, index_path=None, refresh=False):
+    """
+    返回字体列表，每项为字典:
+    path, index（.ttc子字体索引）, family, style, names（各语言的字体族名）,
+    ranges（覆盖的字符范围 [起始, 结束] 列表）, embeddable（reportlab能否嵌入）, size（文件大小）
+
+    同一组目录在进程内只加载一次，多线程同时调用也是安全的。
+
+    参数:
+    dirs: 字体目录列表，默认为font_dirs()
+    index_path: 索引文件路径，默认为default_index_path()；为空字符串时不读写磁盘
+    refresh: 忽略已有索引，重新解析全部字体文件
+    """
+    dirs = tuple(os.path.abspath(d) for d in (font_dirs() if dirs is None else dirs))
+    index_path = default_index_path() if index_path is None else index_path
+    key = (dirs, index_path)
+    fonts = None if refresh else _indexes.get(key)
+    if fonts is not None:
+        return fonts
+    with _index_lock:
+        fonts = None if refresh else _indexes.get(key)
+        if fonts is None:
+            fonts = _load(dirs, index_path, refresh)
+            # 各范围的起点，用于二分查找
+            for font in fonts:
+                font["_starts"] = [r[0] for r in font["ranges"]]
+            _indexes[key] = fonts
+    return fonts
+
+def _load(dirs, index_path, refresh):
+    saved = None
+    if index_path and not refresh:
+        try:
+            with open(index_path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = None
+        if saved and saved.get("version") == INDEX_VERSION and saved.get("roots") == list(dirs):
+            # 所有目录（包括子目录）的修改时间都没有变化时，文件列表不变，直接使用
+            if all(_mtime(d) == mtime for d, mtime in saved["dirs"].items()):
+                return saved["fonts"]
+        elif saved:
+            saved = None
+
+    # 未变化的文件沿用已有的解析结果
+    known = {}
+    for entry in (saved or {}).get("fonts", []) + (saved or {}).get("unusable", []):
+        known.setdefault((entry["path"], entry["mtime"], entry["size"]), []).append(entry)
+
+    dir_mtimes, fonts, unusable = {}, [], []
+    for root in dirs:
+        for current, subdirs, files in os.walk(root):
+            subdirs.sort()
+            dir_mtimes[current] = _mtime(current)
+            for name in sorted(files):
+                if not name.lower().endswith(FONT_EXTENSIONS):
+                    continue
+                path = os.path.join(current, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries = known.get((path, stat.st_mtime_ns, stat.st_size))
+                if entries is None:
+                    entries = _scan_file(path, stat)
+                for entry in entries:
+                    (fonts if entry["ranges"] else unusable).append(entry)
+
+    if index_path:
+        _save(index_path, {"version": INDEX_VERSION, "roots": list(dirs), "dirs": dir_mtimes,
+                           "fonts": fonts, "unusable": unusable})
+    return fonts
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _save(index_path, data):
+    # 先写临时文件再替换，多个进程同时更新时不会读到写了一半的索引
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temp_path, index_path)
+    except OSError:
+        # 缓存目录不可写时只在进程内使用索引
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def _scan_file(path, stat):
+    """解析一个字体文件，返回其中每个子字体的记录；无法解析的文件记录一个没有覆盖范围的条目"""
+    base = {"path": path, "mtime": stat.st_mtime_ns, "size": stat.st_size}
+    try:
+        # 只读取表目录和几个小表，用内存映射避免读入整个（可能有几十MB的）字体文件
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _scan_data(base, data)
+    except (OSError, struct.error, ValueError, IndexError):
+        return [dict(base, index=0, family=None, style=None, names=[], ranges=[], embeddable=False)]
+
+def _scan_data(base, data):
+    if data[:4] == b"ttcf":
+        count = struct.unpack_from(">I", data, 8)[0]
+        offsets = struct.unpack_from(f">{count}I", data, 12)
+    else:
+        offsets = (0,)
+    entries = []
+    for index, offset in enumerate(offsets):
+        entry = dict(base, index=index)
+        entry.update(_parse_font(data, offset))
+        entries.append(entry)
+    return entries
+
+def _parse_font(data, offset):
+    num_tables = struct.unpack_from(">H", data, offset + 4)[0]
+    tables = {}
+    for i in range(num_tables):
+        tag, _, table_offset, length = struct.unpack_from(">4sIII", data, offset + 12 + i * 16)
+        tables[tag] = (table_offset, length)
+    names = _parse_names(data, tables[b"name"][0]) if b"name" in tables else {}
+    # reportlab只能嵌入TrueType轮廓（glyf表）且许可允许嵌入的字体
+    embeddable = b"glyf" in tables
+    if b"OS/2" in tables:
+        fs_type = struct.unpack_from(">H", data, tables[b"OS/2"][0] + 8)[0]
+        embeddable = embeddable and (fs_type & 0x000F) != 2
+    families = names.get(16) or names.get(1) or [None]
+    styles = names.get(17) or names.get(2) or [None]
+    return {
+        "family": families[0],
+        "style": styles[0],
+        "names": sorted(set(names.get(1, []) + names.get(16, []))),
+        "ranges": _parse_cmap(data, tables[b"cmap"][0]) if b"cmap" in tables else [],
+        "embeddable": embeddable,
+    }
+
+def _parse_names(data, offset):
+    """返回 {名称编号: [名称, ...]}，英文名称排在最前"""
+    _, count, string_offset = struct.unpack_from(">HHH", data, offset)
+    found = {}
+    for i in range(count):
+        platform, encoding, language, name_id, length, name_offset = struct.unpack_from(
+            ">HHHHHH", data, offset + 6 + i * 12)
+        if name_id not in (1, 2, 16, 17):
+            continue
+        raw = data[offset + string_offset + name_offset:offset + string_offset + name_offset + length]
+        if platform in (0, 3):
+            value = raw.decode("utf-16-be", "replace")
+        elif platform == 1 and encoding == 0:
+            value = raw.decode("mac_roman", "replace")
+        else:
+            continue
+        english = (platform == 3 and language == 0x409) or (platform == 1 and language == 0)
+        found.setdefault(name_id, []).append((not english, value.strip("\x00 ")))
+    return {name_id: list(dict.fromkeys(value for _, value in sorted(values)))
+            for name_id, values in found.items()}
+
+def _parse_cmap(data, offset):
+    """返回字体覆盖的Unicode字符范围 [起始, 结束]（合并相邻范围）"""
+    count = struct.unpack_from(">H", data, offset + 2)[0]
+    subtables = {}
+    for i in range(count):
+        platform, encoding, sub_offset = struct.unpack_from(">HHI", data, offset + 4 + i * 8)
+        subtables[(platform, encoding)] = offset + sub_offset
+    # 优先使用完整Unicode（格式12）子表，其次是基本多文种平面（格式4）子表
+    for key in ((3, 10), (0, 6), (0, 4), (3, 1), (0, 3), (0, 2), (0, 1), (0, 0)):
+        if key not in subtables:
+            continue
+        sub = subtables[key]
+        fmt = struct.unpack_from(">H", data, sub)[0]
+        if fmt == 12:
+            return _merge(_format12(data, sub))
+        if fmt == 4:
+            return _merge(_format4(data, sub))
+    return []
+
+def _format12(data, sub):
+    groups = struct.unpack_from(">I", data, sub + 12)[0]
+    for i in range(groups):
+        start, end, _ = struct.unpack_from(">III", data, sub + 16 + i * 12)
+        yield start, end
+
+def _format4(data, sub):
+    seg_count = struct.unpack_from(">H", data, sub + 6)[0] // 2
+    ends = struct.unpack_from(f">{seg_count}H", data, sub + 14)
+    starts = struct.unpack_from(f">{seg_count}H", data, sub + 16 + seg_count * 2)
+    deltas = struct.unpack_from(f">{seg_count}h", data, sub + 16 + seg_count * 4)
+    range_offsets_at = sub + 16 + seg_count * 6
+    range_offsets = struct.unpack_from(f">{seg_count}H", data, range_offsets_at)
+    for i in range(seg_count):
+        start, end = starts[i], ends[i]
+        if start == 0xFFFF:
+            continue
+        if range_offsets[i] == 0:
+            # 只有映射到0号字形（.notdef）的字符不算覆盖
+            missing = (-deltas[i]) & 0xFFFF
+            if start <= missing <= end:
+                if start < missing:
+                    yield start, missing - 1
+                if missing < end:
+                    yield missing + 1, end
+            else:
+                yield start, end
+            continue
+        # 字形编号从glyphIdArray中读取，其中为0的字符没有字形
+        glyphs_at = range_offsets_at + i * 2 + range_offsets[i]
+        glyphs = struct.unpack_from(f">{end - start + 1}H", data, glyphs_at)
+        run = None
+        for code, glyph in enumerate(glyphs, start):
+            if glyph:
+                run = (run[0], code) if run else (code, code)
+            elif run:
+                yield run
+                run = None
+        if run:
+            yield run
+
+def _merge(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def covers(font, text):
+    """字体是否包含text中的全部字符（忽略空白和控制字符）"""
+    ranges = font["ranges"]
+    starts = font.get("_starts") or [r[0] for r in ranges]
+    for char in set(text):
+        if char.isspace() or ord(char) < 0x20:
+            continue
+        code = ord(char)
+        i = bisect.bisect_right(starts, code) - 1
+        if i < 0 or ranges[i][1] < code:
+            return False
+    return True
+
+def _matches(font, family):
+    family = family.lower()
+    return any(family in name.lower() for name in font["names"] if name)
+
+def find_fonts(text, family=None, dirs=None, index_path=None):
+    """
+    返回能嵌入且覆盖text中全部字符的字体列表，按优先顺序排列:
+    族名与family完全相同的优先，其次是常规样式，再次是文件较小（注册和嵌入更快）的字体
+
+    参数:
+    text: 水印文字
+    family: 只返回族名（任意语言）包含该字符串的字体，不区分大小写
+    dirs, index_path: 见load_index
+    """
+    candidates = [font for font in load_index(dirs, index_path)
+                  if font["embeddable"] and (not family or _matches(font, family)) and covers(font, text or "")]
+    regular = ("regular", "normal", "book", "roman", "medium")
+    family = (family or "").lower()
+    return sorted(candidates, key=lambda font: (family not in (name.lower() for name in font["names"] if name),
+                                                (font["style"] or "").lower() not in regular,
+                                                font["size"], font["path"], font["index"]))
+
+def find_font(text, family=None, dirs=None, index_path=None):
+    """返回覆盖text全部字符的首选字体 (路径, 子字体索引)，找不到时返回None；参数见find_fonts"""
+    fonts = find_fonts(text, family, dirs, index_path)
+    return (fonts[0]["path"], fonts[0]["index"]) if fonts else None
+
+def resolve_font(font, text, font_index=0, allow_paths=True):
+    """
+    把命令行的字体参数解析为 (字体文件路径, 子字体索引)
+
+    参数:
+    font: 字体文件路径；不存在的文件名（如 "simhei.ttf"）在字体目录中按文件名查找；
+          "auto" 表示自动选择覆盖水印文字的字体；其他值按字体族名查找；为None时使用默认字体
+    text: 水印文字（多段文字时用换行连接）
+    font_index: 指定字体文件时使用的子字体索引
+    allow_paths: 为False时只在字体索引中查找（如服务收到的请求参数），不访问任意路径，找不到时抛出ValueError
+    """
+    if not font or (allow_paths and os.path.exists(font)):
+        return font, font_index
+    if font.lower().endswith(FONT_EXTENSIONS):
+        name = os.path.basename(font).lower()
+        for entry in load_index():
+            if os.path.basename(entry["path"]).lower() == name:
+                return entry["path"], font_index
+        if not allow_paths:
+            raise ValueError(f"字体目录中没有字体文件: {font}")
+        # 找不到时保持原样，和以前一样回退到默认字体
+        return font, font_index
+    if not text and allow_paths:
+        return font, font_index
+    found = find_font(text or "", None if font == "auto" else font)
+    if found is None:
+        family = "" if font == "auto" else f"族名包含 '{font}' 且"
+        raise ValueError(f"找不到{family}包含全部水印文字的字体")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description='列出系统字体索引中的字体')
+    parser.add_argument('--text', help='只列出包含这些文字的全部字符的字体')
+    parser.add_argument('--family', help='只列出族名包含该字符串的字体')
+    parser.add_argument('--refresh', action='store_true', help='重新扫描全部字体文件')
+    parser.add_argument('--dir', action='append', help='字体目录（可多次指定），默认为系统和用户字体目录')
+    args = parser.parse_args()
+
+    fonts = load_index(args.dir, refresh=args.refresh)
+    if args.text or args.family:
+        fonts = find_fonts(args.text or "", args.family, args.dir)
+    for font in fonts:
+        index = f",{font['index']}" if font["path"].lower().endswith(".ttc") else ""
+        note = "" if font["embeddable"] else "  (不能嵌入)"
+        print(f"{font['family']} {font['style']}\t{font['path']}{index}{note}")
+    print(f"共 {len(fonts)} 个字体，索引文件: {default_index_path()}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+import threading
+import pdf_watermark_metrics as metrics
+
+# 未提供字体或字体文件不存在时使用的默认字体
+DEFAULT_FONT = "Helvetica"
+
+# 已注册的字体: (绝对路径, 修改时间, 子字体索引) -> reportlab字体名
+_registered_fonts = {}
+_font_lock = threading.Lock()
+
+def _font_key(font_path, subfont_index=0):
+    """生成字体缓存键 (绝对路径, 修改时间, 子字体索引)"""
+    path = os.path.abspath(font_path)
+    return (path, os.path.getmtime(path), int(subfont_index))
+
+def font_name_for(key):
+    """根据缓存键生成稳定且唯一的reportlab字体名，不同进程中结果相同"""
+    digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:12]
+    return f"WmFont_{digest}"
+
+def register_font(font_path, subfont_index=0):
+    """
+    注册字体并返回reportlab字体名
+
+    每个字体文件（按路径、修改时间和子字体索引区分）在进程内只解析一次，
+    CLI、批量工具和GUI共用同一份注册结果，多线程同时调用也是安全的。
+
+    参数:
+    font_path: 字体文件路径（.ttf/.otf/.ttc），为None或不存在时返回默认字体
+    subfont_index: .ttc字体集合中的子字体索引
+    """
+    if not font_path or not os.path.exists(font_path):
+        return DEFAULT_FONT
+
+    key = _font_key(font_path, subfont_index)
+    name = _registered_fonts.get(key)
+    if name is not None:
+        return name
+
+    with _font_lock:
+        name = _registered_fonts.get(key)
+        if name is None:
+            name = font_name_for(key)
+            with metrics.stage("font"):
+                # reportlab只在第一次注册字体时导入
+                from reportlab.pdfbase import pdfmetrics
+                from reportlab.pdfbase.ttfonts import TTFont
+                pdfmetrics.registerFont(TTFont(name, key[0], subfontIndex=key[2]))
+            _registered_fonts[key] = name
+    return name
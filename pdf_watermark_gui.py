@@ -3,12 +3,14 @@
 
 import os
 import sys
+import time
+import queue
 import tkinter as tk
 from tkinter import filedialog, colorchooser, ttk, messagebox
 from tkinter.scrolledtext import ScrolledText
 import threading
-from pdf_watermark import create_watermark, add_watermark
-import tempfile
+from pdf_watermark_fontindex import find_font, find_fonts, load_index
+from pdf_watermark_preview import cached_background, page_background, render_preview
 
 # 常用中文字体及其文件名
 COMMON_FONTS = {
@@ -24,49 +26,91 @@ COMMON_FONTS = {
     "华文楷体 (STKaiti)": "STKAITI.TTF"
 }
 
+# 用于筛选中文字体的示例文字
+CJK_SAMPLE = "中文水印"
+
+# 默认同时处理的文件数
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+# 处理过程中每隔多少毫秒从任务队列中取出进度事件
+POLL_INTERVAL_MS = 100
+
+# 参数停止变化多少毫秒后更新预览（拖动滑块时不会每一步都渲染）
+PREVIEW_DELAY_MS = 80
+
 def find_font_path(font_name):
-    """查找字体文件的完整路径"""
-    # Windows 默认字体目录
-    font_dir = os.path.join(os.environ.get('SystemRoot', 'C:\\Windows'), 'Fonts')
-    font_path = os.path.join(font_dir, font_name)
-    
-    if os.path.exists(font_path):
-        return font_path
+    """在系统和用户字体目录（包括子目录）中按文件名查找字体文件的完整路径"""
+    name = font_name.lower()
+    for font in load_index():
+        if os.path.basename(font["path"]).lower() == name:
+            return font["path"]
     return None
 
 class PDFWatermarkGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("PDF水印工具")
-        self.root.geometry("600x550")
+        self.root.geometry("1000x700")
         self.root.resizable(True, True)
         
         # 设置样式
         self.style = ttk.Style()
         self.style.configure("TButton", padding=6, relief="flat", background="#ccc")
         
+        # 预览区域（右侧）
+        preview_frame = ttk.LabelFrame(root, text="预览", padding="5")
+        preview_frame.pack(side=tk.RIGHT, fill=tk.Y, padx=(0, 10), pady=10)
+        
+        self.preview_label = ttk.Label(preview_frame, anchor=tk.CENTER)
+        self.preview_label.pack(fill=tk.BOTH, expand=True)
+        self.preview_info = tk.StringVar()
+        ttk.Label(preview_frame, textvariable=self.preview_info).pack(anchor=tk.W)
+        
         # 创建主框架
         main_frame = ttk.Frame(root, padding="10")
-        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
-        # 输入文件
-        input_frame = ttk.Frame(main_frame)
+        # 输入文件列表（可以添加多个文件和文件夹）
+        input_frame = ttk.LabelFrame(main_frame, text="输入PDF文件和文件夹")
         input_frame.pack(fill=tk.X, pady=5)
         
-        ttk.Label(input_frame, text="输入PDF文件:").pack(side=tk.LEFT)
+        list_frame = ttk.Frame(input_frame)
+        list_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.input_list = tk.Listbox(list_frame, height=4, selectmode=tk.EXTENDED)
+        self.input_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        input_scroll = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.input_list.yview)
+        input_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.input_list.configure(yscrollcommand=input_scroll.set)
+        self.input_list.bind('<<ListboxSelect>>', lambda e: self.update_preview_input())
+        
+        input_buttons = ttk.Frame(input_frame)
+        input_buttons.pack(side=tk.RIGHT, fill=tk.Y, padx=5, pady=5)
+        ttk.Button(input_buttons, text="添加文件...", command=self.browse_input).pack(fill=tk.X)
+        ttk.Button(input_buttons, text="添加文件夹...", command=self.browse_input_dir).pack(fill=tk.X, pady=2)
+        ttk.Button(input_buttons, text="移除", command=self.remove_inputs).pack(fill=tk.X)
+        ttk.Button(input_buttons, text="清空", command=self.clear_inputs).pack(fill=tk.X, pady=2)
+        
+        # 预览使用的PDF文件（列表中选中的文件或第一个文件）
         self.input_path = tk.StringVar()
-        ttk.Entry(input_frame, textvariable=self.input_path).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-        ttk.Button(input_frame, text="浏览...", command=self.browse_input).pack(side=tk.RIGHT)
         
-        # 输出文件
+        # 输出文件夹
         output_frame = ttk.Frame(main_frame)
         output_frame.pack(fill=tk.X, pady=5)
         
-        ttk.Label(output_frame, text="输出PDF文件:").pack(side=tk.LEFT)
+        ttk.Label(output_frame, text="输出文件夹:").pack(side=tk.LEFT)
         self.output_path = tk.StringVar()
         ttk.Entry(output_frame, textvariable=self.output_path).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
         ttk.Button(output_frame, text="浏览...", command=self.browse_output).pack(side=tk.RIGHT)
         
+        # 同时处理的文件数
+        workers_frame = ttk.Frame(main_frame)
+        workers_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(workers_frame, text="同时处理的文件数:").pack(side=tk.LEFT)
+        self.workers = tk.IntVar(value=DEFAULT_WORKERS)
+        ttk.Spinbox(workers_frame, from_=1, to=max(DEFAULT_WORKERS, os.cpu_count() or 1), width=5,
+                    textvariable=self.workers).pack(side=tk.LEFT, padx=5)
+        
         # 水印文字
         text_frame = ttk.Frame(main_frame)
         text_frame.pack(fill=tk.X, pady=5)
@@ -85,6 +129,15 @@ class PDFWatermarkGUI:
         ttk.Button(font_frame, text="浏览...", command=self.browse_font).pack(side=tk.RIGHT)
         ttk.Button(font_frame, text="选择中文字体", command=self.choose_chinese_font).pack(side=tk.RIGHT, padx=5)
         
+        # 图片水印
+        image_frame = ttk.Frame(main_frame)
+        image_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(image_frame, text="图片水印:").pack(side=tk.LEFT)
+        self.image_path = tk.StringVar()
+        ttk.Entry(image_frame, textvariable=self.image_path).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Button(image_frame, text="浏览...", command=self.browse_image).pack(side=tk.RIGHT)
+        
         # 参数设置框架
         params_frame = ttk.LabelFrame(main_frame, text="水印参数")
         params_frame.pack(fill=tk.X, pady=10)
@@ -131,7 +184,10 @@ class PDFWatermarkGUI:
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill=tk.X, pady=10)
         
-        ttk.Button(button_frame, text="添加水印", command=self.add_watermark_thread).pack(side=tk.RIGHT)
+        self.cancel_button = ttk.Button(button_frame, text="取消", command=self.cancel_jobs, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, padx=5)
+        self.start_button = ttk.Button(button_frame, text="添加水印", command=self.start_jobs)
+        self.start_button.pack(side=tk.RIGHT)
         
         # 日志区域
         log_frame = ttk.LabelFrame(main_frame, text="日志")
@@ -140,44 +196,113 @@ class PDFWatermarkGUI:
         self.log_text = ScrolledText(log_frame, height=10)
         self.log_text.pack(fill=tk.BOTH, expand=True)
         
-        # 进度条
-        self.progress = ttk.Progressbar(main_frame, orient=tk.HORIZONTAL, mode='indeterminate')
+        # 进度条（按页数）和进度信息
+        self.progress = ttk.Progressbar(main_frame, orient=tk.HORIZONTAL, mode='determinate')
         self.progress.pack(fill=tk.X, pady=5)
+        self.progress_info = tk.StringVar()
+        ttk.Label(main_frame, textvariable=self.progress_info).pack(anchor=tk.W)
         
-        # 加载可用的中文字体
+        # 正在运行的任务（WatermarkJobQueue）
+        self.job = None
+        
+        # 加载可用的中文字体: 显示名 -> (字体文件路径, 子字体索引)
         self.available_fonts = {}
+        # 在字体对话框中选择的 (字体文件路径, 子字体索引)
+        self.font_choice = (None, 0)
         self.load_available_fonts()
+        
+        # 参数变化时更新预览
+        self._preview_job = None
+        self._preview_photo = None
+        self._loading_background = None
+        for var in (self.input_path, self.watermark_text, self.font_path, self.image_path,
+                    self.opacity, self.angle, self.font_size):
+            var.trace_add("write", lambda *_: self.schedule_preview())
+        self.schedule_preview()
     
     def load_available_fonts(self):
-        """加载可用的中文字体"""
-        for font_name, font_file in COMMON_FONTS.items():
-            font_path = find_font_path(font_file)
-            if font_path:
-                self.available_fonts[font_name] = font_path
+        """在后台线程中加载可用的中文字体（字体索引已缓存在磁盘上时几乎立即完成）"""
+        self.font_loader = threading.Thread(target=self._load_fonts, daemon=True)
+        self.font_loader.start()
+    
+    def _load_fonts(self):
+        common = {font_file.lower(): font_name for font_name, font_file in COMMON_FONTS.items()}
+        fonts = {}
+        for font in find_fonts(CJK_SAMPLE):
+            name = common.get(os.path.basename(font["path"]).lower()) if font["index"] == 0 else None
+            if name is None:
+                name = f"{' / '.join(font['names']) or font['family']} ({font['style']})"
+            if name in fonts:
+                name = f"{name} [{os.path.basename(font['path'])},{font['index']}]"
+            fonts[name] = (font["path"], font["index"])
+        # 整体替换，主线程不会看到加载了一半的字典
+        self.available_fonts = dict(sorted(fonts.items()))
     
     def browse_input(self):
-        filename = filedialog.askopenfilename(filetypes=[("PDF文件", "*.pdf"), ("所有文件", "*.*")])
-        if filename:
-            self.input_path.set(filename)
-            # 自动设置输出文件名
-            if not self.output_path.get():
-                base, ext = os.path.splitext(filename)
-                self.output_path.set(f"{base}_watermarked{ext}")
+        filenames = filedialog.askopenfilenames(filetypes=[("PDF文件", "*.pdf"), ("所有文件", "*.*")])
+        for filename in filenames:
+            self.add_input(filename)
+    
+    def browse_input_dir(self):
+        dirname = filedialog.askdirectory()
+        if dirname:
+            self.add_input(dirname)
+    
+    def add_input(self, path):
+        if path in self.input_list.get(0, tk.END):
+            return
+        self.input_list.insert(tk.END, path)
+        # 自动设置输出文件夹
+        if not self.output_path.get():
+            base = path if os.path.isdir(path) else os.path.dirname(path)
+            self.output_path.set(os.path.join(base, "watermarked"))
+        self.update_preview_input()
+    
+    def remove_inputs(self):
+        for index in reversed(self.input_list.curselection()):
+            self.input_list.delete(index)
+        self.update_preview_input()
+    
+    def clear_inputs(self):
+        self.input_list.delete(0, tk.END)
+        self.update_preview_input()
+    
+    def update_preview_input(self):
+        """预览列表中选中的PDF文件，没有选中时预览第一个文件"""
+        paths = self.input_list.get(0, tk.END)
+        selection = self.input_list.curselection()
+        if selection:
+            paths = [paths[selection[0]]] + list(paths)
+        preview = ""
+        for path in paths:
+            if os.path.isfile(path):
+                preview = path
+                break
+        if preview != self.input_path.get():
+            self.input_path.set(preview)
     
     def browse_output(self):
-        filename = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF文件", "*.pdf"), ("所有文件", "*.*")])
-        if filename:
-            self.output_path.set(filename)
+        dirname = filedialog.askdirectory()
+        if dirname:
+            self.output_path.set(dirname)
     
     def browse_font(self):
         filename = filedialog.askopenfilename(filetypes=[("字体文件", "*.ttf;*.otf;*.ttc"), ("所有文件", "*.*")])
         if filename:
             self.font_path.set(filename)
     
+    def browse_image(self):
+        filename = filedialog.askopenfilename(filetypes=[("图片文件", "*.png;*.jpg;*.jpeg"), ("所有文件", "*.*")])
+        if filename:
+            self.image_path.set(filename)
+    
     def choose_chinese_font(self):
         """打开中文字体选择对话框"""
         if not self.available_fonts:
-            messagebox.showwarning("警告", "未找到可用的中文字体！")
+            if self.font_loader.is_alive():
+                messagebox.showinfo("提示", "正在扫描系统字体，请稍后再试")
+            else:
+                messagebox.showwarning("警告", "未找到可用的中文字体！")
             return
         
         # 创建字体选择对话框
@@ -220,9 +345,10 @@ class PDFWatermarkGUI:
             if font_listbox.curselection():
                 index = font_listbox.curselection()[0]
                 font_name = font_listbox.get(index)
-                font_path = self.available_fonts.get(font_name)
+                font_path, font_index = self.available_fonts.get(font_name, (None, 0))
                 if font_path:
                     self.font_path.set(font_path)
+                    self.font_choice = (font_path, font_index)
                     self.log(f"已选择字体: {font_name} ({font_path})")
                     font_dialog.destroy()
         
@@ -231,7 +357,7 @@ class PDFWatermarkGUI:
             if font_listbox.curselection():
                 index = font_listbox.curselection()[0]
                 font_name = font_listbox.get(index)
-                font_path = self.available_fonts.get(font_name)
+                font_path = self.available_fonts.get(font_name, (None, 0))[0]
                 if font_path:
                     try:
                         # 获取字体文件名
@@ -253,69 +379,192 @@ class PDFWatermarkGUI:
         if color and color[0]:
             self.color = color
             self.color_preview.config(bg=color[1])
+            self.schedule_preview()
+    
+    def watermark_font(self, text):
+        """返回水印使用的 (字体文件路径, 子字体索引)；未指定字体且默认字体不能显示水印文字时自动选择系统字体"""
+        font_path = self.font_path.get() or None
+        # 对话框中选择的.ttc字体使用对应的子字体
+        font_index = self.font_choice[1] if font_path == self.font_choice[0] else 0
+        if not font_path and text and any(ord(char) > 0xFF for char in text):
+            found = find_font(text)
+            if found:
+                return found
+        return font_path, font_index
+    
+    def schedule_preview(self):
+        """参数变化后延迟更新预览，连续拖动滑块时只在停顿后渲染一次"""
+        if self._preview_job is not None:
+            self.root.after_cancel(self._preview_job)
+        self._preview_job = self.root.after(PREVIEW_DELAY_MS, self.update_preview)
+    
+    def update_preview(self):
+        """在缩小的第一页上绘制水印（页面背景、字体和文字蒙版都有缓存，每次更新只需几毫秒）"""
+        self._preview_job = None
+        input_pdf = self.input_path.get()
+        if os.path.isfile(input_pdf):
+            background = cached_background(input_pdf)
+            if background is None:
+                self._load_background(input_pdf)
+                return
+        else:
+            background = page_background(None)
+        
+        try:
+            text = self.watermark_text.get()
+            font_path, font_index = self.watermark_font(text)
+            image_path = self.image_path.get()
+            start = time.perf_counter()
+            image = render_preview(
+                *background,
+                text,
+                font_path=font_path,
+                font_index=font_index,
+                font_size=self.font_size.get(),
+                opacity=self.opacity.get(),
+                angle=self.angle.get(),
+                color=self.color[0],
+                image_path=image_path if os.path.isfile(image_path) else None
+            )
+        except tk.TclError:
+            # 输入框中的数值还不完整，保留上一次的预览
+            return
+        except Exception as e:
+            self.preview_info.set(f"无法预览: {str(e)}")
+            return
+        
+        from PIL import ImageTk
+        self._preview_photo = ImageTk.PhotoImage(image)
+        self.preview_label.configure(image=self._preview_photo)
+        self.preview_info.set(f"预览耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+    
+    def _load_background(self, pdf_path):
+        """在后台线程中栅格化第一页，完成后更新预览"""
+        self.preview_info.set("正在加载预览...")
+        if self._loading_background == pdf_path:
+            return
+        self._loading_background = pdf_path
+        errors = []
+        
+        def load():
+            try:
+                page_background(pdf_path)
+            except Exception as e:
+                errors.append(str(e))
+        
+        thread = threading.Thread(target=load, daemon=True)
+        thread.start()
+        
+        # Tk控件只在主线程中访问：轮询后台线程是否完成
+        def poll():
+            if thread.is_alive():
+                self.root.after(50, poll)
+                return
+            self._loading_background = None
+            if errors:
+                self.preview_info.set(f"无法预览: {errors[0]}")
+            elif self.input_path.get() == pdf_path:
+                self.schedule_preview()
+        
+        self.root.after(50, poll)
     
     def log(self, message):
         self.log_text.insert(tk.END, message + "\n")
         self.log_text.see(tk.END)
     
-    def add_watermark_thread(self):
+    def start_jobs(self):
         # 验证输入
-        if not self.input_path.get():
-            self.log("错误: 请选择输入PDF文件")
+        inputs = list(self.input_list.get(0, tk.END))
+        if not inputs:
+            self.log("错误: 请添加输入PDF文件或文件夹")
             return
         
         if not self.output_path.get():
-            self.log("错误: 请指定输出PDF文件")
+            self.log("错误: 请指定输出文件夹")
             return
         
-        if not self.watermark_text.get():
-            self.log("错误: 请输入水印文字")
+        if not self.watermark_text.get() and not self.image_path.get():
+            self.log("错误: 请输入水印文字或选择图片")
             return
         
-        # 启动线程处理，避免UI冻结
-        threading.Thread(target=self.add_watermark_process).start()
-    
-    def add_watermark_process(self):
         try:
-            # 显示进度条
-            self.root.after(0, lambda: self.progress.start())
-            
-            self.log(f"正在处理: {os.path.basename(self.input_path.get())}")
-            
-            # 创建临时文件用于保存水印PDF
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-                temp_filename = temp_file.name
-            
+            workers = max(1, self.workers.get())
+            text = self.watermark_text.get()
+            params = dict(font_size=self.font_size.get(), opacity=self.opacity.get(), angle=self.angle.get())
+        except tk.TclError as e:
+            self.log(f"错误: 参数无效: {str(e)}")
+            return
+        font_path, font_index = self.watermark_font(text)
+        if font_path and not self.font_path.get():
+            self.log(f"自动选择字体: {font_path}")
+        
+        # 任务在后台线程中运行，进度通过线程安全的事件队列传回主循环，处理时界面不会冻结
+        from pdf_watermark_queue import WatermarkJobQueue
+        self.job = WatermarkJobQueue(
+            inputs,
+            self.output_path.get(),
+            workers=workers,
+            text=text,
+            font_path=font_path,
+            font_index=font_index,
+            color=self.color[0],
+            image_path=self.image_path.get() or None,
+            **params
+        )
+        self.start_button.configure(state=tk.DISABLED)
+        self.cancel_button.configure(state=tk.NORMAL)
+        self.progress.configure(value=0, maximum=1)
+        self.total_files = self.total_pages = 0
+        self.progress_info.set("正在查找文件...")
+        self.log(f"开始处理，同时处理 {workers} 个文件")
+        self.job.start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_jobs)
+    
+    def cancel_jobs(self):
+        if self.job is not None:
+            self.job.cancel()
+            self.cancel_button.configure(state=tk.DISABLED)
+            self.progress_info.set("正在取消...")
+    
+    def poll_jobs(self):
+        """在主线程中取出任务队列中的全部事件并更新界面"""
+        job = self.job
+        if job is None:
+            return
+        while True:
             try:
-                # 创建水印
-                self.log("正在创建水印...")
-                create_watermark(
-                    text=self.watermark_text.get(),
-                    output_path=temp_filename,
-                    font_path=self.font_path.get() if self.font_path.get() else None,
-                    font_size=self.font_size.get(),
-                    opacity=self.opacity.get(),
-                    angle=self.angle.get(),
-                    color=self.color[0]
-                )
-                
-                # 添加水印到PDF
-                self.log("正在添加水印到PDF...")
-                add_watermark(self.input_path.get(), self.output_path.get(), temp_filename)
-                
-                self.log(f"水印已成功添加。输出文件: {self.output_path.get()}")
-            
-            finally:
-                # 删除临时文件
-                if os.path.exists(temp_filename):
-                    os.unlink(temp_filename)
-        
-        except Exception as e:
-            self.log(f"错误: {str(e)}")
-        
-        finally:
-            # 停止进度条
-            self.root.after(0, lambda: self.progress.stop())
+                event = job.events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event[0]
+            if kind == "scanned":
+                _, self.total_files = event
+                self.log(f"共 {self.total_files} 个文件")
+            elif kind == "progress":
+                # 总页数随文件开始处理逐步确定
+                _, pages, files, self.total_pages, seconds = event
+                self.progress.configure(maximum=max(1, self.total_pages, pages), value=pages)
+                rate = pages / seconds if seconds > 0 else 0
+                self.progress_info.set(f"文件 {files}/{self.total_files}，{pages}/{self.total_pages} 页，"
+                                       f"{rate:.1f} 页/秒")
+            elif kind == "file":
+                _, input_file, output_file, status, error = event
+                if status == "ok":
+                    self.log(f"完成: {output_file}")
+                elif status == "cancelled":
+                    self.log(f"已取消: {input_file}")
+                else:
+                    self.log(f"错误: {input_file or ''} {error}")
+            elif kind == "finished":
+                summary = event[1]
+                self.log(f"处理结束: 成功 {summary['ok']}，失败 {summary['failed']}，取消 {summary['cancelled']}，"
+                         f"用时 {summary['seconds']:.1f} 秒")
+                self.progress_info.set(f"{summary['pages']} 页，{summary['seconds']:.1f} 秒")
+                self.job = None
+                self.start_button.configure(state=tk.NORMAL)
+                self.cancel_button.configure(state=tk.DISABLED)
+                return
+        self.root.after(POLL_INTERVAL_MS, self.poll_jobs)
 
 def main():
     root = tk.Tk()
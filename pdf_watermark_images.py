@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import math
+import zlib
+import hashlib
+import threading
+from PyPDF2 import PageObject, PdfReader, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, FloatObject, NameObject, NumberObject
+import pdf_watermark_metrics as metrics
+
+# 图片水印的目标分辨率（像素/英寸），更大的图片先缩小到该分辨率
+IMAGE_DPI = 150
+
+# 计算像素尺寸时使用的参考页面宽度（点，A3纵向）。像素尺寸与实际页面尺寸无关，
+# 所有页面几何共用同一张图片，显示尺寸由变换矩阵缩放
+REFERENCE_WIDTH = 842
+
+# 缓存的条目数量上限，超出时淘汰最早的条目
+MAX_IMAGES = 16
+MAX_FILES = 256
+
+# 已编码的图片: (内容SHA-1, 目标宽, 目标高) -> WatermarkImage
+_images = {}
+# 图片文件: (绝对路径, 修改时间ns, 大小) -> (内容SHA-1, 原图像素尺寸)
+_files = {}
+_image_lock = threading.Lock()
+
+def _remember(cache, key, value, max_entries):
+    """在持有_image_lock时加入缓存，超出上限时淘汰最早的条目"""
+    if len(cache) >= max_entries:
+        del cache[next(iter(cache))]
+    cache[key] = value
+
+class WatermarkImage:
+    """
+    解码、缩放并编码好的图片，可以直接写成PDF图片XObject
+
+    data为压缩后的像素数据（未缩放的JPEG原样保留），alpha为透明通道（没有时为None）
+    """
+
+    def __init__(self, width, height, color_space, data, filter_name, alpha=None):
+        self.width = width
+        self.height = height
+        self.color_space = color_space
+        self.data = data
+        self.filter = filter_name
+        self.alpha = alpha
+        self._shared = None
+        self._shared_lock = threading.Lock()
+
+    def xobject(self, writer):
+        """把图片（及其SMask）加入writer，返回图片XObject的间接引用"""
+        image = self._stream(self.data, self.color_space, self.filter)
+        if self.alpha is not None:
+            image[NameObject("/SMask")] = writer._add_object(
+                self._stream(self.alpha, "/DeviceGray", "/FlateDecode"))
+        return writer._add_object(image)
+
+    def shared_xobject(self):
+        """
+        返回图片在一份只读的内存PDF中的XObject引用
+
+        各页面几何的水印页面都引用这同一个对象，写入器按来源对象转换引用，
+        所以同一份输出中无论有多少种页面尺寸，图片只嵌入一次。
+        """
+        with self._shared_lock:
+            if self._shared is None:
+                writer = PdfWriter()
+                page = PageObject.create_blank_page(writer, 1, 1)
+                page[NameObject("/Resources")] = DictionaryObject({
+                    NameObject("/XObject"): DictionaryObject({NameObject("/WmImg"): self.xobject(writer)}),
+                })
+                writer.add_page(page)
+                buffer = io.BytesIO()
+                writer.write(buffer)
+                ref = PdfReader(buffer).pages[0]["/Resources"]["/XObject"].raw_get("/WmImg")
+                # 预先解析，之后多线程共享读取时不再访问底层文件流
+                image = ref.get_object()
+                if "/SMask" in image:
+                    image["/SMask"].get_object()
+                self._shared = ref
+        return self._shared
+
+    def _stream(self, data, color_space, filter_name):
+        # 数据已经编码，直接设置_data并声明/Filter，避免再次压缩
+        stream = DecodedStreamObject()
+        stream._data = data
+        stream.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Image"),
+            NameObject("/Width"): NumberObject(self.width),
+            NameObject("/Height"): NumberObject(self.height),
+            NameObject("/ColorSpace"): NameObject(color_space),
+            NameObject("/BitsPerComponent"): NumberObject(8),
+            NameObject("/Filter"): NameObject(filter_name),
+        })
+        return stream
+
+def _image_info(image_path):
+    """返回 (内容SHA-1, 原图像素尺寸)；同一文件（按路径、修改时间和大小区分）在进程内只读取一次"""
+    stat = os.stat(image_path)
+    key = (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+    info = _files.get(key)
+    if info is None:
+        from PIL import Image
+        with open(image_path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        with Image.open(image_path) as img:
+            info = (digest, img.size)
+        with _image_lock:
+            _remember(_files, key, info, MAX_FILES)
+    return info
+
+def image_digest(image_path):
+    """返回图片文件内容的SHA-1，用作缓存键"""
+    return _image_info(image_path)[0]
+
+def target_size(image_path, width):
+    """
+    返回显示宽度为width点时图片的目标像素尺寸 (宽, 高)，不超过原图尺寸
+
+    参数:
+    image_path: 图片文件路径
+    width: 图片在页面上的显示宽度（点）
+    """
+    original = _image_info(image_path)[1]
+    pixels = min(original[0], max(1, round(width / 72 * IMAGE_DPI)))
+    return pixels, max(1, round(original[1] * pixels / original[0]))
+
+def template_size(image_path, scale):
+    """
+    返回图片水印使用的像素尺寸，只取决于图片和缩放比例，与页面尺寸无关
+
+    参数:
+    image_path: 图片文件路径
+    scale: 图片显示宽度占页面宽度的比例
+    """
+    return target_size(image_path, REFERENCE_WIDTH * scale)
+
+def load_image(image_path, size):
+    """
+    解码、缩放并编码图片，返回WatermarkImage
+
+    每张图片（按内容摘要和目标尺寸区分）在进程内只处理一次，之后所有水印页面和输出文件
+    都复用同一份编码结果，多线程同时调用也是安全的。
+
+    参数:
+    image_path: PNG/JPEG等图片文件路径
+    size: 目标像素尺寸 (宽, 高)
+    """
+    key = (image_digest(image_path),) + tuple(size)
+    image = _images.get(key)
+    if image is not None:
+        return image
+    with _image_lock:
+        image = _images.get(key)
+        if image is None:
+            with metrics.stage("image"):
+                image = _encode(image_path, tuple(size))
+            _remember(_images, key, image, MAX_IMAGES)
+    return image
+
+def _encode(image_path, size):
+    from PIL import Image
+    with Image.open(image_path) as img:
+        # 不需要缩放的RGB/灰度JPEG直接使用原始的DCT数据
+        if img.format == "JPEG" and img.mode in ("RGB", "L") and img.size == size:
+            with open(image_path, 'rb') as f:
+                data = f.read()
+            return WatermarkImage(size[0], size[1], "/DeviceRGB" if img.mode == "RGB" else "/DeviceGray",
+                                  data, "/DCTDecode")
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        if has_alpha:
+            img = img.convert("RGBA")
+        elif img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        if img.size != size:
+            img = img.resize(size, Image.Resampling.LANCZOS)
+        alpha = None
+        if has_alpha:
+            alpha = zlib.compress(img.getchannel("A").tobytes())
+            img = img.convert("RGB")
+        color_space = "/DeviceGray" if img.mode == "L" else "/DeviceRGB"
+        return WatermarkImage(size[0], size[1], color_space, zlib.compress(img.tobytes()), "/FlateDecode", alpha)
+
+def image_placement(page_width, page_height, width, height, angle=0):
+    """
+    返回把单位正方形中的图片绘制到页面中心所用的变换矩阵
+
+    参数:
+    page_width, page_height: 页面尺寸
+    width, height: 图片显示尺寸（点）
+    angle: 绕图片中心逆时针旋转的角度
+    """
+    sin, cos = math.sin(math.radians(angle)), math.cos(math.radians(angle))
+    a, b = width * cos, width * sin
+    c, d = -height * sin, height * cos
+    return [a, b, c, d, page_width / 2 - (a + c) / 2, page_height / 2 - (b + d) / 2]
+
+def opacity_state(opacity):
+    """透明度的ExtGState字典"""
+    return DictionaryObject({
+        NameObject("/Type"): NameObject("/ExtGState"),
+        NameObject("/ca"): FloatObject(opacity),
+        NameObject("/CA"): FloatObject(opacity),
+    })
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+# 默认日志文件名，保存在输出目录中
+JOURNAL_NAME = ".pdf_watermark_journal.sqlite"
+
+# 任务状态
+DONE = "done"
+FAILED = "failed"
+
+def params_key(**params):
+    """
+    根据水印参数生成稳定的摘要，参数变化后已有的输出不再视为最新
+
+    字体文件和水印PDF按路径、大小和修改时间计入，文件被替换后同样会重新处理
+    """
+    normalized = {}
+    for name, value in sorted(params.items()):
+        if name in ("font_path", "watermark_file") and value and os.path.exists(value):
+            stat = os.stat(value)
+            value = [os.path.abspath(value), stat.st_size, stat.st_mtime_ns]
+        elif isinstance(value, tuple):
+            value = list(value)
+        normalized[name] = value
+    data = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+def fingerprint(path, hash_content=False):
+    """
+    返回输入文件的指纹 (大小, 修改时间ns, 内容SHA-1或None)
+
+    参数:
+    path: 文件路径
+    hash_content: 是否计算内容摘要（文件被复制或touch后修改时间变化，但内容相同时仍可跳过）
+    """
+    stat = os.stat(path)
+    digest = None
+    if hash_content:
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha1.update(chunk)
+        digest = sha1.hexdigest()
+    return stat.st_size, stat.st_mtime_ns, digest
+
+class BatchJournal:
+    """
+    批量处理的任务日志（SQLite）
+
+    按输入文件路径记录输入指纹、水印参数摘要、输出路径和处理结果。
+    重新运行时跳过输出已是最新的文件，中断后可以继续，也可以只重试失败的文件。
+    只应在一个线程中使用（批量工具在主线程中查询和记录）。
+    """
+
+    # 累计这么多条记录或超过commit_interval秒后提交一次
+    commit_every = 100
+    commit_interval = 2.0
+
+    def __init__(self, path):
+        """
+        参数:
+        path: 日志文件路径，不存在时创建
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " input TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha1 TEXT,"
+            " params TEXT, output TEXT, status TEXT, error TEXT, updated REAL)"
+        )
+        self._conn.commit()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _get(self, input_file):
+        return self._conn.execute(
+            "SELECT size, mtime_ns, sha1, params, output, status FROM jobs WHERE input = ?",
+            (os.path.abspath(input_file),)
+        ).fetchone()
+
+    def is_up_to_date(self, input_file, output_file, params, fingerprint):
+        """
+        判断文件是否已经用相同参数成功处理过且输入未变化、输出仍然存在
+
+        参数:
+        input_file: 输入文件路径
+        output_file: 输出文件路径
+        params: params_key返回的参数摘要
+        fingerprint: fingerprint返回的输入指纹
+        """
+        row = self._get(input_file)
+        if row is None:
+            return False
+        size, mtime_ns, sha1, old_params, old_output, status = row
+        if status != DONE or old_params != params or not os.path.exists(output_file):
+            return False
+        if os.path.abspath(output_file) != old_output or size != fingerprint[0]:
+            return False
+        return mtime_ns == fingerprint[1] or (sha1 is not None and sha1 == fingerprint[2])
+
+    def has_failed(self, input_file):
+        """上次处理该文件是否失败"""
+        row = self._get(input_file)
+        return row is not None and row[5] == FAILED
+
+    def record(self, input_file, output_file, params, fingerprint, error=None):
+        """
+        记录一个文件的处理结果
+
+        参数:
+        error: 错误信息；为None表示成功
+        其余参数与is_up_to_date相同
+        """
+        self._conn.execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (os.path.abspath(input_file), fingerprint[0], fingerprint[1], fingerprint[2], params,
+             os.path.abspath(output_file), FAILED if error else DONE, error, time.time())
+        )
+        self._uncommitted += 1
+        if (self._uncommitted >= self.commit_every
+                or time.monotonic() - self._last_commit >= self.commit_interval):
+            self.commit()
+
+    def commit(self):
+        self._conn.commit()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        if self._conn is not None:
+            self.commit()
+            self._conn.close()
+            self._conn = None
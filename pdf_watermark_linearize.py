@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+线性化（快速Web查看）输出
+
+按PDF规范附录F的布局重写PDF，使阅读器通过HTTP范围请求只下载文件开头的一小段就能显示第一页:
+
+1. 文件头和线性化参数字典（/L 文件长度、/H 提示流位置、/O 第一页页面对象、/E 第一页结束位置、/N 页数、
+   /T 主交叉引用表位置）
+2. 第一页交叉引用表和trailer（只包含第一页部分的对象，/Prev指向文件末尾的主交叉引用表）
+3. 目录（Catalog）和打开文档时需要的对象（/ViewerPreferences、/OpenAction、/AcroForm等）
+4. 主提示流（页面偏移提示表和共享对象提示表）
+5. 第一页的页面对象及其需要的全部对象（/E之前）
+6. 其余各页的页面对象和各自独占的对象，按页面顺序排列
+7. 被多个页面共享的对象（如水印XObject、字体）
+8. 其余对象（页面树、文档信息、书签等）和主交叉引用表
+
+第一页部分的对象编号排在其余对象之后，与规范中的示例一致。
+对象内容不包含偏移量，因此各部分只需序列化一次；线性化参数字典和第一页trailer中的数值
+按固定宽度写出，提示表中的偏移量按规范不计入提示流本身，整个布局一次即可确定。
+"""
+
+import io
+import zlib
+from collections import deque
+from PyPDF2.generic import DictionaryObject, IndirectObject, NameObject, NullObject, NumberObject, StreamObject
+from pdf_watermark_optimize import _key, _references, _translate, _write_stream, optimize_pdf
+
+# 目录中打开文档时需要的条目，引用的对象放在第一页之前
+_OPEN_DOCUMENT_KEYS = ("/ViewerPreferences", "/OpenAction", "/Threads", "/AcroForm")
+
+# 从页面树节点继承的页面属性
+_INHERITED_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+# 线性化参数字典和第一页trailer中数值的固定宽度
+_NUMBER_WIDTH = 10
+
+def linearize_pdf(input_pdf, output_pdf, compress_level=None, dedup=False):
+    """
+    以线性化（快速Web查看）布局重写PDF，返回 (重写前字节数, 重写后字节数)
+
+    参数:
+    input_pdf: 输入PDF文件路径或文件对象（整体读入内存）
+    output_pdf: 输出PDF文件路径或文件对象；路径可以与输入相同，此时原子地替换输入文件
+    compress_level, dedup: 同时进行的体积优化，见optimize_pdf（线性化输出不使用对象流）
+    """
+    return optimize_pdf(input_pdf, output_pdf, compress_level=compress_level, dedup=dedup, linearize=True)
+
+class _BitWriter:
+    """按位写出提示表的数值（高位在前）"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self._value = 0
+        self._bits = 0
+
+    def write(self, value, bits):
+        if bits == 0:
+            return
+        if value < 0 or value >> bits:
+            raise ValueError(f"提示表数值 {value} 超出 {bits} 位")
+        self._value = (self._value << bits) | value
+        self._bits += bits
+        while self._bits >= 8:
+            self._bits -= 8
+            self.data.append((self._value >> self._bits) & 0xFF)
+        self._value &= (1 << self._bits) - 1
+
+    def write_items(self, values, bits):
+        """写出一列数值；提示表中每一列都从字节边界开始"""
+        for value in values:
+            self.write(value, bits)
+        self.flush()
+
+    def flush(self):
+        if self._bits:
+            self.write(0, 8 - self._bits)
+
+def _bits_for(value):
+    return value.bit_length()
+
+class _ObjectGraph:
+    """去重后的对象及其引用关系"""
+
+    def __init__(self, objects, canonical):
+        self.objects = objects
+        self.canonical = canonical
+        self.keys = [key for key in objects if canonical[key] == key]
+        self._refs = {}
+
+    def refs(self, key):
+        """对象直接引用的（去重后的）对象键"""
+        if key not in self._refs:
+            obj = self.objects[key]
+            if isinstance(obj, StreamObject):
+                obj = DictionaryObject((name, value) for name, value in dict.items(obj) if name != "/Length")
+            refs = []
+            for ref in _references(obj):
+                target = self.canonical.get(_key(ref))
+                if target is not None:
+                    refs.append(target)
+            self._refs[key] = refs
+        return self._refs[key]
+
+    def node_type(self, key):
+        obj = self.objects[key]
+        return dict.get(obj, "/Type") if isinstance(obj, DictionaryObject) else None
+
+    def reachable(self, roots, exclude=()):
+        """
+        返回从roots出发可达的对象键（按广度优先顺序）
+
+        不进入页面树节点和roots以外的页面对象，也不沿页面对象的/Parent向上，
+        因此批注中指向其他页面的链接不会把其他页面的内容计入
+        """
+        roots = [key for key in roots if key is not None]
+        own = set(roots)
+        seen = set()
+        order = []
+        queue = deque(roots)
+        while queue:
+            key = queue.popleft()
+            if key in seen or key in exclude:
+                continue
+            node_type = self.node_type(key)
+            if key not in own and node_type in ("/Page", "/Pages"):
+                continue
+            seen.add(key)
+            order.append(key)
+            obj = self.objects[key]
+            if node_type == "/Page":
+                parent = dict.get(obj, "/Parent")
+                parent_key = self.canonical.get(_key(parent)) if isinstance(parent, IndirectObject) else None
+                queue.extend(ref for ref in self.refs(key) if ref != parent_key)
+            else:
+                queue.extend(self.refs(key))
+        return order
+
+    def value_refs(self, obj):
+        """直接对象（如目录中的某个条目）中引用的对象键"""
+        return [self.canonical[_key(ref)] for ref in _references(obj) if _key(ref) in self.canonical]
+
+    def inherited_refs(self, page_key):
+        """页面从页面树祖先节点继承的属性中引用的对象（页面自身没有这些属性时）"""
+        page = self.objects[page_key]
+        missing = [name for name in _INHERITED_KEYS if name not in page]
+        refs = []
+        node = page
+        seen = set()
+        while missing:
+            parent = dict.get(node, "/Parent")
+            if not isinstance(parent, IndirectObject) or _key(parent) in seen:
+                break
+            seen.add(_key(parent))
+            node = parent.get_object()
+            for name in list(missing):
+                value = dict.get(node, name)
+                if value is not None:
+                    refs.extend(self.value_refs(value))
+                    missing.remove(name)
+        return refs
+
+def _layout(reader, graph):
+    """
+    把对象分到线性化文件的各部分，返回
+    (打开文档的对象, 第一页部分, 各页独占对象列表（第2页起）, 共享对象, 其余对象, 各页使用的共享对象)
+    """
+    root_key = graph.canonical[_key(reader.trailer.raw_get("/Root"))]
+    catalog = graph.objects[root_key]
+    pages = []
+    for page in reader.pages:
+        ref = page.indirect_reference
+        pages.append(graph.canonical[_key(ref)])
+    if not pages:
+        raise ValueError("不能线性化没有页面的PDF")
+
+    # 目录和打开文档时需要的对象
+    open_roots = [root_key]
+    for name in _OPEN_DOCUMENT_KEYS:
+        value = dict.get(catalog, name)
+        if value is not None:
+            open_roots.extend(graph.value_refs(value))
+    part4 = graph.reachable(open_roots)
+    claimed = set(part4)
+
+    # 每页需要的对象（不含打开文档的对象）
+    used = [graph.reachable([page] + graph.inherited_refs(page), exclude=claimed) for page in pages]
+    users = {}
+    for index, keys in enumerate(used):
+        for key in keys:
+            users.setdefault(key, []).append(index)
+
+    # 第一页部分: 第一页需要的全部对象；以书签方式打开时加上书签
+    first_roots = used[0]
+    if dict.get(catalog, "/PageMode") == "/UseOutlines" and dict.get(catalog, "/Outlines") is not None:
+        first_roots = first_roots + graph.reachable(graph.value_refs(dict.get(catalog, "/Outlines")),
+                                                    exclude=claimed | set(first_roots))
+    part6 = list(first_roots)
+    claimed.update(part6)
+
+    # 其余各页独占的对象，页面对象排在最前
+    part7 = []
+    for index in range(1, len(pages)):
+        own = [key for key in used[index] if key not in claimed and len(users[key]) == 1]
+        claimed.update(own)
+        part7.append(own)
+
+    # 被多个页面共享的对象
+    part8 = [key for key in graph.keys if key not in claimed and len(users.get(key, ())) > 1]
+    claimed.update(part8)
+    part9 = [key for key in graph.keys if key not in claimed]
+
+    # 第2页起各页引用的共享对象（第一页部分或共享部分中的对象）
+    first_page = set(part6)
+    shared = []
+    for index in range(1, len(pages)):
+        shared.append([key for key in used[index] if len(users[key]) > 1 or key in first_page])
+    return part4, part6, part7, part8, part9, shared
+
+def write_linearized(dst, reader, objects, canonical, version, compress_level=None):
+    """
+    以线性化布局写出全部对象，返回写出的字节数
+
+    参数:
+    dst: 输出流
+    reader: 原文档的PdfReader
+    objects: {对象键: 对象}，见pdf_watermark_optimize._collect
+    canonical: {对象键: 去重后保留的对象键}
+    version: 输出的PDF版本
+    """
+    graph = _ObjectGraph(objects, canonical)
+    part4, part6, part7, part8, part9, shared = _layout(reader, graph)
+
+    # 编号: 其余对象从1开始，第一页部分（线性化字典、目录、提示流、第一页）排在后面
+    rest = [key for keys in part7 for key in keys] + part8 + part9
+    numbers = {key: num for num, key in enumerate(rest, 1)}
+    first_num = len(rest) + 1
+    lin_num = first_num
+    numbers.update((key, num) for num, key in enumerate(part4, first_num + 1))
+    hint_num = first_num + 1 + len(part4)
+    numbers.update((key, num) for num, key in enumerate(part6, hint_num + 1))
+    size = hint_num + 1 + len(part6)
+
+    def ref(key):
+        num = numbers.get(canonical.get(key))
+        return NullObject() if num is None else IndirectObject(num, 0, None)
+
+    def serialize(key):
+        obj = objects[key]
+        out = io.BytesIO()
+        if isinstance(obj, StreamObject):
+            _write_stream(out, numbers[key], _translate(obj, ref), obj._data, compress_level)
+        else:
+            out.write(f"{numbers[key]} 0 obj\n".encode())
+            _translate(obj, ref).write_to_stream(out, None)
+            out.write(b"\nendobj\n")
+        return out.getvalue()
+
+    header = f"%PDF-{version}\n".encode() + b"%\xe2\xe3\xcf\xd3\n"
+
+    # 第一页trailer
+    trailer = DictionaryObject({NameObject("/Size"): NumberObject(size)})
+    for name in ("/Root", "/Info", "/ID"):
+        value = dict.get(reader.trailer, name)
+        if value is not None:
+            trailer[NameObject(name)] = _translate(value, ref)
+    body = io.BytesIO()
+    trailer.write_to_stream(body, None)
+    trailer_bytes = body.getvalue()
+
+    def linearization_dict(length, hint_offset, hint_length, first_page_end, main_xref_entry):
+        values = dict(L=length, H0=hint_offset, H1=hint_length, E=first_page_end, T=main_xref_entry)
+        padded = {name: str(value).rjust(_NUMBER_WIDTH) for name, value in values.items()}
+        return (f"{lin_num} 0 obj\n<< /Linearized 1 /L {padded['L']} /H [ {padded['H0']} {padded['H1']} ] "
+                f"/O {numbers[part6[0]]} /E {padded['E']} /N {len(reader.pages)} /T {padded['T']} >>\n"
+                f"endobj\n").encode()
+
+    def first_xref(offsets, main_xref_offset):
+        lines = [f"xref\n{first_num} {size - first_num}\n".encode()]
+        lines.extend(f"{offsets[num]:010d} 00000 n \n".encode() for num in range(first_num, size))
+        lines.append(b"trailer\n" + trailer_bytes[:-2].rstrip() +
+                     f"\n/Prev {str(main_xref_offset).rjust(_NUMBER_WIDTH)}\n>>\n".encode())
+        lines.append(b"startxref\n0\n%%EOF\n")
+        return b"".join(lines)
+
+    # 线性化字典和第一页交叉引用表的长度与其中的数值无关
+    lin_length = len(linearization_dict(0, 0, 0, 0, 0))
+    offsets = {num: 0 for num in range(first_num, size)}
+    xref_length = len(first_xref(offsets, 0))
+
+    part4_data = [serialize(key) for key in part4]
+    part6_data = [serialize(key) for key in part6]
+    part7_data = [[serialize(key) for key in keys] for keys in part7]
+    part8_data = [serialize(key) for key in part8]
+    part9_data = [serialize(key) for key in part9]
+
+    # 提示流之前的部分
+    position = len(header)
+    offsets[lin_num] = position
+    position += lin_length
+    first_xref_offset = position
+    position += xref_length
+    for key, data in zip(part4, part4_data):
+        offsets[numbers[key]] = position
+        position += len(data)
+    hint_offset = position
+
+    # 提示流之后的对象偏移量先按没有提示流计算（提示表中的偏移量就是这样定义的）
+    adjusted = {}
+    for key, data in zip(part6, part6_data):
+        adjusted[key] = position
+        position += len(data)
+    first_page_end_adjusted = position
+    page_starts = [adjusted[part6[0]]]
+    for keys, datas in zip(part7, part7_data):
+        page_starts.append(position)
+        for key, data in zip(keys, datas):
+            adjusted[key] = position
+            position += len(data)
+    page_starts.append(position)
+    for key, data in zip(part8, part8_data):
+        adjusted[key] = position
+        position += len(data)
+    for key, data in zip(part9, part9_data):
+        adjusted[key] = position
+        position += len(data)
+    main_xref_adjusted = position
+
+    hint_data, shared_table_offset = _hint_tables(part6, part6_data, part7, part8, part8_data, shared,
+                                                 page_starts, first_page_end_adjusted, numbers, adjusted)
+    hint_dict = DictionaryObject({
+        NameObject("/S"): NumberObject(shared_table_offset),
+        NameObject("/Filter"): NameObject("/FlateDecode"),
+    })
+    hint = io.BytesIO()
+    _write_stream(hint, hint_num, hint_dict, zlib.compress(hint_data))
+    hint_bytes = hint.getvalue()
+    hint_length = len(hint_bytes)
+    offsets[hint_num] = hint_offset
+    for key in part6:
+        offsets[numbers[key]] = adjusted[key] + hint_length
+
+    main_xref_offset = main_xref_adjusted + hint_length
+    main_header = f"xref\n0 {first_num}\n".encode()
+    main_xref = [main_header, b"0000000000 65535 f \n"]
+    main_xref.extend(f"{adjusted[key] + hint_length:010d} 00000 n \n".encode() for key in rest)
+    main_trailer = DictionaryObject({NameObject("/Size"): NumberObject(first_num)})
+    body = io.BytesIO()
+    main_trailer.write_to_stream(body, None)
+    main_xref.append(b"trailer\n" + body.getvalue() + f"\nstartxref\n{first_xref_offset}\n%%EOF\n".encode())
+    main_xref = b"".join(main_xref)
+    length = main_xref_offset + len(main_xref)
+
+    first_page_end = first_page_end_adjusted + hint_length
+    # /T: 主交叉引用表第一项之前的换行符的位置
+    main_xref_entry = main_xref_offset + len(main_header) - 1
+
+    dst.write(header)
+    dst.write(linearization_dict(length, hint_offset, hint_length, first_page_end, main_xref_entry))
+    dst.write(first_xref(offsets, main_xref_offset))
+    for data in part4_data:
+        dst.write(data)
+    dst.write(hint_bytes)
+    for data in part6_data:
+        dst.write(data)
+    for datas in part7_data:
+        for data in datas:
+            dst.write(data)
+    for data in part8_data + part9_data:
+        dst.write(data)
+    dst.write(main_xref)
+    if hasattr(dst, "flush"):
+        dst.flush()
+    return length
+
+def _hint_tables(part6, part6_data, part7, part8, part8_data, shared, page_starts, first_page_end,
+                 numbers, adjusted):
+    """
+    生成主提示流的内容，返回 (数据, 共享对象提示表在数据中的位置)
+
+    页面偏移提示表和共享对象提示表的格式见PDF规范F.4节；内容流的偏移量和长度
+    与qpdf一样分别记为0和整页长度（阅读器不使用这两项）
+    """
+    page_count = len(part7) + 1
+    object_counts = [len(part6)] + [len(keys) for keys in part7]
+    page_lengths = [first_page_end - page_starts[0]] + [page_starts[i + 1] - page_starts[i]
+                                                         for i in range(1, page_count)]
+
+    # 共享对象提示表的条目: 先是第一页部分的全部对象，然后是共享部分的对象，每个对象各为一组
+    shared_index = {key: index for index, key in enumerate(part6)}
+    shared_index.update((key, len(part6) + index) for index, key in enumerate(part8))
+    group_lengths = [len(data) for data in part6_data] + [len(data) for data in part8_data]
+    # 第一页使用的对象都在第一页部分中，不再单独列出
+    page_shared = [[]] + [[shared_index[key] for key in keys] for keys in shared]
+
+    least_objects = min(object_counts)
+    least_length = min(page_lengths)
+    objects_bits = _bits_for(max(object_counts) - least_objects)
+    length_bits = _bits_for(max(page_lengths) - least_length)
+    shared_count_bits = _bits_for(max(len(ids) for ids in page_shared))
+    shared_id_bits = _bits_for(max((max(ids) for ids in page_shared if ids), default=0))
+
+    out = _BitWriter()
+    out.write(least_objects, 32)
+    out.write(adjusted[part6[0]], 32)
+    out.write(objects_bits, 16)
+    out.write(least_length, 32)
+    out.write(length_bits, 16)
+    out.write(0, 32)                    # 内容流最小偏移量
+    out.write(0, 16)
+    out.write(least_length, 32)         # 内容流最小长度
+    out.write(length_bits, 16)
+    out.write(shared_count_bits, 16)
+    out.write(shared_id_bits, 16)
+    out.write(0, 16)                    # 共享对象引用位置的分子位数
+    out.write(1, 16)                    # 分母
+    out.write_items((count - least_objects for count in object_counts), objects_bits)
+    out.write_items((length - least_length for length in page_lengths), length_bits)
+    out.write_items((len(ids) for ids in page_shared), shared_count_bits)
+    out.write_items((index for ids in page_shared for index in ids), shared_id_bits)
+    # 共享对象引用位置的分子和内容流偏移量的位数为0，不占空间
+    out.write_items((length - least_length for length in page_lengths), length_bits)
+    shared_table_offset = len(out.data)
+
+    least_group = min(group_lengths)
+    group_bits = _bits_for(max(group_lengths) - least_group)
+    out.write(numbers[part8[0]] if part8 else 0, 32)
+    out.write(adjusted[part8[0]] if part8 else 0, 32)
+    out.write(len(part6), 32)
+    out.write(len(group_lengths), 32)
+    out.write(0, 16)                    # 每组对象数减1所需的位数（每组一个对象）
+    out.write(least_group, 32)
+    out.write(group_bits, 16)
+    out.write_items((length - least_group for length in group_lengths), group_bits)
+    out.write_items((0 for _ in group_lengths), 1)      # 没有签名
+    return bytes(out.data), shared_table_offset
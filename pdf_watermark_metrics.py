@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+# 指标收集默认关闭，关闭时各计时点几乎没有开销
+_enabled = False
+_lock = threading.Lock()
+# 阶段名 -> 每次耗时（秒）的列表
+_stages = {}
+# 每个文件一条记录
+_files = []
+# 当前线程正在处理的文件记录
+_local = threading.local()
+
+# 各阶段: font 解析字体；render 渲染水印；image 解码和编码水印图片；parse 解析输入PDF；stamp 逐页添加水印；
+# write 序列化并写出；optimize 压缩和去重等体积优化；read / save 流水线中预读输入和后台写入磁盘
+STAGES = ("font", "render", "image", "parse", "stamp", "write", "optimize", "read", "save")
+
+def enable(on=True):
+    """开启或关闭指标收集"""
+    global _enabled
+    _enabled = on
+
+def enabled():
+    return _enabled
+
+def reset():
+    """清空已收集的指标"""
+    with _lock:
+        _stages.clear()
+        del _files[:]
+
+@contextmanager
+def stage(name):
+    """记录一个阶段的耗时，同时累加到当前线程正在处理的文件记录中"""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            _stages.setdefault(name, []).append(elapsed)
+        record = getattr(_local, "record", None)
+        if record is not None:
+            record["stages"][name] = record["stages"].get(name, 0.0) + elapsed
+
+def count_pages(pages):
+    """为当前线程正在处理的文件记录页数"""
+    record = getattr(_local, "record", None) if _enabled else None
+    if record is not None:
+        record["pages"] += pages
+
+@contextmanager
+def track_file(input_file, output_file):
+    """
+    记录一个文件的总耗时、页数、输入输出字节数和内存峰值
+
+    内存峰值是处理完该文件时进程的最高常驻内存（ru_maxrss），同一进程中并发处理的文件无法分开统计
+
+    参数:
+    input_file: 输入文件路径（文件对象时不统计字节数）
+    output_file: 输出文件路径
+    """
+    if not _enabled:
+        yield None
+        return
+    record = {"file": input_file if isinstance(input_file, str) else None,
+              "pages": 0, "stages": {}, "ok": False}
+    _local.record = record
+    start = time.perf_counter()
+    try:
+        yield record
+        record["ok"] = True
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        # 调用方可以预先填写字节数（如输出在内存中时）
+        record.setdefault("bytes_in", _size(input_file))
+        record.setdefault("bytes_out", _size(output_file))
+        record["peak_rss_mb"] = _maxrss_mb()
+        _local.record = None
+        with _lock:
+            _files.append(record)
+
+def _size(path):
+    try:
+        return os.path.getsize(path) if isinstance(path, str) else None
+    except OSError:
+        return None
+
+def drain():
+    """取出并清空已收集的指标，用于把工作进程中的指标传回主进程"""
+    if not _enabled:
+        return None
+    with _lock:
+        snapshot = {"stages": dict(_stages), "files": list(_files)}
+        _stages.clear()
+        del _files[:]
+    return snapshot
+
+def merge(snapshot):
+    """合并drain返回的指标"""
+    if not snapshot:
+        return
+    with _lock:
+        for name, values in snapshot["stages"].items():
+            _stages.setdefault(name, []).extend(values)
+        _files.extend(snapshot["files"])
+
+def _percentile(values, fraction):
+    # 最近秩法
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def _describe(values):
+    return {
+        "count": len(values),
+        "total": sum(values),
+        "p50": _percentile(values, 0.50),
+        "p95": _percentile(values, 0.95),
+        "max": max(values),
+    }
+
+def _maxrss_mb(who="RUSAGE_SELF"):
+    """返回进程（或已结束的子进程）常驻内存的最高值 (MB)，不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(getattr(resource, who)).ru_maxrss
+    # Linux上单位是KB，macOS上是字节
+    return usage / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def _peak_rss_mb(files):
+    # 文件记录中的峰值来自处理它的进程（包括进程池的工作进程）
+    peaks = [f["peak_rss_mb"] for f in files if f.get("peak_rss_mb") is not None]
+    peaks.extend(peak for peak in (_maxrss_mb(), _maxrss_mb("RUSAGE_CHILDREN")) if peak is not None)
+    return max(peaks) if peaks else None
+
+def summary():
+    """汇总指标: 各阶段和每个文件耗时的p50/p95/最大值，以及页数、字节数和峰值内存"""
+    with _lock:
+        stages = {name: list(values) for name, values in _stages.items() if values}
+        files = list(_files)
+    result = {
+        "stages": {name: _describe(values) for name, values in stages.items()},
+        "files": len(files),
+        "failed": sum(1 for f in files if not f["ok"]),
+        "pages": sum(f["pages"] for f in files),
+        "bytes_in": sum(f["bytes_in"] or 0 for f in files),
+        "bytes_out": sum(f["bytes_out"] or 0 for f in files),
+        "peak_rss_mb": _peak_rss_mb(files),
+    }
+    if files:
+        result["file_seconds"] = _describe([f["seconds"] for f in files])
+    return result
+
+def format_summary():
+    """返回便于阅读的汇总表格"""
+    data = summary()
+    order = [name for name in STAGES if name in data["stages"]]
+    order += sorted(name for name in data["stages"] if name not in STAGES)
+    lines = [f"{'阶段':<10}{'次数':>8}{'合计(s)':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'最大(ms)':>10}"]
+    rows = [(name, data["stages"][name]) for name in order]
+    if "file_seconds" in data:
+        rows.append(("每个文件", data["file_seconds"]))
+    for name, d in rows:
+        lines.append(f"{name:<10}{d['count']:>8}{d['total']:>10.2f}{d['p50'] * 1000:>10.1f}"
+                     f"{d['p95'] * 1000:>10.1f}{d['max'] * 1000:>10.1f}")
+    peak = f"{data['peak_rss_mb']:.1f} MB" if data["peak_rss_mb"] is not None else "未知"
+    lines.append(f"文件 {data['files']} 个（失败 {data['failed']} 个），页数 {data['pages']}，"
+                 f"输入 {data['bytes_in']} 字节，输出 {data['bytes_out']} 字节，峰值内存 {peak}")
+    return "\n".join(lines)
+
+def to_prometheus():
+    """以Prometheus文本格式导出汇总指标"""
+    data = summary()
+    lines = ["# HELP pdf_watermark_stage_seconds 各处理阶段的耗时",
+             "# TYPE pdf_watermark_stage_seconds summary"]
+    for name, d in sorted(data["stages"].items()):
+        for quantile, key in (("0.5", "p50"), ("0.95", "p95")):
+            lines.append(f'pdf_watermark_stage_seconds{{stage="{name}",quantile="{quantile}"}} {d[key]:.6f}')
+        lines.append(f'pdf_watermark_stage_seconds_sum{{stage="{name}"}} {d["total"]:.6f}')
+        lines.append(f'pdf_watermark_stage_seconds_count{{stage="{name}"}} {d["count"]}')
+    for name, key in (("files", "files"), ("failed_files", "failed"), ("pages", "pages"),
+                      ("bytes_in", "bytes_in"), ("bytes_out", "bytes_out")):
+        lines.append(f"# TYPE pdf_watermark_{name}_total counter")
+        lines.append(f"pdf_watermark_{name}_total {data[key]}")
+    if data["peak_rss_mb"] is not None:
+        lines.append("# TYPE pdf_watermark_peak_rss_bytes gauge")
+        lines.append(f"pdf_watermark_peak_rss_bytes {int(data['peak_rss_mb'] * 1024 * 1024)}")
+    return "\n".join(lines) + "\n"
+
+def write_report(path):
+    """
+    导出指标: 扩展名为.json时写出汇总和每个文件的记录，否则写出Prometheus文本格式
+
+    参数:
+    path: 输出文件路径
+    """
+    if path.lower().endswith(".json"):
+        with _lock:
+            files = list(_files)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary(), "files": files}, f, ensure_ascii=False, indent=2)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(to_prometheus())
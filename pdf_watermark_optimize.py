@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+输出PDF的体积优化
+
+添加水印后对输出整体重写一遍:
+- 压缩未压缩的流（逐页合并产生的内容流、水印包装流等），压缩级别可选
+- 合并内容完全相同的对象（如重复嵌入的字体、图片和水印对象）
+- 把非流对象打包进对象流（PDF 1.5），并改用压缩的交叉引用流
+- 以线性化（快速Web查看）布局写出，见pdf_watermark_linearize
+"""
+
+import io
+import os
+import zlib
+import hashlib
+from collections import deque
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject,
+                            NumberObject, StreamObject)
+from pdf_watermark_writer import PositionTrackingStream, write_xref_table
+import pdf_watermark_metrics as metrics
+
+# 每个对象流中的对象数
+OBJECTS_PER_STREAM = 100
+
+# 不参与去重的对象类型：页面树节点、注释和结构树元素都由对象本身标识，内容相同也必须各自唯一
+_UNIQUE_TYPES = ("/Catalog", "/Pages", "/Page", "/Annot", "/StructElem")
+
+def format_sizes(before, after):
+    """返回优化前后体积的说明文字"""
+    change = (after - before) / before * 100 if before else 0.0
+    return f"优化前 {before} 字节, 优化后 {after} 字节 ({change:+.1f}%)"
+
+def optimize_pdf(input_pdf, output_pdf, compress_level=None, dedup=False, object_streams=False, linearize=False):
+    """
+    重写PDF以减小体积，返回 (优化前字节数, 优化后字节数)
+
+    参数:
+    input_pdf: 输入PDF文件路径或文件对象（整体读入内存）
+    output_pdf: 输出PDF文件路径或文件对象；路径可以与输入相同，此时原子地替换输入文件
+    compress_level: 未压缩的流使用的zlib压缩级别 (1-9)，为None或0时保持原样
+    dedup: 是否合并内容完全相同的对象
+    object_streams: 是否把非流对象打包进对象流并使用交叉引用流
+    linearize: 是否以线性化（快速Web查看）布局写出，阅读器只需下载文件开头就能显示第一页；不能与object_streams同时使用
+    """
+    if linearize and object_streams:
+        raise ValueError("线性化输出不支持对象流")
+    with metrics.stage("optimize"):
+        return _optimize(input_pdf, output_pdf, compress_level, dedup, object_streams, linearize)
+
+def _optimize(input_pdf, output_pdf, compress_level, dedup, object_streams, linearize=False):
+    if hasattr(input_pdf, 'read'):
+        data = input_pdf.read()
+    else:
+        with open(input_pdf, 'rb') as f:
+            data = f.read()
+    reader = PdfReader(io.BytesIO(data))
+    if reader.is_encrypted:
+        raise ValueError("不支持优化加密的PDF")
+
+    objects = _collect(reader)
+    canonical = _deduplicate(objects) if dedup else {key: key for key in objects}
+    order = [key for key in objects if canonical[key] == key]
+    numbers = {key: num for num, key in enumerate(order, 1)}
+    numbers.update((key, numbers[canonical[key]]) for key in objects if canonical[key] != key)
+
+    def ref(key):
+        num = numbers.get(key)
+        return NullObject() if num is None else IndirectObject(num, 0, None)
+
+    version = reader.pdf_header[5:8] if reader.pdf_header.startswith("%PDF-") else "1.4"
+    if object_streams and version < "1.5":
+        version = "1.5"
+
+    if linearize:
+        from pdf_watermark_linearize import write_linearized
+
+        def write(dst):
+            return write_linearized(dst, reader, objects, canonical, version, compress_level)
+    else:
+        def write(dst):
+            return _write(dst, reader, objects, order, ref, version, compress_level, object_streams)
+
+    if hasattr(output_pdf, 'write'):
+        size = write(output_pdf)
+    else:
+        temp_path = output_pdf + ".tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                size = write(f)
+            os.replace(temp_path, output_pdf)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    return len(data), size
+
+def _key(ref):
+    return ref.idnum, ref.generation
+
+def _collect(reader):
+    """从trailer出发按引用遍历，返回 {(编号, 代数): 对象}，只包含可达的对象"""
+    objects = {}
+    queue = deque(value for value in (dict.get(reader.trailer, "/Root"), dict.get(reader.trailer, "/Info"))
+                  if isinstance(value, IndirectObject))
+    while queue:
+        ref = queue.popleft()
+        key = _key(ref)
+        if key in objects:
+            continue
+        obj = reader.get_object(ref)
+        if obj is None:
+            continue
+        objects[key] = obj
+        if isinstance(obj, StreamObject):
+            # 流的/Length写出时直接写成数值，不需要单独的长度对象
+            queue.extend(_references(DictionaryObject(
+                (name, value) for name, value in dict.items(obj) if name != "/Length")))
+        else:
+            queue.extend(_references(obj))
+    return objects
+
+def _references(obj):
+    """返回对象中直接包含的间接引用"""
+    if isinstance(obj, IndirectObject):
+        return [obj]
+    if isinstance(obj, DictionaryObject):
+        values = dict.values(obj)
+    elif isinstance(obj, ArrayObject):
+        values = list.__iter__(obj)
+    else:
+        return []
+    refs = []
+    for value in values:
+        refs.extend(_references(value))
+    return refs
+
+def _translate(obj, ref):
+    """复制对象，用ref(原对象键)替换其中的间接引用（流对象只复制字典）"""
+    if isinstance(obj, IndirectObject):
+        return ref(_key(obj))
+    if isinstance(obj, DictionaryObject):
+        out = DictionaryObject()
+        for key, value in dict.items(obj):
+            out[NameObject(key)] = _translate(value, ref)
+        return out
+    if isinstance(obj, ArrayObject):
+        return ArrayObject(_translate(value, ref) for value in list.__iter__(obj))
+    return obj
+
+def _serialize(obj, ref):
+    stream = io.BytesIO()
+    _translate(obj, ref).write_to_stream(stream, None)
+    if isinstance(obj, StreamObject):
+        stream.write(b"stream")
+        stream.write(obj._data)
+    return stream.getvalue()
+
+def _deduplicate(objects):
+    """
+    找出内容完全相同的对象，返回 {对象键: 保留的对象键}
+
+    引用了相同对象的对象在合并后才变得相同（如引用了重复字体文件的字体字典），
+    因此重复计算直到没有新的合并；每一轮只重新计算引用了上一轮被合并对象的对象
+    """
+    merged = {}
+
+    def resolve(key):
+        while key in merged:
+            key = merged[key]
+        return key
+
+    def ref(key):
+        key = resolve(key)
+        return IndirectObject(key[0], key[1], None)
+
+    candidates = [key for key, obj in objects.items() if not _is_unique(obj)]
+    order = {key: i for i, key in enumerate(candidates)}
+    # 对象键 -> 引用它的候选对象；合并后只需重新计算这些对象的摘要
+    referrers = {}
+    for key in candidates:
+        for target in _references(objects[key]):
+            referrers.setdefault(_key(target), set()).add(key)
+
+    digests = {}
+    owners = {}
+    pending = candidates
+    while pending:
+        dirty = set()
+        for key in pending:
+            if key in merged:
+                continue
+            old = digests.pop(key, None)
+            if old is not None and owners.get(old) == key:
+                del owners[old]
+            digest = hashlib.sha1(_serialize(objects[key], ref)).digest()
+            first = owners.setdefault(digest, key)
+            if first == key:
+                digests[key] = digest
+                continue
+            merged[key] = first
+            group = referrers.pop(key, set())
+            referrers.setdefault(first, set()).update(group)
+            dirty.update(group)
+        pending = sorted((key for key in dirty if key not in merged), key=order.__getitem__)
+    return {key: resolve(key) for key in objects}
+
+def _is_unique(obj):
+    """对象是否不能与内容相同的其他对象合并（/Type可以省略，所以也按必需的键识别）"""
+    if not isinstance(obj, DictionaryObject):
+        return False
+    if dict.get(obj, "/Type") in _UNIQUE_TYPES:
+        return True
+    # 表单域（/FT，或带/T的非终端域）、注释（/Subtype和/Rect）、结构树元素（/S和/P）
+    keys = dict.keys(obj)
+    return ("/FT" in keys or ("/T" in keys and ("/Kids" in keys or "/Parent" in keys))
+            or ("/Subtype" in keys and "/Rect" in keys) or ("/S" in keys and "/P" in keys))
+
+def _write(dst, reader, objects, order, ref, version, compress_level, object_streams):
+    """写出全部对象和交叉引用，返回写出的字节数"""
+    out = PositionTrackingStream(dst)
+    out.write(f"%PDF-{version}\n".encode() + b"%\xe2\xe3\xcf\xd3\n")
+    offsets = {}
+    packed = []
+    for num, key in enumerate(order, 1):
+        obj = objects[key]
+        if isinstance(obj, StreamObject):
+            offsets[num] = out.tell()
+            _write_stream(out, num, _translate(obj, ref), obj._data, compress_level)
+        elif object_streams:
+            body = io.BytesIO()
+            _translate(obj, ref).write_to_stream(body, None)
+            packed.append((num, body.getvalue()))
+        else:
+            offsets[num] = out.tell()
+            out.write(f"{num} 0 obj\n".encode())
+            _translate(obj, ref).write_to_stream(out, None)
+            out.write(b"\nendobj\n")
+
+    trailer = DictionaryObject()
+    for name in ("/Root", "/Info", "/ID"):
+        value = dict.get(reader.trailer, name)
+        if value is not None:
+            trailer[NameObject(name)] = _translate(value, ref)
+
+    if not object_streams:
+        write_xref_table(out, {num: (offset, 0) for num, offset in offsets.items()}, len(order) + 1, trailer)
+        out.flush()
+        return out.tell()
+
+    # 对象流: 开头是 "编号 偏移量" 对，之后是各对象的内容；流内对象在交叉引用中记为 (对象流编号, 序号)
+    level = -1 if compress_level is None else compress_level
+    compressed = {}
+    next_num = len(order) + 1
+    for start in range(0, len(packed), OBJECTS_PER_STREAM):
+        chunk = packed[start:start + OBJECTS_PER_STREAM]
+        stream_num = next_num
+        next_num += 1
+        header, body, position = [], [], 0
+        for index, (num, data) in enumerate(chunk):
+            header.append(f"{num} {position}")
+            body.append(data)
+            position += len(data) + 1
+            compressed[num] = (stream_num, index)
+        header = (" ".join(header) + "\n").encode()
+        stream_dict = DictionaryObject({
+            NameObject("/Type"): NameObject("/ObjStm"),
+            NameObject("/N"): NumberObject(len(chunk)),
+            NameObject("/First"): NumberObject(len(header)),
+            NameObject("/Filter"): NameObject("/FlateDecode"),
+        })
+        offsets[stream_num] = out.tell()
+        _write_stream(out, stream_num, stream_dict, zlib.compress(header + b"\n".join(body) + b"\n", level))
+
+    xref_num = next_num
+    xref_offset = out.tell()
+    offsets[xref_num] = xref_offset
+    width = max(1, (max(xref_offset, xref_num).bit_length() + 7) // 8)
+    rows = [b"\x00" + bytes(width) + b"\xff\xff"]
+    for num in range(1, xref_num + 1):
+        if num in compressed:
+            stream_num, index = compressed[num]
+            rows.append(b"\x02" + stream_num.to_bytes(width, "big") + index.to_bytes(2, "big"))
+        else:
+            rows.append(b"\x01" + offsets[num].to_bytes(width, "big") + b"\x00\x00")
+    trailer.update({
+        NameObject("/Type"): NameObject("/XRef"),
+        NameObject("/Size"): NumberObject(xref_num + 1),
+        NameObject("/W"): ArrayObject([NumberObject(1), NumberObject(width), NumberObject(2)]),
+        NameObject("/Filter"): NameObject("/FlateDecode"),
+    })
+    _write_stream(out, xref_num, trailer, zlib.compress(b"".join(rows), level))
+    out.write(f"startxref\n{xref_offset}\n%%EOF\n".encode())
+    out.flush()
+    return out.tell()
+
+def _write_stream(out, num, stream_dict, data, compress_level=None):
+    """写出一个流对象；没有/Filter的流在指定压缩级别时先压缩"""
+    if compress_level and "/Filter" not in stream_dict:
+        data = zlib.compress(data, compress_level)
+        stream_dict[NameObject("/Filter")] = NameObject("/FlateDecode")
+        stream_dict.pop("/DecodeParms", None)
+    stream_dict[NameObject("/Length")] = NumberObject(len(data))
+    out.write(f"{num} 0 obj\n".encode())
+    stream_dict.write_to_stream(out, None)
+    out.write(b"\nstream\n")
+    out.write(data)
+    out.write(b"\nendstream\nendobj\n")
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+命令行工具、批量工具和服务共用的选项常量
+
+只依赖标准库：解析命令行参数（包括--help和参数错误）时不需要导入PyPDF2和reportlab。
+"""
+
+# 叠加方式: "xobject" 把水印作为共享的Form XObject嵌入一次，每页只增加一个引用；
+# "merge" 使用PyPDF2的merge_page逐页重写内容流（旧方式）
+STAMP_MODES = ("xobject", "merge")
+
+# 水印布局: "center" 在页面中心绘制一次；"tile" 在整页按网格重复
+LAYOUTS = ("center", "tile")
+
+# 页数达到该值时才把单个文档拆分成页面区间并行处理
+PARALLEL_MIN_PAGES = 500
+
+def optimize_options(compress_level=None, dedup=False, object_streams=False, linearize=False):
+    """返回optimize_pdf的关键字参数；未要求任何优化时返回None"""
+    if not (compress_level or dedup or object_streams or linearize):
+        return None
+    options = {"compress_level": compress_level, "dedup": dedup, "object_streams": object_streams}
+    # 只在需要时加入，未线性化时参数与之前相同（批量任务日志的参数摘要不变）
+    if linearize:
+        options["linearize"] = True
+    return options
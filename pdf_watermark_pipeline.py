@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import mmap
+import queue
+import threading
+import concurrent.futures
+from pdf_watermark import add_watermark, load_watermark_page
+from pdf_watermark_optimize import optimize_pdf
+import pdf_watermark_metrics as metrics
+
+# 各阶段之间传递的结束标记
+_STOP = object()
+
+class WatermarkPipeline:
+    """
+    分阶段的批量水印流水线: 读取 -> 添加水印 -> 写出
+
+    三个阶段各有独立的线程数，之间用有界队列连接：读取线程提前把输入读入内存
+    （或映射到内存），写出线程在后台写入输出，读写的I/O延迟被水印处理的计算时间掩盖；
+    队列已满时上游阶段等待，内存中的文件数量有上限。
+
+    submit(input_file, output_file) 返回future，其结果为 (是否成功, 文件, 错误信息) 元组；
+    用with语句使用时，退出时等待全部完成。
+    """
+
+    def __init__(self, watermark, mode="xobject", read_workers=2, stamp_workers=4, write_workers=2,
+                 queue_size=None, use_mmap=False, optimize=None):
+        """
+        参数:
+        watermark: 水印PDF文件路径、已解析的水印页面或WatermarkTemplate
+        mode: 叠加方式，"xobject" 或 "merge"
+        read_workers: 读取线程数
+        stamp_workers: 添加水印的线程数
+        write_workers: 写出线程数
+        queue_size: 每个队列的容量，默认为添加水印线程数的两倍
+        use_mmap: 用内存映射读取输入，并提示操作系统预读
+        optimize: 不为None时，在添加水印的线程中按其中的参数优化输出体积或线性化（见optimize_pdf）
+        """
+        if isinstance(watermark, (str, bytes, os.PathLike)):
+            watermark = load_watermark_page(watermark)
+        self.watermark = watermark
+        self.mode = mode
+        self.use_mmap = use_mmap
+        self.optimize = optimize
+        queue_size = queue_size or stamp_workers * 2
+        self._read_queue = queue.Queue(queue_size)
+        self._stamp_queue = queue.Queue(queue_size)
+        self._write_queue = queue.Queue(queue_size)
+        self._stages = [
+            (self._read_queue, self._start(self._read_loop, read_workers, "wm-read")),
+            (self._stamp_queue, self._start(self._stamp_loop, stamp_workers, "wm-stamp")),
+            (self._write_queue, self._start(self._write_loop, write_workers, "wm-write")),
+        ]
+
+    def _start(self, target, count, name):
+        threads = [threading.Thread(target=target, name=f"{name}-{i}", daemon=True)
+                   for i in range(max(1, count))]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def submit(self, input_file, output_file):
+        """提交一个文件；读取队列已满时等待"""
+        future = concurrent.futures.Future()
+        self._read_queue.put((future, input_file, output_file, None))
+        return future
+
+    def shutdown(self):
+        """等待已提交的文件全部完成，然后按阶段顺序停止线程"""
+        for work_queue, threads in self._stages:
+            for _ in threads:
+                work_queue.put(_STOP)
+            for thread in threads:
+                thread.join()
+
+    def _run_stage(self, work_queue, handle):
+        while True:
+            item = work_queue.get()
+            if item is _STOP:
+                return
+            future, input_file = item[0], item[1]
+            try:
+                handle(*item)
+            except Exception as e:
+                _close(item[3])
+                future.set_result((False, input_file, str(e)))
+
+    def _read_loop(self):
+        def read(future, input_file, output_file, _):
+            with metrics.stage("read"), open(input_file, 'rb') as f:
+                if self.use_mmap and os.path.getsize(input_file):
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    if hasattr(data, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+                        data.madvise(mmap.MADV_WILLNEED)
+                else:
+                    data = io.BytesIO(f.read())
+            self._stamp_queue.put((future, input_file, output_file, data))
+        self._run_stage(self._read_queue, read)
+
+    def _stamp_loop(self):
+        def stamp(future, input_file, output_file, data):
+            try:
+                with metrics.track_file(input_file, None) as record:
+                    output = add_watermark(data, None, self.watermark, mode=self.mode)
+                    if self.optimize:
+                        optimized = io.BytesIO()
+                        optimize_pdf(output, optimized, **self.optimize)
+                        output.close()
+                        output = optimized
+                    if record is not None:
+                        record["bytes_out"] = output.getbuffer().nbytes
+            finally:
+                _close(data)
+            self._write_queue.put((future, input_file, output_file, output))
+        self._run_stage(self._stamp_queue, stamp)
+
+    def _write_loop(self):
+        def write(future, input_file, output_file, output):
+            # 先写到临时文件再替换，写出失败（如磁盘已满）时不会留下不完整的输出
+            temp_path = output_file + ".tmp"
+            try:
+                with metrics.stage("save"):
+                    # 出错时也要释放缓冲区视图，否则output无法关闭
+                    with open(temp_path, 'wb') as f, output.getbuffer() as view:
+                        f.write(view)
+                    os.replace(temp_path, output_file)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            finally:
+                output.close()
+            future.set_result((True, input_file, None))
+        self._run_stage(self._write_queue, write)
+
+def _close(data):
+    if data is not None:
+        data.close()
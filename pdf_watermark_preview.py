@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+水印效果的快速预览
+
+用Pillow在缩小的第一页上绘制水印，不生成PDF。页面背景、字体和渲染好的文字蒙版都有缓存：
+调整透明度或颜色时只需重新合成，调整角度时只需旋转已缓存的文字蒙版，每次更新只要几毫秒。
+
+第一页的栅格化需要PyMuPDF（可选依赖）；未安装时使用与页面尺寸和方向一致的空白页面。
+"""
+
+import os
+import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pdf_watermark_fontindex import find_font
+
+# 预览图最长边的像素数
+PREVIEW_SIZE = 480
+
+# 没有指定字体时预览使用的字体族（与PDF中默认的Helvetica相近），按顺序查找
+DEFAULT_FAMILIES = ("Helvetica", "Arial", "Liberation Sans", "Nimbus Sans", "DejaVu Sans")
+
+# 缓存的页面背景数量
+BACKGROUND_CACHE_SIZE = 8
+
+# A4页面尺寸（点），未选择输入文件时使用
+A4_SIZE = (595.2756, 841.8898)
+
+# (绝对路径, 修改时间ns, 大小, 最长边像素) -> (背景图片, (页面宽, 高))
+_backgrounds = OrderedDict()
+_background_lock = threading.Lock()
+
+def _background_key(pdf_path, max_size):
+    stat = os.stat(pdf_path)
+    return os.path.abspath(pdf_path), stat.st_mtime_ns, stat.st_size, max_size
+
+def cached_background(pdf_path, max_size=PREVIEW_SIZE):
+    """返回已缓存的第一页背景 (图片, 页面尺寸)，还没有加载过时返回None"""
+    key = _background_key(pdf_path, max_size)
+    with _background_lock:
+        if key in _backgrounds:
+            _backgrounds.move_to_end(key)
+            return _backgrounds[key]
+    return None
+
+def page_background(pdf_path=None, max_size=PREVIEW_SIZE):
+    """
+    返回缩小后的第一页图片及其页面尺寸（点） (图片, (宽, 高))，结果按文件缓存
+
+    大文件的栅格化可能需要较长时间，图形界面应在后台线程中调用
+
+    参数:
+    pdf_path: PDF文件路径，为None时返回空白的A4页面
+    max_size: 图片最长边的像素数
+    """
+    if pdf_path is None:
+        return _blank(A4_SIZE, max_size), A4_SIZE
+    result = cached_background(pdf_path, max_size)
+    if result is not None:
+        return result
+    result = _render_page(pdf_path, max_size)
+    with _background_lock:
+        _backgrounds[_background_key(pdf_path, max_size)] = result
+        while len(_backgrounds) > BACKGROUND_CACHE_SIZE:
+            _backgrounds.popitem(last=False)
+    return result
+
+def _render_page(pdf_path, max_size):
+    try:
+        try:
+            import pymupdf
+        except ImportError:
+            import fitz as pymupdf
+    except ImportError:
+        pymupdf = None
+    if pymupdf is not None:
+        from PIL import Image
+        with pymupdf.open(pdf_path) as doc:
+            page = doc[0]
+            # page.rect已经考虑了页面旋转
+            size = (page.rect.width, page.rect.height)
+            zoom = max_size / max(size)
+            pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+            image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+        return image, size
+    # 没有PyMuPDF时只读取第一页的尺寸和旋转
+    from PyPDF2 import PdfReader
+    page = PdfReader(pdf_path).pages[0]
+    size = (float(page.mediabox.width), float(page.mediabox.height))
+    if (page.get("/Rotate") or 0) % 180:
+        size = size[::-1]
+    return _blank(size, max_size), size
+
+def _blank(size, max_size):
+    from PIL import Image
+    scale = max_size / max(size)
+    return Image.new("RGB", (max(1, round(size[0] * scale)), max(1, round(size[1] * scale))), "white")
+
+@lru_cache(maxsize=None)
+def _default_font_file(text):
+    for family in DEFAULT_FAMILIES:
+        found = find_font(text, family)
+        if found:
+            return found
+    return find_font(text)
+
+@lru_cache(maxsize=32)
+def _font(font_path, font_index, pixels):
+    from PIL import ImageFont
+    if font_path is None:
+        return ImageFont.load_default()
+    return ImageFont.truetype(font_path, pixels, index=font_index)
+
+@lru_cache(maxsize=64)
+def _text_mask(text, font_path, font_index, pixels, angle):
+    """
+    渲染并旋转文字蒙版，返回 (蒙版, 基线中心点在蒙版中的位置)
+
+    与PDF中的drawCentredString一致，文字绕基线中点旋转（逆时针）
+    """
+    from PIL import Image, ImageDraw
+    font = _font(font_path, font_index, pixels)
+    left, top, right, bottom = font.getbbox(text, anchor="ms") if font_path else font.getbbox(text)
+    # 正方形画布的中心为基线中点，边长足以容纳任意角度旋转后的文字
+    radius = math.ceil(math.hypot(max(abs(left), abs(right)), max(abs(top), abs(bottom)))) + 2
+    mask = Image.new("L", (radius * 2, radius * 2), 0)
+    draw = ImageDraw.Draw(mask)
+    if font_path:
+        draw.text((radius, radius), text, font=font, fill=255, anchor="ms")
+    else:
+        draw.text((radius - (right - left) / 2, radius - bottom), text, font=font, fill=255)
+    if angle % 360:
+        mask = mask.rotate(angle, resample=Image.Resampling.BICUBIC)
+    box = mask.getbbox()
+    if box is None:
+        return None, (0, 0)
+    return mask.crop(box), (radius - box[0], radius - box[1])
+
+@lru_cache(maxsize=8)
+def _image_layer(image_path, mtime, width):
+    """读取并缩放图片水印，返回RGBA图片（按路径、修改时间和目标宽度缓存）"""
+    from PIL import Image
+    with Image.open(image_path) as img:
+        img = img.convert("RGBA")
+        height = max(1, round(img.height * width / img.width))
+        return img.resize((width, height), Image.Resampling.LANCZOS)
+
+def _scaled_alpha(mask, opacity):
+    return mask.point(lambda value: round(value * opacity))
+
+def render_preview(background, page_size, text, font_path=None, font_index=0, font_size=40, opacity=0.5,
+                   angle=45, color=(0, 0, 0), image_path=None, image_scale=0.5):
+    """
+    在页面背景上绘制水印，返回RGB图片
+
+    参数:
+    background: page_background返回的页面图片（不会被修改）
+    page_size: 页面尺寸（点），用于把字体大小换算成像素
+    font_path: 字体文件路径，为None时使用与默认字体相近的系统字体
+    其余参数与create_watermark相同
+    """
+    from PIL import Image
+    scale = background.width / page_size[0]
+    result = background.copy()
+    center = (background.width / 2, background.height / 2)
+
+    if image_path:
+        layer = _image_layer(image_path, os.path.getmtime(image_path),
+                             max(1, round(background.width * image_scale)))
+        alpha = _scaled_alpha(layer.getchannel("A"), opacity)
+        result.paste(layer.convert("RGB"), (round(center[0] - layer.width / 2), round(center[1] - layer.height / 2)),
+                     alpha)
+
+    if text:
+        if font_path is None:
+            font_path, font_index = _default_font_file(text) or (None, 0)
+        mask, origin = _text_mask(text, font_path, font_index, max(1, round(font_size * scale)), angle % 360)
+        if mask is not None:
+            fill = Image.new("RGB", mask.size, tuple(color))
+            result.paste(fill, (round(center[0] - origin[0]), round(center[1] - origin[1])),
+                         _scaled_alpha(mask, opacity))
+    return result
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+图形界面使用的多文件任务队列
+
+在后台线程中用批量工具的执行器（make_executor的线程池方式）处理多个文件和目录，
+同时处理的文件数有上限。进度、每个文件的结果和最终汇总作为事件放入线程安全的队列，
+由界面的主循环定期取出，工作线程不直接访问界面控件。
+"""
+
+import os
+import time
+import queue
+import threading
+import concurrent.futures
+from pdf_watermark_batch import iter_pdf_files, make_executor, output_path_for, submit_bounded
+
+# 逐页进度事件的最小间隔（秒），页数很多时合并成一个事件
+PROGRESS_INTERVAL = 0.1
+
+class JobCancelled(Exception):
+    """任务被取消，用于中止正在处理的文件"""
+
+class WatermarkJobQueue:
+    """
+    多文件水印任务
+
+    start() 后在后台线程中依次发出以下事件（events队列中的元组）:
+    ("scanned", 文件数): 找到全部待处理的文件
+    ("progress", 已完成页数, 已完成文件数, 总页数, 已用秒数): 处理过程中按PROGRESS_INTERVAL合并发出；
+        每个文件的页数在工作线程中开始处理时才统计，还有文件未开始时总页数按已统计文件的平均页数估算
+    ("file", 输入文件, 输出文件, 状态, 错误信息): 一个文件处理结束，状态为 "ok"、"failed" 或 "cancelled"
+    ("finished", 汇总字典): 全部结束（包括取消和出错），汇总中有ok、failed、cancelled、pages、seconds
+    """
+
+    def __init__(self, inputs, output_dir, workers=4, **watermark):
+        """
+        参数:
+        inputs: PDF文件或目录的列表，目录会被递归遍历，输出保持相同的子目录结构
+        output_dir: 输出目录
+        workers: 同时处理的文件数
+        watermark: 水印参数，如text、font_path、font_index、font_size、opacity、angle、color、image_path，
+                   见make_executor
+        """
+        self.inputs = list(inputs)
+        self.output_dir = output_dir
+        self.workers = max(1, workers)
+        self.watermark = watermark
+        self.events = queue.Queue()
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._futures = set()
+        # 每个文件的页数（开始添加水印时统计）和已添加水印的页数
+        self._pages = {}
+        self._stamped = {}
+        # 因取消而中止的文件
+        self._aborted = set()
+        self._total_files = 0
+        # 没有统计页数就结束的文件（排队时被取消或打开失败）
+        self._uncounted = 0
+        self._pages_done = 0
+        self._files_done = 0
+        self._last_progress = 0.0
+        self._start = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="wm-jobs", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """取消任务：不再提交新文件，排队中的文件直接取消，正在处理的文件在下一页时中止"""
+        self._cancel.set()
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def jobs(self):
+        """返回 (输入文件, 输出目录) 的列表"""
+        jobs = []
+        for path in self.inputs:
+            if os.path.isdir(path):
+                exclude = [os.path.abspath(self.output_dir)]
+                for input_file in iter_pdf_files(path, exclude=exclude):
+                    relative = os.path.relpath(os.path.dirname(input_file), path)
+                    jobs.append((input_file, os.path.normpath(os.path.join(self.output_dir, relative))))
+            elif os.path.isfile(path):
+                jobs.append((path, self.output_dir))
+        return jobs
+
+    def _run(self):
+        self._start = time.perf_counter()
+        summary = {"ok": 0, "failed": 0, "cancelled": 0, "pages": 0, "seconds": 0.0}
+        try:
+            jobs = self.jobs()
+            self._total_files = len(jobs)
+            self.events.put(("scanned", len(jobs)))
+
+            executor, submit = make_executor("thread", self.workers, None, on_page=self._on_page,
+                                             **self.watermark)
+            with executor:
+                pending = (job for job in jobs if not self._cancel.is_set())
+                for (input_file, output_dir), future in submit_bounded(self._track(submit), pending,
+                                                                       self.workers * 2):
+                    with self._lock:
+                        self._futures.discard(future)
+                    status, error = self._status(future, input_file)
+                    output_file = output_path_for(input_file, output_dir)
+                    if status == "cancelled" and os.path.exists(output_file):
+                        # 中止的文件可能只写了一部分
+                        os.remove(output_file)
+                    summary[status] += 1
+                    self._finish_file(input_file)
+                    self.events.put(("file", input_file, output_file, status, error))
+        except Exception as e:
+            summary["failed"] += 1
+            self.events.put(("file", None, None, "failed", str(e)))
+        finally:
+            summary["pages"] = self._pages_done
+            summary["seconds"] = time.perf_counter() - self._start
+            self.events.put(("finished", summary))
+
+    def _track(self, submit):
+        def tracked(input_file, output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+            future = submit(input_file, output_dir)
+            with self._lock:
+                self._futures.add(future)
+            return future
+        return tracked
+
+    def _status(self, future, input_file):
+        try:
+            success, _, error = future.result()[:3]
+        except concurrent.futures.CancelledError:
+            return "cancelled", None
+        except Exception as e:
+            return "failed", str(e)
+        if success:
+            return "ok", None
+        # 只有因JobCancelled中止的文件算作取消，取消期间真正出错的文件仍然是失败
+        with self._lock:
+            aborted = input_file in self._aborted
+            self._aborted.discard(input_file)
+        return ("cancelled" if aborted else "failed"), error
+
+    def _on_page(self, input_file):
+        # 在工作线程中调用
+        if self._cancel.is_set():
+            with self._lock:
+                self._aborted.add(input_file)
+            raise JobCancelled("已取消")
+        if input_file not in self._pages:
+            # 同一文件只在处理它的工作线程中回调，第一页时统计页数，不推迟其他文件开始处理
+            pages = count_pages(input_file)
+            with self._lock:
+                self._pages[input_file] = pages
+        with self._lock:
+            self._stamped[input_file] = self._stamped.get(input_file, 0) + 1
+            self._pages_done += 1
+        self._emit_progress()
+
+    def _finish_file(self, input_file):
+        # 按统计的页数结算（失败或取消的文件也算作已完成），全部结束时进度条正好到达总页数
+        with self._lock:
+            pages = self._pages.get(input_file)
+            if pages is None:
+                self._uncounted += 1
+                pages = 0
+            self._pages_done += pages - self._stamped.pop(input_file, 0)
+            self._files_done += 1
+        self._emit_progress(force=True)
+
+    def _total_pages(self):
+        # 在持有_lock时调用；还没开始处理的文件按已统计文件的平均页数估算
+        known = sum(self._pages.values())
+        remaining = max(0, self._total_files - len(self._pages) - self._uncounted)
+        if remaining and self._pages:
+            known += round(known / len(self._pages) * remaining)
+        return known
+
+    def _emit_progress(self, force=False):
+        now = time.perf_counter()
+        with self._lock:
+            if not force and now - self._last_progress < PROGRESS_INTERVAL:
+                return
+            self._last_progress = now
+            event = ("progress", self._pages_done, self._files_done, self._total_pages(), now - self._start)
+        self.events.put(event)
+
+def count_pages(input_file):
+    """返回PDF的页数，无法读取时返回1（仍按一页计入进度）"""
+    from PyPDF2 import PdfReader
+    try:
+        with open(input_file, 'rb') as f:
+            return len(PdfReader(f).pages) or 1
+    except Exception:
+        return 1
@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+常驻的本地水印服务
+
+进程启动一次后持续提供服务，字体、按页面几何缓存的水印模板和工作进程都保持预热，
+每个请求只需处理页面本身。支持本地HTTP端口或Unix套接字。
+
+接口:
+    POST /watermark?text=机密&size=40     请求体为PDF，返回添加水印后的PDF
+    POST /watermark                      JSON {"input": 路径, "output": 路径, "text": ...}（需要--allow-paths）
+    POST /create_watermark?text=机密      返回水印PDF
+    GET  /health                         返回运行状态（JSON）
+
+水印参数: text, font（字体目录中的文件名、字体族名或auto；字体路径需要--allow-paths）, font_index, size, opacity,
+         angle, color ("R,G,B"), layout ("center"/"tile"), tile_spacing,
+         image（服务器上的图片路径，需要--allow-paths，启动时指定的默认图片除外）, image_scale, mode
+"""
+
+import io
+import os
+import json
+import time
+import signal
+import argparse
+import threading
+import socketserver
+import concurrent.futures
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from pdf_watermark import add_watermark, create_watermark, WatermarkTemplate
+from pdf_watermark_options import LAYOUTS, STAMP_MODES
+from pdf_watermark_fontindex import resolve_font
+from pdf_watermark_fonts import register_font
+
+def _color(value):
+    """把 "R,G,B" 或 [R, G, B] 转换为颜色元组，每个分量为0-255的整数"""
+    items = value.split(',') if isinstance(value, str) else value
+    if not isinstance(items, (list, tuple)) or len(items) != 3:
+        raise ValueError("color需要三个分量 R,G,B")
+    color = tuple(int(item) for item in items)
+    if not all(0 <= item <= 255 for item in color):
+        raise ValueError("color的分量需要在0-255之间")
+    return color
+
+# 请求参数名 -> (WatermarkTemplate参数名, 类型转换)
+PARAMS = {
+    "text": ("text", str),
+    "font": ("font_path", str),
+    "font_index": ("font_index", int),
+    "size": ("font_size", int),
+    "opacity": ("opacity", float),
+    "angle": ("angle", float),
+    "color": ("color", _color),
+    "layout": ("layout", str),
+    "tile_spacing": ("tile_spacing", float),
+    "image": ("image_path", str),
+    "image_scale": ("image_scale", float),
+}
+
+def _init_server_worker(font_path, font_index):
+    """工作进程初始化: 预先注册默认字体"""
+    if threading.current_thread() is threading.main_thread():
+        # 工作进程不处理Ctrl+C，由服务主进程统一关闭
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    register_font(font_path, font_index)
+
+def _stamp_bytes(data, params, mode):
+    """为内存中的PDF添加水印，返回PDF字节"""
+    return add_watermark(io.BytesIO(data), None, WatermarkTemplate(**params), mode=mode).getvalue()
+
+def _stamp_paths(input_pdf, output_pdf, params, mode):
+    """为本地文件添加水印"""
+    add_watermark(input_pdf, output_pdf, WatermarkTemplate(**params), mode=mode)
+    return output_pdf
+
+def _create_watermark(params):
+    params = dict(params)
+    return create_watermark(params.pop("text", None), **params).getvalue()
+
+class WatermarkServerMixin:
+    """
+    服务器的公共状态: 工作池、并发限制和统计信息
+
+    同时处理的请求数达到max_pending后，新请求最多等待queue_timeout秒，
+    仍无空位时返回503和Retry-After，让上游自行重试，而不是无限堆积在内存中。
+    """
+
+    daemon_threads = True
+
+    def setup_service(self, executor, max_pending, queue_timeout, defaults, allow_paths, max_body_mb):
+        self.executor = executor
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.queue_timeout = queue_timeout
+        self.defaults = defaults
+        self.allow_paths = allow_paths
+        self.max_body = int(max_body_mb * 1024 * 1024)
+        self.started = time.time()
+        self.stats = {"requests": 0, "active": 0, "rejected": 0, "errors": 0}
+        self.stats_lock = threading.Lock()
+
+    def count(self, name, delta=1):
+        with self.stats_lock:
+            self.stats[name] += delta
+
+class WatermarkHTTPServer(WatermarkServerMixin, ThreadingHTTPServer):
+    pass
+
+class WatermarkUnixServer(WatermarkServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    pass
+
+class WatermarkRequestHandler(BaseHTTPRequestHandler):
+    server_version = "PDFWatermark/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # Unix套接字没有客户端地址
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # 无法确定请求体的边界，不能在同一连接上继续处理下一个请求
+            self.close_connection = True
+            raise _RequestError(400, "Content-Length格式错误")
+        if length > self.server.max_body:
+            raise _RequestError(413, f"请求体超过上限 ({length} 字节)")
+        body = self.rfile.read(length)
+        if len(body) < length:
+            # 客户端在上传完成前断开
+            raise _RequestError(400, "请求体不完整")
+        return body
+
+    def _params(self, query, fields):
+        """合并默认参数、查询参数和JSON字段，返回 (WatermarkTemplate参数, 叠加方式)"""
+        values = dict(self.server.defaults)
+        values.update({name: items[-1] for name, items in query.items()})
+        values.update(fields)
+        # 请求中指定的图片路径由服务进程读取，与按路径处理文件一样需要--allow-paths
+        image = values.get("image")
+        if image and image != self.server.defaults.get("image") and not self.server.allow_paths:
+            raise _RequestError(403, "服务未启用--allow-paths，不能指定图片路径")
+        # 字体同样由服务进程读取: 未启用--allow-paths时只能使用字体目录中的字体（按文件名、族名或auto）
+        font = values.get("font")
+        custom_font = bool(font) and font != self.server.defaults.get("font")
+        if custom_font and not self.server.allow_paths and os.path.basename(font) != font:
+            raise _RequestError(403, "服务未启用--allow-paths，不能指定字体路径")
+        params = {}
+        try:
+            for name, (target, convert) in PARAMS.items():
+                if values.get(name) not in (None, ""):
+                    params[target] = convert(values[name])
+        except (TypeError, ValueError) as e:
+            raise _RequestError(400, f"参数格式错误: {e}")
+        if custom_font:
+            try:
+                params["font_path"], params["font_index"] = resolve_font(
+                    font, params.get("text"), params.get("font_index", 0), allow_paths=self.server.allow_paths)
+            except ValueError as e:
+                raise _RequestError(400, str(e))
+        if "text" not in params and "image_path" not in params:
+            raise _RequestError(400, "缺少参数: text或image")
+        if params.get("layout", "center") not in LAYOUTS:
+            raise _RequestError(400, f"未知的水印布局: {params['layout']}")
+        mode = values.get("mode") or "xobject"
+        if mode not in STAMP_MODES:
+            raise _RequestError(400, f"未知的叠加方式: {mode}")
+        return params, mode
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/health":
+            self._send(404, {"error": "未知的路径"})
+            return
+        with self.server.stats_lock:
+            stats = dict(self.server.stats)
+        stats["uptime"] = round(time.time() - self.server.started, 1)
+        self._send(200, stats)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path not in ("/watermark", "/create_watermark"):
+            self._send(404, {"error": "未知的路径"})
+            return
+        self.server.count("requests")
+        try:
+            # 先占用处理名额再读取请求体，并发上传再多，内存中的请求体也不超过max_pending个
+            with self._slot():
+                body = self._read_body()
+                fields = {}
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    fields = json.loads(body or b"{}")
+                    if not isinstance(fields, dict):
+                        raise _RequestError(400, "JSON请求体需要是对象")
+                params, mode = self._params(parse_qs(url.query), fields)
+
+                if url.path == "/create_watermark":
+                    job = (_create_watermark, params)
+                elif "input" in fields:
+                    if not self.server.allow_paths:
+                        raise _RequestError(403, "服务未启用--allow-paths，不能按路径处理文件")
+                    if not fields.get("output"):
+                        raise _RequestError(400, "缺少参数: output")
+                    job = (_stamp_paths, fields["input"], fields["output"], params, mode)
+                else:
+                    if not body:
+                        raise _RequestError(400, "请求体为空")
+                    job = (_stamp_bytes, body, params, mode)
+                result = self.server.executor.submit(*job).result()
+
+            if isinstance(result, bytes):
+                self._send(200, result, "application/pdf")
+            else:
+                self._send(200, {"output": result})
+        except _RequestError as e:
+            headers = dict(e.headers or {})
+            if e.status in (413, 503) or self.close_connection:
+                # 请求体没有被读取，不能在同一连接上继续处理下一个请求
+                self.close_connection = True
+                headers["Connection"] = "close"
+            if e.status == 503:
+                self.server.count("rejected")
+            self._send(e.status, {"error": e.message}, headers=headers)
+        except json.JSONDecodeError as e:
+            self._send(400, {"error": f"JSON格式错误: {e}"})
+        except Exception as e:
+            self.server.count("errors")
+            self._send(500, {"error": str(e) or repr(e)})
+
+    @contextmanager
+    def _slot(self):
+        """占用一个处理名额；并发已满且等待超时时返回503"""
+        if not self.server.slots.acquire(timeout=self.server.queue_timeout):
+            raise _RequestError(503, "服务繁忙，请稍后重试", {"Retry-After": "1"})
+        self.server.count("active")
+        try:
+            yield
+        finally:
+            self.server.count("active", -1)
+            self.server.slots.release()
+
+class _RequestError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers
+
+def make_server(host="127.0.0.1", port=8765, socket_path=None, workers=None, executor="process",
+                max_pending=None, queue_timeout=10.0, defaults=None, allow_paths=False, max_body_mb=512):
+    """
+    创建水印服务器（调用serve_forever开始服务）
+
+    参数:
+    host, port: HTTP监听地址；socket_path不为None时改为监听该Unix套接字
+    workers: 工作进程/线程数，默认为CPU核数
+    executor: "process"（进程池，利用多核）或 "thread"
+    max_pending: 同时处理的请求数上限，默认为workers的两倍
+    queue_timeout: 并发已满时新请求等待空位的秒数，超时返回503
+    defaults: 请求未提供时使用的默认水印参数，如 {"font": "simhei.ttf", "size": 40}
+    allow_paths: 是否允许按本地路径处理文件（服务进程可读写的文件都能被访问）
+    max_body_mb: 请求体大小上限 (MB)
+    """
+    defaults = dict(defaults or {})
+    workers = workers or os.cpu_count() or 1
+    init_args = (defaults.get("font"), int(defaults.get("font_index") or 0))
+    if executor == "process":
+        pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_server_worker, initargs=init_args)
+    else:
+        pool = concurrent.futures.ThreadPoolExecutor(workers, initializer=_init_server_worker, initargs=init_args)
+    # 在开始接受请求之前启动工作进程并完成初始化，第一个请求不必等待
+    pool.submit(register_font, None).result()
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = WatermarkUnixServer(socket_path, WatermarkRequestHandler)
+    else:
+        server = WatermarkHTTPServer((host, port), WatermarkRequestHandler)
+    server.setup_service(pool, max_pending or workers * 2, queue_timeout, defaults, allow_paths, max_body_mb)
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='常驻的本地PDF水印服务')
+    parser.add_argument('--host', default='127.0.0.1', help='HTTP监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='HTTP监听端口')
+    parser.add_argument('--socket', help='改为监听此Unix套接字路径')
+    parser.add_argument('--workers', type=int, help='工作进程数（默认为CPU核数）')
+    parser.add_argument('--executor', choices=("process", "thread"), default='process',
+                        help='执行方式: process（进程池，默认）或thread（线程池）')
+    parser.add_argument('--max-pending', type=int, help='同时处理的请求数上限（默认为工作数的两倍）')
+    parser.add_argument('--queue-timeout', type=float, default=10.0,
+                        help='并发已满时新请求等待的秒数，超时返回503')
+    parser.add_argument('--max-body', type=float, default=512, help='请求体大小上限 (MB)')
+    parser.add_argument('--allow-paths', action='store_true',
+                        help='允许JSON请求按本地路径读写文件（只应在可信环境中启用）')
+    parser.add_argument('--text', help='默认水印文字')
+    parser.add_argument('--font', help='默认字体文件路径，启动时预先加载；也可以是字体族名，或auto自动选择包含默认水印文字的系统字体')
+    parser.add_argument('--font-index', type=int, default=0, help='.ttc字体集合中的子字体索引')
+    parser.add_argument('--size', type=int, default=40, help='默认水印字体大小')
+    parser.add_argument('--opacity', type=float, default=0.5, help='默认水印透明度 (0.0-1.0)')
+    parser.add_argument('--angle', type=float, default=45, help='默认水印旋转角度')
+    parser.add_argument('--color', default='0,0,0', help='默认水印颜色 (格式: "R,G,B")')
+    parser.add_argument('--mode', choices=STAMP_MODES, default='xobject', help='默认叠加方式')
+    parser.add_argument('--layout', choices=LAYOUTS, default='center', help='默认水印布局: center或tile（整页平铺）')
+    parser.add_argument('--tile-spacing', type=float, help='默认平铺间距（点）')
+    parser.add_argument('--image', help='默认图片水印')
+    parser.add_argument('--image-scale', type=float, default=0.5, help='默认图片宽度占页面宽度的比例')
+
+    args = parser.parse_args()
+    try:
+        args.font, args.font_index = resolve_font(args.font, args.text, args.font_index)
+    except ValueError as e:
+        parser.error(str(e))
+
+    defaults = {
+        "text": args.text,
+        "font": args.font,
+        "font_index": args.font_index,
+        "size": args.size,
+        "opacity": args.opacity,
+        "angle": args.angle,
+        "color": args.color,
+        "layout": args.layout,
+        "tile_spacing": args.tile_spacing,
+        "image": args.image,
+        "image_scale": args.image_scale,
+        "mode": args.mode,
+    }
+    server = make_server(args.host, args.port, args.socket, args.workers, args.executor, args.max_pending,
+                         args.queue_timeout, defaults, args.allow_paths, args.max_body)
+    address = args.socket or f"http://{args.host}:{args.port}"
+    print(f"水印服务已启动: {address}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.executor.shutdown()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+
+class HotFolder:
+    """
+    监视收件目录，逐个返回新出现且已写完的PDF文件
+
+    只重新列出修改时间发生变化的目录（新增或删除文件会更新目录的修改时间），
+    不做周期性的全量扫描；新文件的大小和修改时间在settle秒内不再变化才视为写完。
+    迭代时在暂无新文件的每轮轮询后返回一次None，调用方可以借此处理已完成的任务。
+    """
+
+    def __init__(self, root, recursive=True, exclude=(), settle=2.0, interval=1.0):
+        """
+        参数:
+        root: 收件目录
+        recursive: 是否同时监视子目录
+        exclude: 不监视的目录（绝对路径），例如位于收件目录中的输出目录
+        settle: 文件大小和修改时间保持不变多少秒后开始处理
+        interval: 轮询间隔（秒）
+        """
+        self.root = root
+        self.recursive = recursive
+        self.exclude = set(exclude)
+        self.settle = settle
+        self.interval = interval
+        # 目录 -> 上次列出时的修改时间(ns)，None表示尚未列出
+        self._dirs = {root: None}
+        # 等待写完的文件 -> (大小, 修改时间ns, 开始保持不变的时间)
+        self._pending = {}
+        # 已返回的文件 -> (大小, 修改时间ns)，文件被移走或删除后清除
+        self._seen = {}
+
+    def __iter__(self):
+        while True:
+            ready = self.poll()
+            for path in ready:
+                yield path
+            yield None
+            if not ready:
+                time.sleep(self.interval)
+
+    def poll(self):
+        """执行一轮检查，返回已写完的新文件列表"""
+        now = time.time()
+        for directory in list(self._dirs):
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                self._forget(directory)
+                continue
+            # 目录修改时间的精度可能只有1-2秒，刚修改过的目录在下一轮再列出一次
+            if mtime != self._dirs[directory] or now - mtime / 1e9 < 2:
+                self._list(directory)
+                self._dirs[directory] = mtime
+
+        ready = []
+        for path, (size, mtime, stable_since) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                self._pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+            elif now - stable_since >= self.settle:
+                del self._pending[path]
+                self._seen[path] = (size, mtime)
+                ready.append(path)
+        return ready
+
+    def _list(self, directory):
+        present = set()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if (self.recursive and entry.path not in self._dirs
+                                    and os.path.abspath(entry.path) not in self.exclude):
+                                self._dirs[entry.path] = None
+                        elif _is_candidate(entry.name) and entry.is_file():
+                            present.add(entry.path)
+                            stat = entry.stat()
+                            signature = (stat.st_size, stat.st_mtime_ns)
+                            if entry.path not in self._pending and self._seen.get(entry.path) != signature:
+                                self._pending[entry.path] = signature + (time.time(),)
+                    except OSError:
+                        continue
+        except OSError:
+            self._forget(directory)
+            return
+        # 已返回过但不再存在的文件（已被移走），之后同名的新文件会重新处理
+        for path in [p for p in self._seen if os.path.dirname(p) == directory and p not in present]:
+            del self._seen[path]
+
+    def _forget(self, directory):
+        if directory == self.root:
+            self._dirs[directory] = None
+            return
+        self._dirs.pop(directory, None)
+
+def _is_candidate(name):
+    """PDF文件，忽略隐藏文件和常见的临时文件"""
+    return name.lower().endswith(".pdf") and not name.startswith((".", "~$"))
@@ -0,0 +1,582 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import sys
+from collections import deque
+from PyPDF2 import PageObject
+from PyPDF2.generic import (ArrayObject, DecodedStreamObject, DictionaryObject,
+                            EncodedStreamObject, IndirectObject, NameObject, NumberObject,
+                            StreamObject)
+
+def current_rss_mb():
+    """返回当前进程的常驻内存 (MB)，无法获取时返回None"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD),
+                            ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t),
+                            ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t),
+                            ("PeakPagefileUsage", ctypes.c_size_t)]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize / (1024 * 1024)
+        except Exception:
+            pass
+    return None
+
+class PositionTrackingStream:
+    """
+    为不可定位的输出流（如标准输出管道）记录已写出的字节数
+
+    只追加写出的writer只需要write和tell，包装后即可直接写入管道而不经过临时文件。
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.position = 0
+
+    def write(self, data):
+        self.stream.write(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        self.stream.flush()
+
+class StreamingPdfWriter:
+    """
+    边处理边写出的PDF写入器
+
+    对象一旦完成就写入输出流，内存中只保留对象编号映射和偏移量，
+    峰值内存与页数基本无关。提供PageStamper所需的 add_page / _add_object 接口。
+    """
+
+    def __init__(self, stream):
+        """
+        参数:
+        stream: 以二进制方式打开的可写输出流
+        """
+        self.stream = stream
+        # 输出对象编号 -> (偏移量, 代数)
+        self._offsets = {}
+        self._next_num = 1
+        # 来源对象 (id(pdf), 对象编号, 代数) -> 输出对象编号
+        self._translated = {}
+        # 等待写出的对象: (输出对象编号, 对象或来源引用)
+        self._pending = deque()
+        self._readers = []
+        self._start()
+
+    def _start(self):
+        self.stream.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        self._pages_ref = IndirectObject(self._allocate(), 0, self)
+        self._root_ref = IndirectObject(self._allocate(), 0, self)
+        self._kids = ArrayObject()
+
+    def _allocate(self):
+        num = self._next_num
+        self._next_num += 1
+        return num
+
+    def _add_object(self, obj):
+        """登记一个新对象，在下一次flush时写出，返回其间接引用"""
+        num = self._allocate()
+        self._pending.append((num, obj))
+        return IndirectObject(num, 0, self)
+
+    def _source_key(self, ref):
+        return (id(ref.pdf), ref.idnum, ref.generation)
+
+    def reserve_pages(self, reader):
+        """
+        为读取器的所有页面预留对象编号
+
+        这样链接、书签等对页面的引用（包括指向后面页面的引用）会指向输出中的页面，
+        而不是把原文档的整棵页面树再复制一份。
+        """
+        self._readers.append(reader)
+        for page in reader.pages:
+            ref = page.indirect_reference
+            if ref is not None and self._source_key(ref) not in self._translated:
+                self._translated[self._source_key(ref)] = self._allocate()
+
+    def add_page(self, page):
+        """
+        添加页面，返回可继续修改的页面对象（在flush时才写出）
+
+        参数:
+        page: 读取器中的页面对象
+        """
+        out = PageObject(self)
+        for key, value in page.items():
+            if key not in ("/Parent", "/StructParents"):
+                out[NameObject(key)] = value
+        out[NameObject("/Parent")] = self._pages_ref
+
+        ref = page.indirect_reference
+        if ref is not None and self._source_key(ref) in self._translated:
+            num = self._translated[self._source_key(ref)]
+            self._pending.append((num, out))
+        else:
+            num = self._add_object(out).idnum
+        out.indirect_reference = IndirectObject(num, 0, self)
+        self._kids.append(out.indirect_reference)
+        return out
+
+    def _translate_ref(self, ref):
+        if ref.pdf is self:
+            return ref
+        key = self._source_key(ref)
+        num = self._translated.get(key)
+        if num is None:
+            num = self._allocate()
+            self._translated[key] = num
+            self._pending.append((num, ref))
+        return IndirectObject(num, 0, self)
+
+    def _translate(self, obj, top=False):
+        """复制对象，把来源文档的引用替换为输出中的对象编号（流数据不解码）"""
+        if isinstance(obj, IndirectObject):
+            return self._translate_ref(obj)
+        if isinstance(obj, StreamObject):
+            if not top:
+                # 流对象必须是间接对象
+                return self._add_object(obj)
+            # ContentStream等子类也统一复制为普通流对象，数据按原样（已编码时不解码）写出
+            out = EncodedStreamObject() if isinstance(obj, EncodedStreamObject) else DecodedStreamObject()
+            out._data = obj._data
+            for key, value in obj.items():
+                out[NameObject(key)] = self._translate(value)
+            return out
+        if isinstance(obj, DictionaryObject):
+            out = DictionaryObject()
+            for key, value in obj.items():
+                out[NameObject(key)] = self._translate(value)
+            return out
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._translate(value) for value in obj)
+        return obj
+
+    def _write_object(self, num, obj, generation=0):
+        self._offsets[num] = (self.stream.tell(), generation)
+        self.stream.write(f"{num} {generation} obj\n".encode())
+        obj.write_to_stream(self.stream, None)
+        self.stream.write(b"\nendobj\n")
+
+    def flush(self):
+        """写出所有待写对象及其引用的对象，并释放读取器缓存的已解析对象"""
+        while self._pending:
+            num, obj = self._pending.popleft()
+            generation = 0
+            if isinstance(obj, IndirectObject):
+                obj = obj.get_object()
+            elif getattr(obj, "indirect_reference", None) is not None and obj.indirect_reference.pdf is self:
+                generation = obj.indirect_reference.generation
+            self._write_object(num, self._translate(obj, top=True), generation)
+        for reader in self._readers:
+            reader.resolved_objects.clear()
+
+    def _write_xref_table(self, trailer, full=True):
+        """
+        写出传统交叉引用表和trailer
+
+        参数:
+        trailer: trailer字典（/Size由本方法设置）
+        full: True时写一个从0开始的完整分段，False时只写已写出的对象（增量更新）
+        """
+        write_xref_table(self.stream, self._offsets, self._next_num, trailer, full)
+
+    def _write_xref_stream(self, trailer):
+        """写出交叉引用流（PDF 1.5），trailer中的项合并到流字典中"""
+        num = self._allocate()
+        xref_offset = self.stream.tell()
+        self._offsets[num] = (xref_offset, 0)
+        nums = sorted(self._offsets)
+        # 偏移量字段宽度：超过4GB的文件需要8字节
+        width = 4 if xref_offset < 2 ** 32 else 8
+        rows = b"".join(
+            b"\x01" + self._offsets[n][0].to_bytes(width, "big") + self._offsets[n][1].to_bytes(2, "big")
+            for n in nums
+        )
+        index = ArrayObject()
+        for start, run in _consecutive_runs(nums):
+            index.extend([NumberObject(start), NumberObject(len(run))])
+
+        stream = DecodedStreamObject()
+        stream.set_data(rows)
+        xref = stream.flate_encode()
+        xref.update(trailer)
+        xref.update({
+            NameObject("/Type"): NameObject("/XRef"),
+            NameObject("/Size"): NumberObject(self._next_num),
+            NameObject("/W"): ArrayObject([NumberObject(1), NumberObject(width), NumberObject(2)]),
+            NameObject("/Index"): index,
+        })
+        self.stream.write(f"{num} 0 obj\n".encode())
+        xref.write_to_stream(self.stream, None)
+        self.stream.write(f"\nendobj\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+    def close(self):
+        """写出页面树、文档目录和交叉引用表"""
+        self._write_document_objects()
+        self._write_xref_table(DictionaryObject({NameObject("/Root"): self._root_ref}))
+
+    def _write_document_objects(self):
+        """写出剩余对象、页面树和文档目录"""
+        self.flush()
+        self._write_object(self._pages_ref.idnum, DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): self._kids,
+            NameObject("/Count"): NumberObject(len(self._kids)),
+        }))
+        self._write_object(self._root_ref.idnum, DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): self._pages_ref,
+        }))
+
+def write_xref_table(stream, offsets, size, trailer, full=True):
+    """
+    写出传统交叉引用表、trailer和startxref
+
+    参数:
+    stream: 输出流
+    offsets: {对象编号: (偏移量, 代数)}
+    size: 对象编号上限（trailer中的/Size）
+    trailer: trailer字典（/Size由本函数设置）
+    full: True时写一个从0开始的完整分段，False时只写offsets中的对象（增量更新）
+    """
+    xref_offset = stream.tell()
+    trailer[NameObject("/Size")] = NumberObject(size)
+    stream.write(b"xref\n")
+    if full:
+        stream.write(f"0 {size}\n0000000000 65535 f \n".encode())
+        for num in range(1, size):
+            if num in offsets:
+                offset, generation = offsets[num]
+                stream.write(f"{offset:010d} {generation:05d} n \n".encode())
+            else:
+                # 预留但未写出的编号（例如未处理的页面）
+                stream.write(b"0000000000 65535 f \n")
+    else:
+        # 以0号空闲对象开头，部分阅读器要求每个交叉引用段从0开始
+        stream.write(b"0 1\n0000000000 65535 f \n")
+        for start, nums in _consecutive_runs(sorted(offsets)):
+            stream.write(f"{start} {len(nums)}\n".encode())
+            for num in nums:
+                offset, generation = offsets[num]
+                stream.write(f"{offset:010d} {generation:05d} n \n".encode())
+    stream.write(b"trailer\n")
+    trailer.write_to_stream(stream, None)
+    stream.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+def _consecutive_runs(nums):
+    """把有序的对象编号分成连续的段，返回 (起始编号, 编号列表) 的列表"""
+    runs = []
+    for num in nums:
+        if runs and num == runs[-1][0] + len(runs[-1][1]):
+            runs[-1][1].append(num)
+        else:
+            runs.append((num, [num]))
+    return runs
+
+def find_startxref(stream):
+    """
+    读取PDF文件末尾的startxref偏移量，返回 (偏移量, 是否为交叉引用流)
+
+    参数:
+    stream: 以二进制方式打开的可读输入流
+    """
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(max(0, size - 2048))
+    tail = stream.read()
+    pos = tail.rfind(b"startxref")
+    if pos < 0:
+        raise ValueError("找不到startxref，PDF文件可能已损坏")
+    offset = int(tail[pos + len(b"startxref"):].split()[0])
+    stream.seek(offset)
+    is_stream = not stream.read(4).startswith(b"xref")
+    return offset, is_stream
+
+class IncrementalPdfWriter(StreamingPdfWriter):
+    """
+    以增量更新方式写出修改的PDF写入器
+
+    原文件的字节保持不变，只在末尾追加新对象（水印XObject等）、
+    修改过的页面字典和新的交叉引用段。原文档中的对象按原编号引用，不会被重新写出。
+    """
+
+    def __init__(self, reader, stream):
+        """
+        参数:
+        reader: 原文档的PdfReader
+        stream: 已写入原文件全部字节、并定位到末尾的可写输出流
+        """
+        if reader.is_encrypted:
+            raise ValueError("增量更新不支持加密的PDF")
+        self.reader = reader
+        super().__init__(stream)
+
+    def _start(self):
+        self._prev_xref, self._xref_is_stream = find_startxref(self.reader.stream)
+        # 交叉引用流的trailer中PyPDF2不保留/Size，此时根据已知对象编号推算
+        known = [num for nums in self.reader.xref.values() for num in nums]
+        known.extend(self.reader.xref_objStm)
+        self._next_num = max([int(self.reader.trailer.get("/Size", 0))] + [num + 1 for num in known])
+        self.stream.seek(0, os.SEEK_END)
+        # 追加内容之前保证原文件以换行结束
+        self.stream.seek(-1, os.SEEK_CUR)
+        if self.stream.read(1) not in (b"\n", b"\r"):
+            self.stream.write(b"\n")
+        self._readers.append(self.reader)
+
+    def add_page(self, page):
+        """
+        登记要修改的页面，返回可继续修改的页面对象，写出时沿用原对象编号
+
+        参数:
+        page: 原文档读取器中的页面对象
+        """
+        ref = page.indirect_reference
+        out = PageObject(self)
+        out.update(page)
+        out.indirect_reference = IndirectObject(ref.idnum, ref.generation, self)
+        self._pending.append((ref.idnum, out))
+        return out
+
+    def _translate_ref(self, ref):
+        # 原文档中的对象保持原有编号
+        if ref.pdf is self.reader:
+            return ref
+        return super()._translate_ref(ref)
+
+    def close(self):
+        """写出新的交叉引用段，/Prev指向原文件的交叉引用"""
+        self.flush()
+        trailer = DictionaryObject()
+        for key in ("/Root", "/Info", "/ID"):
+            if key in self.reader.trailer:
+                trailer[NameObject(key)] = self.reader.trailer.raw_get(key)
+        trailer[NameObject("/Prev")] = NumberObject(self._prev_xref)
+        if self._xref_is_stream:
+            self._write_xref_stream(trailer)
+        else:
+            self._write_xref_table(trailer, full=False)
+
+# 可从页面树继承的页面属性
+INHERITABLE_PAGE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+def load_page(reader, num, generation=0):
+    """
+    按对象编号读取单个页面，并补上从页面树继承的属性
+
+    与reader.pages不同，不需要展开整棵页面树。
+
+    参数:
+    reader: PdfReader对象
+    num: 页面的对象编号
+    generation: 页面对象的代数
+    """
+    ref = IndirectObject(num, generation, reader)
+    page = PageObject(reader, ref)
+    page.update(ref.get_object())
+    node = page.get("/Parent")
+    while node is not None:
+        node = node.get_object()
+        for key in INHERITABLE_PAGE_KEYS:
+            if key not in page and key in node:
+                page[NameObject(key)] = node.raw_get(key)
+        node = node.get("/Parent")
+    return page
+
+class RangePdfWriter(StreamingPdfWriter):
+    """
+    并行处理页面区间时使用的片段写入器
+
+    片段只包含对象，不含文件头和交叉引用。原文档中的对象沿用原编号，
+    不同区间共享的资源（字体、图片等）因此编号相同，拼接时按编号去重；
+    新对象的编号从进程间共享的计数器分配，保证全局唯一。
+    """
+
+    def __init__(self, stream, reader, counter, pages_num, page_refs):
+        """
+        参数:
+        stream: 片段输出流
+        reader: 原文档的PdfReader
+        counter: multiprocessing.Value，新对象编号的共享计数器
+        pages_num: 最终输出中页面树根的对象编号
+        page_refs: 原文档所有页面的 (对象编号, 代数) 列表
+        """
+        self.reader = reader
+        self._counter = counter
+        self._pages_num = pages_num
+        self._page_refs = page_refs
+        super().__init__(stream)
+
+    def _start(self):
+        self._pages_ref = IndirectObject(self._pages_num, 0, self)
+        self._kids = ArrayObject()
+        self._readers.append(self.reader)
+        # 所有页面沿用原编号，且只由负责该页的区间写出
+        for num, generation in self._page_refs:
+            self._translated[(id(self.reader), num, generation)] = num
+
+    def _allocate(self):
+        with self._counter.get_lock():
+            num = self._counter.value
+            self._counter.value += 1
+        return num
+
+    def _translate_ref(self, ref):
+        if ref.pdf is self.reader:
+            key = self._source_key(ref)
+            if key not in self._translated:
+                self._translated[key] = ref.idnum
+                self._pending.append((ref.idnum, ref))
+            return IndirectObject(ref.idnum, 0, self)
+        return super()._translate_ref(ref)
+
+    def close(self):
+        """写出剩余对象，返回 (对象偏移表, 页面对象编号列表)"""
+        self.flush()
+        return self._offsets, [kid.idnum for kid in self._kids]
+
+class StitchedPdfWriter(StreamingPdfWriter):
+    """把RangePdfWriter生成的片段按页序拼接成完整的PDF，编号相同的对象只保留一份"""
+
+    def __init__(self, stream, pages_num, root_num):
+        """
+        参数:
+        stream: 最终输出流
+        pages_num: 页面树根的对象编号
+        root_num: 文档目录的对象编号
+        """
+        self._pages_num = pages_num
+        self._root_num = root_num
+        super().__init__(stream)
+
+    def _start(self):
+        self.stream.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        self._pages_ref = IndirectObject(self._pages_num, 0, self)
+        self._root_ref = IndirectObject(self._root_num, 0, self)
+        self._kids = ArrayObject()
+        self._next_num = max(self._pages_num, self._root_num) + 1
+
+    def append_fragment(self, path, offsets, kids):
+        """
+        追加一个片段
+
+        参数:
+        path: 片段文件路径
+        offsets: 片段内的对象偏移表 {对象编号: (偏移量, 代数)}
+        kids: 片段中页面的对象编号（按页序）
+        """
+        order = sorted(offsets, key=lambda num: offsets[num][0])
+        with open(path, 'rb') as fragment:
+            fragment.seek(0, os.SEEK_END)
+            end = fragment.tell()
+            for i, num in enumerate(order):
+                start = offsets[num][0]
+                stop = offsets[order[i + 1]][0] if i + 1 < len(order) else end
+                self._next_num = max(self._next_num, num + 1)
+                if num in self._offsets:
+                    continue
+                fragment.seek(start)
+                self._offsets[num] = (self.stream.tell(), 0)
+                self.stream.write(fragment.read(stop - start))
+        self._kids.extend(IndirectObject(num, 0, self) for num in kids)
+
+class FragmentWriter(StreamingPdfWriter):
+    """把一组对象序列化为不含文件头和交叉引用的片段，对象编号从first_num开始"""
+
+    def __init__(self, stream, first_num):
+        self._first_num = first_num
+        super().__init__(stream)
+
+    def _start(self):
+        self._next_num = self._first_num
+
+class PersonalizedPdfWriter(StreamingPdfWriter):
+    """
+    为同一文档生成多份只有水印不同的输出
+
+    原文档对象、修改后的页面字典等共同部分只序列化一次，写入文件体；
+    每份输出只需复制文件体，再追加各自的水印对象和交叉引用表。
+    """
+
+    def reserve(self):
+        """预留一个对象编号，该对象由每份输出各自写出"""
+        return IndirectObject(self._allocate(), 0, self)
+
+    def finish_body(self):
+        """写出文件体中的全部共同对象，之后不能再添加页面"""
+        self._write_document_objects()
+        self._body_size = self.stream.tell()
+
+    def fragment(self, objects):
+        """
+        把一组对象序列化为片段，编号接在文件体之后
+
+        参数:
+        objects: 对象列表，可以引用其他文档中的对象
+
+        返回: (各对象的引用列表, 片段字节, 片段内的对象偏移表, 下一个可用编号)
+        """
+        buffer = io.BytesIO()
+        writer = FragmentWriter(buffer, self._next_num)
+        refs = [writer._add_object(obj) for obj in objects]
+        writer.flush()
+        return refs, buffer.getvalue(), writer._offsets, writer._next_num
+
+    def emit(self, stream, fragment, objects):
+        """
+        写出一份完整的输出
+
+        参数:
+        stream: 输出流
+        fragment: fragment()的返回值，所有输出共用的片段（如字体）
+        objects: {预留的对象编号: 对象}，本份输出特有的对象
+        """
+        _, data, fragment_offsets, size = fragment
+        self.stream.seek(0)
+        remaining = self._body_size
+        while remaining:
+            chunk = self.stream.read(min(remaining, 1024 * 1024))
+            stream.write(chunk)
+            remaining -= len(chunk)
+
+        offsets = dict(self._offsets)
+        base = stream.tell()
+        for num, (offset, generation) in fragment_offsets.items():
+            offsets[num] = (base + offset, generation)
+        stream.write(data)
+        for num, obj in objects.items():
+            offsets[num] = (stream.tell(), 0)
+            stream.write(f"{num} 0 obj\n".encode())
+            obj.write_to_stream(stream, None)
+            stream.write(b"\nendobj\n")
+        write_xref_table(stream, offsets, max(size, self._next_num),
+                         DictionaryObject({NameObject("/Root"): self._root_ref}))